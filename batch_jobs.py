@@ -0,0 +1,477 @@
+# llm_framework/batch_jobs.py
+import hashlib
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from enum import Enum
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+from model_pool import ModelPool, PoolItem
+
+logger = logging.getLogger(__name__)
+
+
+class BatchRequest:
+    """
+    批处理任务中的一条请求。
+    :param custom_id: 调用方指定的唯一标识，结果按它合并回原始记录 (例如数据集的行号)。
+    :param params: 生成参数，支持 temperature、max_tokens 与 system_prompt。
+    """
+    __slots__ = ("custom_id", "messages", "params")
+
+    def __init__(self, custom_id: str, messages: List[Dict[str, str]], params: Optional[Dict[str, Any]] = None):
+        self.custom_id = str(custom_id)
+        self.messages = messages
+        self.params = params or {}
+
+
+class BatchResult:
+    """一条请求在批处理中的结果：成功时 content 非空，失败时 error 为错误描述。"""
+    __slots__ = ("custom_id", "content", "error", "model")
+
+    def __init__(self, custom_id: str, content: Optional[str] = None, error: Optional[str] = None,
+                 model: Optional[str] = None):
+        self.custom_id = custom_id
+        self.content = content
+        self.error = error
+        self.model = model
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.content is not None
+
+    def __repr__(self):
+        status = "ok" if self.ok else f"error={self.error!r}"
+        return f"BatchResult({self.custom_id!r}, {status})"
+
+
+class JobState(Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    EXPIRED = "expired"
+
+    @property
+    def terminal(self) -> bool:
+        return self not in (JobState.PENDING, JobState.RUNNING)
+
+
+class BatchBackend(ABC):
+    """
+    某个厂商批处理接口的适配器。一个实例绑定一个 (模型, 密钥)。
+    :param base_url: 可选的接口地址，用于指向本地的替身批处理服务器。
+    """
+    name = ""
+    # 对应的逐条调用提供者类名，create_batch_backend 据此把工厂解析出的提供者映射到批处理适配器
+    provider = ""
+
+    def __init__(self, model_name: str, api_key: str, base_url: Optional[str] = None):
+        self.model_name = model_name
+        self.api_key = api_key
+        self.base_url = base_url
+
+    @abstractmethod
+    def submit(self, requests: List[BatchRequest]) -> str:
+        """提交一个批处理任务，返回任务 ID。"""
+        pass
+
+    @abstractmethod
+    def state(self, job_id: str) -> JobState:
+        pass
+
+    @abstractmethod
+    def results(self, job_id: str, custom_ids: List[str]) -> Dict[str, BatchResult]:
+        """
+        取回已结束任务的结果。
+        :param custom_ids: 提交时的请求顺序，厂商不回传标识时按顺序对应。
+        """
+        pass
+
+    def cancel(self, job_id: str):
+        pass
+
+    def close(self):
+        close = getattr(getattr(self, "client", None), "close", None)
+        if callable(close):
+            close()
+
+
+class GeminiBatchBackend(BatchBackend):
+    """Gemini Batch API：请求以内联方式随任务一起提交，结果随任务状态一起返回。"""
+    name = "gemini"
+    provider = "GeminiProvider"
+    _STATES = {
+        "JOB_STATE_QUEUED": JobState.PENDING,
+        "JOB_STATE_PENDING": JobState.PENDING,
+        "JOB_STATE_PAUSED": JobState.PENDING,
+        "JOB_STATE_RUNNING": JobState.RUNNING,
+        "JOB_STATE_UPDATING": JobState.RUNNING,
+        "JOB_STATE_CANCELLING": JobState.RUNNING,
+        "JOB_STATE_SUCCEEDED": JobState.SUCCEEDED,
+        "JOB_STATE_PARTIALLY_SUCCEEDED": JobState.SUCCEEDED,
+        "JOB_STATE_FAILED": JobState.FAILED,
+        "JOB_STATE_CANCELLED": JobState.CANCELLED,
+        "JOB_STATE_EXPIRED": JobState.EXPIRED,
+    }
+
+    def __init__(self, model_name: str, api_key: str, base_url: Optional[str] = None):
+        super().__init__(model_name, api_key, base_url)
+        # 厂商 SDK 在首次创建后端时才导入，只使用其中一家时不必加载另一家
+        from google import genai
+        from google.genai import types
+        http_options = types.HttpOptions(base_url=base_url) if base_url else None
+        self.client = genai.Client(api_key=api_key, http_options=http_options)
+        # 任务 ID -> 最近一次查询到的任务对象，结果随任务对象一起返回
+        self._jobs: Dict[str, Any] = {}
+
+    def submit(self, requests: List[BatchRequest]) -> str:
+        from providers.gemini_provider import GeminiProvider
+        src = []
+        for request in requests:
+            config: Dict[str, Any] = {}
+            if "temperature" in request.params:
+                config["temperature"] = request.params["temperature"]
+            if "max_tokens" in request.params:
+                config["max_output_tokens"] = request.params["max_tokens"]
+            if request.params.get("system_prompt"):
+                config["system_instruction"] = request.params["system_prompt"]
+            src.append({
+                "contents": GeminiProvider._prepare_contents(request.messages),
+                "config": config,
+                "metadata": {"key": request.custom_id},
+            })
+        job = self.client.batches.create(
+            model=self.model_name, src=src, config={"display_name": f"manyllm-{int(time.time())}"}
+        )
+        return job.name
+
+    def state(self, job_id: str) -> JobState:
+        job = self.client.batches.get(name=job_id)
+        self._jobs[job_id] = job
+        return self._STATES.get(getattr(job.state, "value", str(job.state)), JobState.PENDING)
+
+    def results(self, job_id: str, custom_ids: List[str]) -> Dict[str, BatchResult]:
+        job = self._jobs.pop(job_id, None) or self.client.batches.get(name=job_id)
+        responses = (job.dest.inlined_responses if job.dest else None) or []
+        results: Dict[str, BatchResult] = {}
+        for index, response in enumerate(responses):
+            custom_id = (response.metadata or {}).get("key")
+            if custom_id is None and index < len(custom_ids):
+                custom_id = custom_ids[index]
+            if custom_id is None:
+                continue
+            if response.error is not None or response.response is None:
+                error = response.error.message if response.error is not None else "空响应"
+                results[custom_id] = BatchResult(custom_id, error=error, model=self.model_name)
+                continue
+            try:
+                text = response.response.text
+            except Exception as e:
+                text, error = None, str(e)
+            else:
+                error = None if text else "响应中没有文本"
+            results[custom_id] = BatchResult(custom_id, content=text, error=error, model=self.model_name)
+        return results
+
+    def cancel(self, job_id: str):
+        self.client.batches.cancel(name=job_id)
+
+
+class ZhipuAIBatchBackend(BatchBackend):
+    """ZhipuAI Batch API：请求写成 JSONL 文件上传，任务结束后下载输出文件与错误文件。"""
+    name = "zhipuai"
+    provider = "ZhipuAIProvider"
+    ENDPOINT = "/v4/chat/completions"
+    _STATES = {
+        "validating": JobState.PENDING,
+        "in_progress": JobState.RUNNING,
+        "finalizing": JobState.RUNNING,
+        "cancelling": JobState.RUNNING,
+        "completed": JobState.SUCCEEDED,
+        "failed": JobState.FAILED,
+        "cancelled": JobState.CANCELLED,
+        "expired": JobState.EXPIRED,
+    }
+
+    def __init__(self, model_name: str, api_key: str, base_url: Optional[str] = None):
+        super().__init__(model_name, api_key, base_url)
+        from zai import ZhipuAiClient
+        self.client = ZhipuAiClient(api_key=api_key, base_url=base_url)
+        self._batches: Dict[str, Any] = {}
+
+    def submit(self, requests: List[BatchRequest]) -> str:
+        lines = []
+        for request in requests:
+            messages = request.messages
+            if request.params.get("system_prompt"):
+                messages = [{"role": "system", "content": request.params["system_prompt"]}] + messages
+            body = {"model": self.model_name, "messages": messages, "thinking": {"type": "disabled"}}
+            if "temperature" in request.params:
+                body["temperature"] = request.params["temperature"]
+            if "max_tokens" in request.params:
+                body["max_tokens"] = request.params["max_tokens"]
+            lines.append(json.dumps(
+                {"custom_id": request.custom_id, "method": "POST", "url": self.ENDPOINT, "body": body},
+                ensure_ascii=False,
+            ))
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        uploaded = self.client.files.create(file=("batch.jsonl", data, "application/jsonl"), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id, endpoint=self.ENDPOINT, completion_window="24h",
+            auto_delete_input_file=True,
+        )
+        return batch.id
+
+    def state(self, job_id: str) -> JobState:
+        batch = self.client.batches.retrieve(job_id)
+        self._batches[job_id] = batch
+        return self._STATES.get(batch.status, JobState.PENDING)
+
+    def _read_file(self, file_id: Optional[str]) -> List[Dict[str, Any]]:
+        if not file_id:
+            return []
+        content = self.client.files.content(file_id).content.decode("utf-8")
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    def results(self, job_id: str, custom_ids: List[str]) -> Dict[str, BatchResult]:
+        batch = self._batches.pop(job_id, None) or self.client.batches.retrieve(job_id)
+        results: Dict[str, BatchResult] = {}
+        for row in self._read_file(batch.output_file_id) + self._read_file(batch.error_file_id):
+            custom_id = row.get("custom_id")
+            if custom_id is None:
+                continue
+            response = row.get("response") or {}
+            body = response.get("body") or {}
+            error = row.get("error") or body.get("error")
+            if not error and response.get("status_code", 200) != 200:
+                error = f"HTTP {response.get('status_code')}"
+            if error:
+                message = error.get("message", str(error)) if isinstance(error, dict) else str(error)
+                results[custom_id] = BatchResult(custom_id, error=message, model=self.model_name)
+                continue
+            try:
+                text = body["choices"][0]["message"]["content"]
+            except (KeyError, IndexError, TypeError):
+                results[custom_id] = BatchResult(custom_id, error="无法解析的响应", model=self.model_name)
+                continue
+            results[custom_id] = BatchResult(custom_id, content=text, model=self.model_name)
+        return results
+
+    def cancel(self, job_id: str):
+        self.client.batches.cancel(job_id)
+
+
+# 提供者类名 -> 批处理适配器
+BATCH_BACKENDS: Dict[str, Type[BatchBackend]] = {
+    backend.provider: backend for backend in (GeminiBatchBackend, ZhipuAIBatchBackend)
+}
+
+
+def create_batch_backend(model_name: str, api_key: str,
+                         base_urls: Optional[Dict[str, str]] = None) -> Optional[BatchBackend]:
+    """
+    按模型名选择批处理适配器：先用 LLMFactory.resolve_provider_class 查找该模型的提供者
+    (显式注册、插件与内置规则均生效)，再按提供者类 (含其父类) 找到对应的适配器；
+    工厂无法解析或提供者没有批处理接口的模型返回 None。
+    :param base_urls: 适配器名 ("gemini" / "zhipuai") -> 接口地址，用于指向替身服务器。
+    """
+    from llm_factory import LLMFactory
+
+    try:
+        provider_cls = LLMFactory.resolve_provider_class(model_name)
+    except ValueError:
+        return None
+    backend_cls = next(
+        (BATCH_BACKENDS[klass.__name__] for klass in provider_cls.__mro__ if klass.__name__ in BATCH_BACKENDS),
+        None,
+    )
+    if backend_cls is None:
+        return None
+    # Gemini Batch API 只支持 Gemini 系列模型，Gemma 等开放模型仍走逐条调用
+    if backend_cls is GeminiBatchBackend and "gemma" in model_name.lower():
+        return None
+    base_urls = base_urls or {}
+    return backend_cls(model_name, api_key, base_urls.get(backend_cls.name))
+
+
+def _key_fingerprint(api_key: str) -> str:
+    # 状态文件中不保存明文密钥，只保存其摘要用于续跑时匹配
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+class _Job:
+    __slots__ = ("item", "backend", "job_id", "custom_ids", "submitted_at")
+
+    def __init__(self, item: PoolItem, backend: BatchBackend, job_id: str, custom_ids: List[str],
+                 submitted_at: float):
+        self.item = item
+        self.backend = backend
+        self.job_id = job_id
+        self.custom_ids = custom_ids
+        self.submitted_at = submitted_at
+
+
+class BatchJobRunner:
+    """
+    把大量请求打包为厂商批处理任务：分片提交、轮询，并在任务结束时产出每条请求的结果。
+
+    - 分片按轮询方式分散到池中所选模型的所有密钥上；
+    - 提交失败、任务失败/过期/超时、或单条请求失败时，产出带 error 的 BatchResult，
+      由调用方回退到普通的编排器调用；
+    - 设置 state_path 后，已提交但尚未取回的任务会记录在状态文件中，进程中断后重新运行会继续轮询
+      这些任务，而不是重复提交。
+    """
+    def __init__(self, pool, model_name: Optional[str] = None, max_batch_size: int = 500,
+                 poll_interval: float = 30.0, max_wait: float = 24 * 3600.0,
+                 state_path: Optional[str] = None, base_urls: Optional[Dict[str, str]] = None):
+        """
+        :param pool: 模型密钥池 (列表或 ModelPool)。
+        :param model_name: 用于批处理的模型；为 None 时选择池中优先级最高的、支持批处理的模型。
+        :param max_batch_size: 每个批处理任务最多包含的请求数。
+        :param poll_interval: 轮询任务状态的间隔秒数。
+        :param max_wait: 任务提交后最长等待的秒数，超时则取消任务并让其请求回退。
+        :param state_path: 可选的状态文件路径，用于中断后续跑。
+        :param base_urls: 适配器名 -> 接口地址，用于指向本地的替身批处理服务器。
+        """
+        self.pool = ModelPool.of(pool)
+        self.max_batch_size = max_batch_size
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+        self.state_path = state_path
+        self.base_urls = base_urls or {}
+        self._backends: Dict[Tuple[str, str], BatchBackend] = {}
+        self.model_name = model_name or self._default_model()
+
+    def _default_model(self) -> Optional[str]:
+        for item in sorted(self.pool, key=lambda item: (item[2] or {}).get("priority", 99)):
+            if self._backend(item) is not None:
+                return item[0]
+        return None
+
+    def _backend(self, item: PoolItem) -> Optional[BatchBackend]:
+        identifier = (item[0], item[1])
+        if identifier not in self._backends:
+            self._backends[identifier] = create_batch_backend(item[0], item[1], self.base_urls)
+        return self._backends[identifier]
+
+    def targets(self) -> List[PoolItem]:
+        """用于提交批处理任务的 (模型, 密钥) 项。"""
+        if self.model_name is None:
+            return []
+        return [item for item in self.pool.items_of(self.pool.mask(model=self.model_name))
+                if self._backend(item) is not None]
+
+    # --- 状态文件 ---
+
+    def _save_state(self, jobs: List[_Job]):
+        if not self.state_path:
+            return
+        state = {"jobs": [
+            {"model": job.item[0], "key": _key_fingerprint(job.item[1]), "job_id": job.job_id,
+             "custom_ids": job.custom_ids, "submitted_at": job.submitted_at}
+            for job in jobs
+        ]}
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _load_state(self) -> List[_Job]:
+        if not self.state_path or not os.path.exists(self.state_path):
+            return []
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        items = {(item[0], _key_fingerprint(item[1])): item for item in self.pool}
+        jobs = []
+        for entry in state.get("jobs", []):
+            item = items.get((entry["model"], entry["key"]))
+            backend = self._backend(item) if item is not None else None
+            if backend is None:
+                logger.warning("无法续跑批处理任务 %s：池中已没有对应的 (模型, 密钥)", entry["job_id"])
+                continue
+            jobs.append(_Job(item, backend, entry["job_id"], entry["custom_ids"], entry["submitted_at"]))
+        return jobs
+
+    # --- 提交与轮询 ---
+
+    @staticmethod
+    def _failed(custom_ids: Iterable[str], error: str, model: Optional[str] = None) -> Iterator[BatchResult]:
+        for custom_id in custom_ids:
+            yield BatchResult(custom_id, error=error, model=model)
+
+    def run(self, requests: Iterable[BatchRequest]) -> Iterator[BatchResult]:
+        """
+        提交所有请求并在任务结束时逐条产出结果 (按任务完成的顺序，而非请求顺序)。
+        每条请求恰好产出一个结果；状态文件中续跑的任务还会产出此前提交的请求的结果。
+        """
+        requests = list(requests)
+        jobs = self._load_state()
+        resumed = {custom_id for job in jobs for custom_id in job.custom_ids}
+        if jobs:
+            logger.info("续跑 %d 个未完成的批处理任务，共 %d 条请求", len(jobs), len(resumed))
+        pending = [request for request in requests if request.custom_id not in resumed]
+
+        targets = self.targets()
+        if pending and not targets:
+            yield from self._failed((r.custom_id for r in pending), "池中没有支持批处理的模型")
+            pending = []
+
+        for index, start in enumerate(range(0, len(pending), self.max_batch_size)):
+            chunk = pending[start:start + self.max_batch_size]
+            item = targets[index % len(targets)]
+            backend = self._backend(item)
+            custom_ids = [request.custom_id for request in chunk]
+            try:
+                job_id = backend.submit(chunk)
+            except Exception as e:
+                logger.warning("提交批处理任务失败: 模型=%s, Key=...%s, 错误: %s", item[0], item[1][-4:], e)
+                yield from self._failed(custom_ids, f"提交批处理任务失败: {e}", item[0])
+                continue
+            logger.info("已提交批处理任务 %s: 模型=%s, %d 条请求", job_id, item[0], len(chunk))
+            jobs.append(_Job(item, backend, job_id, custom_ids, time.time()))
+            self._save_state(jobs)
+
+        while jobs:
+            for job in list(jobs):
+                try:
+                    state = job.backend.state(job.job_id)
+                except Exception as e:
+                    # 查询失败多为暂时性错误，下一轮继续轮询
+                    logger.warning("查询批处理任务 %s 失败: %s", job.job_id, e)
+                    state = None
+                if state is None or not state.terminal:
+                    if time.time() - job.submitted_at <= self.max_wait:
+                        continue
+                    logger.warning("批处理任务 %s 超过 %.0fs 仍未完成，取消并回退", job.job_id, self.max_wait)
+                    try:
+                        job.backend.cancel(job.job_id)
+                    except Exception as e:
+                        logger.warning("取消批处理任务 %s 失败: %s", job.job_id, e)
+                    results: Dict[str, BatchResult] = {}
+                    error = "批处理任务超时"
+                elif state is JobState.SUCCEEDED:
+                    try:
+                        results = job.backend.results(job.job_id, job.custom_ids)
+                        error = "批处理结果中缺少该请求"
+                    except Exception as e:
+                        results, error = {}, f"取回批处理结果失败: {e}"
+                else:
+                    results, error = {}, f"批处理任务结束于 {state.value} 状态"
+                logger.info("批处理任务 %s 已结束: 成功 %d/%d 条", job.job_id,
+                            sum(1 for r in results.values() if r.ok), len(job.custom_ids))
+                for custom_id in job.custom_ids:
+                    yield results.get(custom_id) or BatchResult(custom_id, error=error, model=job.item[0])
+                jobs.remove(job)
+                self._save_state(jobs)
+            if jobs:
+                time.sleep(self.poll_interval)
+
+    def close(self):
+        for backend in self._backends.values():
+            if backend is not None:
+                backend.close()
+        self._backends.clear()
@@ -0,0 +1 @@
+# llm_framework/benchmarks/__init__.py
@@ -0,0 +1,273 @@
+# llm_framework/benchmarks/gateway_load_test.py
+"""
+网关压测：在本机启动 OpenAI 兼容网关 (后端为模拟提供者)，用若干保持连接的 HTTP 客户端并发请求
+/v1/chat/completions，统计吞吐、延迟分位数、流式首字节时间与成功率。不访问外部网络。
+
+用法 (在项目根目录下运行):
+    python -m benchmarks.gateway_load_test
+    python -m benchmarks.gateway_load_test --requests 2000 --concurrency 64 --stream-ratio 0.5 \
+        --output benchmarks/results/gateway.json
+    python -m benchmarks.gateway_load_test --url http://127.0.0.1:8000   # 压测已在运行的网关
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.run_benchmarks import PROFILES, build_pool, latency_summary, quiet
+from benchmarks.simulated_provider import SimulatedProvider
+from circuit_breaker import HealthTracker
+from concurrency_limiter import AdaptiveConcurrencyLimiter
+from gateway import GatewayServer
+from llm_factory import LLMFactory
+from llm_orchestrator import LLMOrchestrator
+from metrics import MetricsRecorder
+from model_pool import ModelPool
+from selection_strategy import RandomStrategy
+
+
+class _Client:
+    """一个保持连接的最小 HTTP/1.1 客户端，支持 Content-Length 与分块传输的响应。"""
+    def __init__(self, host: str, port: int, token: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.token = token
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def _connect(self):
+        if self._writer is None or self._writer.is_closing():
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+    async def post(self, path: str, payload: Dict[str, Any]) -> Tuple[int, bytes, Optional[float]]:
+        """
+        发送一个请求并读完响应。
+        :return: (状态码, 响应体, 首字节耗时)。流式响应的首字节按第二个数据块计算：
+                 网关总是先立即发送只含 role 的事件，第二个数据块才是第一段模型输出。
+        """
+        await self._connect()
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        auth = f"Authorization: Bearer {self.token}\r\n" if self.token else ""
+        started = time.perf_counter()
+        self._writer.write(
+            f"POST {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n{auth}"
+            f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+        )
+        await self._writer.drain()
+        try:
+            head = await self._reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            status = int(lines[0].split(" ", 2)[1])
+            headers = {
+                name.strip().lower(): value.strip()
+                for name, value in (line.split(":", 1) for line in lines[1:] if ":" in line)
+            }
+            first_byte = None
+            if headers.get("transfer-encoding") == "chunked":
+                parts: List[bytes] = []
+                while True:
+                    size = int((await self._reader.readuntil(b"\r\n")).strip(), 16)
+                    data = await self._reader.readexactly(size + 2)
+                    if size == 0:
+                        break
+                    parts.append(data[:-2])
+                    if first_byte is None and len(parts) == 2:
+                        first_byte = time.perf_counter() - started
+                payload_bytes = b"".join(parts)
+            else:
+                payload_bytes = await self._reader.readexactly(int(headers.get("content-length") or 0))
+                first_byte = time.perf_counter() - started
+            if headers.get("connection", "").lower() == "close":
+                await self.close()
+            return status, payload_bytes, first_byte
+        except BaseException:
+            # 响应未读完的连接不能再复用
+            await self.close()
+            raise
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            with contextlib.suppress(Exception):
+                await self._writer.wait_closed()
+            self._writer = None
+
+
+def _stream_ok(body: bytes) -> Tuple[bool, str]:
+    """检查 SSE 响应是否以 [DONE] 正常结束且没有错误事件，返回 (是否成功, 拼接的文本)。"""
+    text: List[str] = []
+    done = False
+    for line in body.decode("utf-8").split("\n"):
+        if not line.startswith("data: "):
+            continue
+        data = line[len("data: "):]
+        if data == "[DONE]":
+            done = True
+            continue
+        event = json.loads(data)
+        if "error" in event:
+            return False, ""
+        text.append(event["choices"][0]["delta"].get("content", ""))
+    return done, "".join(text)
+
+
+async def run_load(host: str, port: int, requests: int, concurrency: int, stream_ratio: float,
+                   model: str = "auto", token: Optional[str] = None) -> Dict[str, Any]:
+    """用 concurrency 个保持连接的客户端共发送 requests 个请求，其中 stream_ratio 比例为流式请求。"""
+    messages = [{"role": "system", "content": "你是压测助手。"}, {"role": "user", "content": "网关压测消息"}]
+    stream_every = round(1 / stream_ratio) if stream_ratio > 0 else 0
+    next_index = iter(range(requests))
+    latencies: Dict[str, List[float]] = {"chat": [], "stream": []}
+    first_bytes: List[float] = []
+    failures: Dict[str, int] = {}
+
+    async def worker():
+        client = _Client(host, port, token)
+        try:
+            for index in next_index:
+                stream = bool(stream_every) and index % stream_every == 0
+                payload = {"model": model, "messages": messages, "max_tokens": 64, "stream": stream}
+                started = time.perf_counter()
+                try:
+                    status, body, first_byte = await client.post("/v1/chat/completions", payload)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    failures[type(e).__name__] = failures.get(type(e).__name__, 0) + 1
+                    continue
+                elapsed = time.perf_counter() - started
+                if status != 200:
+                    failures[f"http_{status}"] = failures.get(f"http_{status}", 0) + 1
+                    continue
+                if stream:
+                    ok, _ = _stream_ok(body)
+                    if not ok:
+                        failures["stream_error"] = failures.get("stream_error", 0) + 1
+                        continue
+                    if first_byte is not None:
+                        first_bytes.append(first_byte)
+                    latencies["stream"].append(elapsed)
+                else:
+                    json.loads(body)["choices"][0]["message"]["content"]
+                    latencies["chat"].append(elapsed)
+        finally:
+            await client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    succeeded = len(latencies["chat"]) + len(latencies["stream"])
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "stream_ratio": stream_ratio,
+        "wall_seconds": wall,
+        "throughput_rps": succeeded / wall if wall else 0.0,
+        "success_rate": succeeded / requests if requests else 0.0,
+        "failures": failures,
+        "chat_latency": latency_summary(latencies["chat"]),
+        "stream_latency": latency_summary(latencies["stream"]),
+        "stream_first_byte": latency_summary(first_bytes),
+    }
+
+
+@contextlib.contextmanager
+def local_gateway(pool_size: int, workers: int):
+    """在后台线程的事件循环中启动一个以模拟提供者为后端的网关，退出时关闭。"""
+    SimulatedProvider.reset()
+    pool = ModelPool(build_pool(pool_size))
+    components = {
+        "strategy": RandomStrategy(),
+        "factory": LLMFactory(),
+        "health": HealthTracker(),
+        "concurrency": AdaptiveConcurrencyLimiter(),
+        "metrics": MetricsRecorder(),
+    }
+    orchestrators = {None: LLMOrchestrator(pool, **components)}
+    for model in PROFILES:
+        orchestrators[model] = LLMOrchestrator(pool.items_of(pool.mask(model=model)), **components)
+
+    def orchestrator_for(model: Optional[str]):
+        if model not in orchestrators:
+            raise ValueError(f"模型池中没有模型 {model}")
+        return orchestrators[model]
+
+    server = GatewayServer(orchestrator_for, sorted(PROFILES), port=0)
+    loop = asyncio.new_event_loop()
+    # 模拟提供者是同步实现，由基类放到默认线程池中执行；线程数决定了后端的并发上限
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=workers))
+    ready = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.start())
+        ready.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, name="gateway", daemon=True)
+    thread.start()
+    ready.wait()
+    try:
+        yield server
+    finally:
+        asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        components["factory"].close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Many-LLM 网关压测")
+    parser.add_argument("--url", default=None, help="压测已在运行的网关 (如 http://127.0.0.1:8000)，默认在本机启动模拟网关")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--stream-ratio", type=float, default=0.5, help="流式请求所占比例")
+    parser.add_argument("--model", default="auto", help="请求中的 model 字段")
+    parser.add_argument("--pool-size", type=int, default=16, help="本机模拟网关的 (模型, 密钥) 数")
+    parser.add_argument("--workers", type=int, default=128, help="本机模拟网关执行同步提供者的线程数")
+    parser.add_argument("--output", default=None, help="结果 JSON 的输出路径")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": vars(args),
+    }
+    token = os.getenv("MANYLLM_GATEWAY_TOKEN") or None
+    if args.url:
+        target = urlsplit(args.url)
+        row = asyncio.run(run_load(target.hostname, target.port or 80, args.requests, args.concurrency,
+                                   args.stream_ratio, args.model, token))
+    else:
+        with quiet(), local_gateway(args.pool_size, args.workers) as server:
+            row = asyncio.run(run_load(server.host, server.port, args.requests, args.concurrency,
+                                       args.stream_ratio, args.model))
+    results["gateway"] = row
+    print(f"[gateway] requests={row['requests']} concurrency={row['concurrency']} "
+          f"success={row['success_rate']:.1%} throughput={row['throughput_rps']:.1f} req/s")
+    print(f"          chat   p50={row['chat_latency']['p50_ms']:.1f}ms p95={row['chat_latency']['p95_ms']:.1f}ms "
+          f"p99={row['chat_latency']['p99_ms']:.1f}ms")
+    print(f"          stream p50={row['stream_latency']['p50_ms']:.1f}ms "
+          f"first_byte p50={row['stream_first_byte']['p50_ms']:.1f}ms p99={row['stream_first_byte']['p99_ms']:.1f}ms")
+    if row["failures"]:
+        print(f"          failures={row['failures']}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# llm_framework/benchmarks/import_time.py
+"""
+导入耗时基准：在全新的解释器进程中测量各入口模块的导入时间，对比延迟导入厂商 SDK 与预先全部导入的差别。
+
+用法 (在项目根目录下运行):
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --repeat 20 --output benchmarks/results/import_time.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 厂商 SDK：重构前 llm_factory 在导入时就会全部加载
+VENDOR_SDKS = "import google.genai, zai, requests"
+
+# 场景名 -> 在子进程中执行的代码
+SCENARIOS: Dict[str, str] = {
+    # 短生命周期 CLI / 工作进程的启动开销
+    "import manyllm": "import manyllm",
+    "import optimization_aicars": "import optimization_aicars",
+    # 对照组：模拟重构前预先导入所有厂商 SDK 的行为
+    "import manyllm (eager SDKs)": f"{VENDOR_SDKS}; import manyllm",
+    # 第一次使用某个提供者时才付出的导入成本：只加载一家 SDK
+    "first gemini provider": (
+        "import manyllm; from llm_factory import LLMFactory; "
+        "LLMFactory.resolve_provider_class('gemini-2.5-flash')"
+    ),
+    "first glm provider": (
+        "import manyllm; from llm_factory import LLMFactory; "
+        "LLMFactory.resolve_provider_class('glm-4.5-flash')"
+    ),
+}
+
+# 在计时代码之后输出已加载的厂商 SDK，用于确认延迟导入生效
+_REPORT = (
+    "; import sys, json; "
+    "print(json.dumps(sorted(m for m in ('google.genai', 'zai', 'requests') if m in sys.modules)))"
+)
+
+
+def run_once(code: str) -> Dict[str, Any]:
+    """在新进程中执行一次 code，返回导入耗时与已加载的厂商 SDK。计时只包含 code 本身，不含解释器启动。"""
+    timed = f"import time; _t = time.perf_counter(); {code}; _elapsed = time.perf_counter() - _t; print(_elapsed)"
+    completed = subprocess.run(
+        [sys.executable, "-c", timed + _REPORT], cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    elapsed, loaded = completed.stdout.strip().splitlines()[-2:]
+    return {"seconds": float(elapsed), "sdks": json.loads(loaded)}
+
+
+def bench_scenario(name: str, code: str, repeat: int) -> Dict[str, Any]:
+    run_once(code)  # 预热：生成 .pyc，避免第一次的编译时间干扰结果
+    samples: List[float] = []
+    sdks: List[str] = []
+    for _ in range(repeat):
+        result = run_once(code)
+        samples.append(result["seconds"])
+        sdks = result["sdks"]
+    return {
+        "scenario": name,
+        "repeat": repeat,
+        "median_ms": statistics.median(samples) * 1000,
+        "min_ms": min(samples) * 1000,
+        "max_ms": max(samples) * 1000,
+        "loaded_sdks": sdks,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Many-LLM 导入耗时基准")
+    parser.add_argument("--repeat", type=int, default=10, help="每个场景的子进程次数")
+    parser.add_argument("--output", default=None, help="结果 JSON 的输出路径")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": vars(args),
+        "import_time": [],
+    }
+    for name, code in SCENARIOS.items():
+        row = bench_scenario(name, code, args.repeat)
+        results["import_time"].append(row)
+        print(f"[import] {name:<30} median={row['median_ms']:7.1f}ms  min={row['min_ms']:7.1f}ms  "
+              f"sdks={','.join(row['loaded_sdks']) or '-'}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+# llm_framework/benchmarks/run_benchmarks.py
+"""
+离线基准测试：用模拟提供者测量编排器与选择策略的性能，不访问网络。
+
+用法 (在项目根目录下运行):
+    python -m benchmarks.run_benchmarks --output benchmarks/results/latest.json
+    python -m benchmarks.run_benchmarks --quick --baseline benchmarks/results/latest.json
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Any
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.simulated_provider import SimulatedProvider, SimulationProfile, SIM_PREFIX
+from circuit_breaker import HealthTracker
+from model_pool import ModelPool
+from llm_orchestrator import LLMOrchestrator
+from selection_strategy import SequentialStrategy, RandomStrategy, LatencyAwareStrategy, PoolItem
+
+STRATEGIES: Dict[str, Callable[[], Any]] = {
+    "sequential": SequentialStrategy,
+    "random": RandomStrategy,
+    "latency_aware": LatencyAwareStrategy,
+}
+
+# 模拟的模型：一个快而稳定、一个慢、一个容易 429、一个偶发 5xx
+PROFILES = {
+    f"{SIM_PREFIX}flash-lite": SimulationProfile(median_latency=0.8, latency_sigma=0.3),
+    f"{SIM_PREFIX}flash": SimulationProfile(median_latency=1.5, latency_sigma=0.5),
+    f"{SIM_PREFIX}gemma": SimulationProfile(median_latency=1.0, latency_sigma=0.4, burst_rate=0.05),
+    f"{SIM_PREFIX}glm": SimulationProfile(median_latency=3.0, latency_sigma=0.6, error_rate=0.1),
+}
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": percentile(samples, 0.50) * 1000,
+        "p95_ms": percentile(samples, 0.95) * 1000,
+        "p99_ms": percentile(samples, 0.99) * 1000,
+        "mean_ms": statistics.fmean(samples) * 1000 if samples else 0.0,
+    }
+
+
+def build_pool(size: int) -> List[PoolItem]:
+    """构造 size 个 (模型, 密钥) 项，模型在各模拟配置间轮换。"""
+    models = list(PROFILES)
+    return [
+        (models[i % len(models)], f"sim-key-{i // len(models):05d}", {"priority": 1 + i % len(models), "provider": "sim"})
+        for i in range(size)
+    ]
+
+
+@contextlib.contextmanager
+def quiet():
+    """屏蔽编排器在每次尝试时的日志与打印，避免终端输出干扰计时。"""
+    logging.disable(logging.CRITICAL)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def bench_orchestrator(strategy_name: str, pool_size: int, requests: int, concurrency: int,
+                       stream: bool = False) -> Dict[str, Any]:
+    """并发发送 requests 个请求，统计吞吐、延迟分位数与故障切换开销。"""
+    SimulatedProvider.reset()
+    orchestrator = LLMOrchestrator(build_pool(pool_size), STRATEGIES[strategy_name](), health=HealthTracker())
+    messages = [{"role": "user", "content": "基准测试消息"}]
+
+    def one_request(_):
+        SimulatedProvider.calls.count = 0
+        started = time.perf_counter()
+        first_chunk = None
+        if stream:
+            ok = True
+            for chunk in orchestrator.chat_stream(messages):
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - started
+                if isinstance(chunk, str) and chunk.startswith("ERROR:"):
+                    ok = False
+        else:
+            ok = orchestrator.chat(messages)["status"] == "success"
+        return time.perf_counter() - started, first_chunk, SimulatedProvider.calls.count, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one_request, range(requests)))
+    elapsed = time.perf_counter() - started
+    orchestrator.close()
+
+    latencies = [r[0] for r in results]
+    attempts = [r[2] for r in results]
+    single = [r[0] for r in results if r[2] == 1]
+    failover = [r[0] for r in results if r[2] > 1]
+    report = {
+        "strategy": strategy_name,
+        "pool_size": pool_size,
+        "requests": requests,
+        "concurrency": concurrency,
+        "stream": stream,
+        "requests_per_sec": requests / elapsed,
+        "success_rate": sum(1 for r in results if r[3]) / requests,
+        "latency": latency_summary(latencies),
+        "mean_attempts": statistics.fmean(attempts),
+        "failover_rate": len(failover) / requests,
+        # 需要故障切换的请求比一次成功的请求平均多花的时间
+        "failover_cost_ms": (statistics.fmean(failover) - statistics.fmean(single)) * 1000
+        if failover and single else 0.0,
+    }
+    if stream:
+        report["time_to_first_chunk"] = latency_summary([r[1] for r in results if r[1] is not None])
+    return report
+
+
+def bench_select(strategy_name: str, pool_size: int, iterations: int, failed_fraction: float = 0.1) -> Dict[str, Any]:
+    """测量策略 select 的单次耗时，本次请求中已有 failed_fraction 比例的项失败。"""
+    pool = ModelPool(build_pool(pool_size))
+    strategy = STRATEGIES[strategy_name]()
+    rng = random.Random(0)
+    # 与编排器相同，已失败的项记录在随增删维护位集的 ItemSet 中
+    failed = pool.item_set((item[0], item[1]) for item in rng.sample(pool, int(pool_size * failed_fraction)))
+    strategy.add_gate(HealthTracker())
+    started = time.perf_counter()
+    for _ in range(iterations):
+        strategy.select(pool, failed)
+    elapsed = time.perf_counter() - started
+    return {
+        "strategy": strategy_name,
+        "pool_size": pool_size,
+        "iterations": iterations,
+        "select_us": elapsed / iterations * 1e6,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """打印与基线结果相比的变化 (吞吐、p99 与 select 耗时)。"""
+    def index(rows, keys):
+        return {tuple(row[k] for k in keys): row for row in rows}
+
+    print("\n--- 与基线对比 ---")
+    keys = ("strategy", "pool_size", "stream")
+    base_rows = index(baseline.get("orchestrator", []), keys)
+    for key, row in index(current["orchestrator"], keys).items():
+        base = base_rows.get(key)
+        if base is None:
+            continue
+        rps = (row["requests_per_sec"] / base["requests_per_sec"] - 1) * 100
+        p99 = (row["latency"]["p99_ms"] / base["latency"]["p99_ms"] - 1) * 100 if base["latency"]["p99_ms"] else 0.0
+        print(f"  {key}: 吞吐 {rps:+.1f}%, p99 {p99:+.1f}%")
+    keys = ("strategy", "pool_size")
+    base_rows = index(baseline.get("select", []), keys)
+    for key, row in index(current["select"], keys).items():
+        base = base_rows.get(key)
+        if base is not None:
+            print(f"  select{key}: {(row['select_us'] / base['select_us'] - 1) * 100:+.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Many-LLM 离线基准测试")
+    parser.add_argument("--requests", type=int, default=2000, help="每个场景的请求数")
+    parser.add_argument("--concurrency", type=int, default=32, help="并发线程数")
+    parser.add_argument("--pool-sizes", default="10,100,1000,10000", help="select 基准使用的池大小，逗号分隔")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="模拟秒到真实秒的缩放系数")
+    parser.add_argument("--quick", action="store_true", help="缩小规模，用于快速冒烟")
+    parser.add_argument("--output", default=None, help="结果 JSON 的输出路径")
+    parser.add_argument("--baseline", default=None, help="用于对比的历史结果 JSON")
+    args = parser.parse_args()
+
+    requests = 200 if args.quick else args.requests
+    pool_sizes = [int(size) for size in args.pool_sizes.split(",")]
+    for profile in PROFILES.values():
+        profile.time_scale = args.time_scale
+    SimulatedProvider.profiles = PROFILES
+
+    results: Dict[str, Any] = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": vars(args),
+        "orchestrator": [],
+        "select": [],
+    }
+
+    for strategy_name in STRATEGIES:
+        for stream in (False, True):
+            with quiet():
+                row = bench_orchestrator(strategy_name, 40, requests, args.concurrency, stream=stream)
+            results["orchestrator"].append(row)
+            print(f"[orchestrator] {strategy_name:<14} stream={stream!s:<5} "
+                  f"{row['requests_per_sec']:8.1f} req/s  p50={row['latency']['p50_ms']:7.1f}ms "
+                  f"p99={row['latency']['p99_ms']:7.1f}ms  attempts={row['mean_attempts']:.2f}")
+
+    for strategy_name in STRATEGIES:
+        for pool_size in pool_sizes:
+            iterations = max(20, min(20000, 2_000_000 // pool_size))
+            if args.quick:
+                iterations = max(10, iterations // 10)
+            row = bench_select(strategy_name, pool_size, iterations)
+            results["select"].append(row)
+            print(f"[select] {strategy_name:<14} pool={pool_size:<6} {row['select_us']:10.2f} us/select")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
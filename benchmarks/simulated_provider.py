@@ -0,0 +1,109 @@
+# llm_framework/benchmarks/simulated_provider.py
+import math
+import random
+import threading
+import time
+from typing import Dict, List, Generator, Optional
+from providers.base_provider import LLMProvider
+from llm_factory import LLMFactory
+
+# 模拟模型名的统一前缀，通过 LLMFactory.register_provider 注册
+SIM_PREFIX = "sim-"
+
+
+class SimulatedError(Exception):
+    """模拟的提供者错误，带有 HTTP 状态码，便于熔断器分类。"""
+    def __init__(self, message: str, code: int):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class SimulationProfile:
+    """
+    一个模拟模型的行为参数。所有时长都以“模拟秒”为单位，实际休眠时间再乘以 time_scale。
+    :param median_latency: 非流式调用延迟的中位数 (对数正态分布)。
+    :param latency_sigma: 对数正态分布的 sigma，越大长尾越重。
+    :param error_rate: 每次调用以 5xx 失败的概率。
+    :param burst_rate: 每次调用触发一段 429 突发的概率；突发期间该密钥的所有调用都返回 429。
+    :param burst_duration: 429 突发持续的模拟秒数。
+    :param chunks: 流式调用产出的文本块数量。
+    :param first_chunk_latency: 流式调用首块延迟的中位数。
+    :param chunk_interval: 流式调用相邻文本块之间的平均间隔。
+    """
+    def __init__(self, median_latency: float = 1.0, latency_sigma: float = 0.4, error_rate: float = 0.0,
+                 burst_rate: float = 0.0, burst_duration: float = 30.0, chunks: int = 20,
+                 first_chunk_latency: float = 0.4, chunk_interval: float = 0.03, time_scale: float = 0.01):
+        self.median_latency = median_latency
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.burst_rate = burst_rate
+        self.burst_duration = burst_duration
+        self.chunks = chunks
+        self.first_chunk_latency = first_chunk_latency
+        self.chunk_interval = chunk_interval
+        self.time_scale = time_scale
+
+    def sample_latency(self, rng: random.Random, median: float) -> float:
+        return median * math.exp(rng.gauss(0.0, self.latency_sigma))
+
+
+class SimulatedProvider(LLMProvider):
+    """
+    不访问网络的模拟提供者，按模型名对应的 SimulationProfile 产生延迟、错误与 429 突发。
+    """
+    profiles: Dict[str, SimulationProfile] = {}
+    default_profile = SimulationProfile()
+    # 密钥 -> 429 突发结束的时间 (time.monotonic)
+    _bursts: Dict[str, float] = {}
+    _lock = threading.Lock()
+    # 当前线程内发生的调用次数，基准脚本据此统计故障切换深度
+    calls = threading.local()
+
+    def __init__(self, model_name: str, api_key: str, **kwargs):
+        super().__init__(model_name, api_key, **kwargs)
+        self.profile = self.profiles.get(model_name, self.default_profile)
+        self._rng = random.Random(hash((model_name, api_key)))
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._bursts.clear()
+
+    def _sleep(self, seconds: float):
+        time.sleep(seconds * self.profile.time_scale)
+
+    def _before_call(self):
+        SimulatedProvider.calls.count = getattr(SimulatedProvider.calls, "count", 0) + 1
+        profile = self.profile
+        now = time.monotonic()
+        with self._lock:
+            burst_until = self._bursts.get(self.api_key, 0.0)
+            if now < burst_until:
+                raise SimulatedError("RESOURCE_EXHAUSTED (simulated burst)", 429)
+            if self._rng.random() < profile.burst_rate:
+                self._bursts[self.api_key] = now + profile.burst_duration * profile.time_scale
+                raise SimulatedError("RESOURCE_EXHAUSTED (simulated)", 429)
+
+    def chat(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        self._before_call()
+        self._sleep(self.profile.sample_latency(self._rng, self.profile.median_latency))
+        if self._rng.random() < self.profile.error_rate:
+            raise SimulatedError("UNAVAILABLE (simulated)", 503)
+        return f"[{self.model_name}] " + "模拟回复" * 8
+
+    def chat_stream(self, messages: List[Dict[str, str]], **kwargs) -> Generator[str, None, None]:
+        self._before_call()
+        profile = self.profile
+        self._sleep(profile.sample_latency(self._rng, profile.first_chunk_latency))
+        fail_at: Optional[int] = None
+        if self._rng.random() < profile.error_rate:
+            fail_at = self._rng.randrange(profile.chunks)
+        for index in range(profile.chunks):
+            if index == fail_at:
+                raise SimulatedError("stream reset (simulated)", 503)
+            if index:
+                self._sleep(self._rng.expovariate(1.0 / profile.chunk_interval))
+            yield f"块{index} "
+
+
+LLMFactory.register_provider(SIM_PREFIX, SimulatedProvider)
@@ -0,0 +1,259 @@
+# llm_framework/benchmarks/stub_batch_server.py
+"""
+本地的替身批处理服务器，实现 Gemini 与 ZhipuAI 批处理接口中 batch_jobs 用到的部分，
+用于在不访问网络、不产生费用的情况下验证批处理模式。
+
+    Gemini:  POST /v1beta/models/{model}:batchGenerateContent
+             GET  /v1beta/batches/{id}          POST /v1beta/batches/{id}:cancel
+    ZhipuAI: POST /zhipuai/files (multipart)    GET  /zhipuai/files/{id}/content
+             POST /zhipuai/batches              GET  /zhipuai/batches/{id}
+             POST /zhipuai/batches/{id}/cancel
+
+任务在提交 completion_delay 秒后完成；每条请求以 failure_rate 的概率单独失败。
+
+用法 (在项目根目录下运行):
+    python -m benchmarks.stub_batch_server --port 8765
+    GEMINI_BATCH_BASE_URL=http://127.0.0.1:8765 ZHIPUAI_BATCH_BASE_URL=http://127.0.0.1:8765/zhipuai \
+        OPTIMIZATION_BATCH=1 python optimization_aicars.py
+"""
+import argparse
+import email.parser
+import email.policy
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+ZHIPUAI_PREFIX = "/zhipuai"
+
+
+class _StubJob:
+    def __init__(self, job_id: str, model: str, requests: List[Tuple[str, str]], delay: float):
+        self.job_id = job_id
+        self.model = model
+        # [(custom_id, 最后一条用户消息)]
+        self.requests = requests
+        self.created_at = time.time()
+        self.ready_at = self.created_at + delay
+        self.cancelled = False
+        self.outcomes: Optional[List[Tuple[str, Optional[str], Optional[str]]]] = None
+
+
+class StubBatchServer:
+    """
+    :param completion_delay: 任务从提交到完成的秒数。
+    :param failure_rate: 每条请求单独失败的概率。
+    :param fail_jobs: 为 True 时所有任务都以失败状态结束，用于验证整批回退。
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, completion_delay: float = 0.5,
+                 failure_rate: float = 0.0, fail_jobs: bool = False, seed: int = 0):
+        self.completion_delay = completion_delay
+        self.failure_rate = failure_rate
+        self.fail_jobs = fail_jobs
+        self.jobs: Dict[str, _StubJob] = {}
+        self.files: Dict[str, bytes] = {}
+        self.submitted_requests = 0
+        self._rng = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def base_urls(self) -> Dict[str, str]:
+        """可直接传给 BatchJobRunner 的 base_urls。"""
+        return {"gemini": self.base_url, "zhipuai": self.base_url + ZHIPUAI_PREFIX}
+
+    def start(self) -> "StubBatchServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-batch-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- 任务模拟 ---
+
+    def _new_job(self, model: str, requests: List[Tuple[str, str]]) -> _StubJob:
+        with self._lock:
+            job = _StubJob(f"stub-{next(self._ids)}", model, requests, self.completion_delay)
+            self.jobs[job.job_id] = job
+            self.submitted_requests += len(requests)
+        return job
+
+    def _finished(self, job: _StubJob) -> bool:
+        if job.cancelled or time.time() < job.ready_at:
+            return job.cancelled
+        with self._lock:
+            if job.outcomes is None:
+                job.outcomes = [
+                    (custom_id, None, "simulated request failure") if self._rng.random() < self.failure_rate
+                    else (custom_id, f"[{job.model}] 批处理回复: {prompt[:40]}", None)
+                    for custom_id, prompt in job.requests
+                ]
+        return True
+
+    def _gemini_job(self, job: _StubJob) -> Dict[str, Any]:
+        if job.cancelled:
+            state = "BATCH_STATE_CANCELLED"
+        elif not self._finished(job):
+            state = "BATCH_STATE_RUNNING"
+        else:
+            state = "BATCH_STATE_FAILED" if self.fail_jobs else "BATCH_STATE_SUCCEEDED"
+        metadata: Dict[str, Any] = {"model": f"models/{job.model}", "state": state, "displayName": job.job_id}
+        if state == "BATCH_STATE_SUCCEEDED":
+            metadata["output"] = {"inlinedResponses": {"inlinedResponses": [
+                {"metadata": {"key": custom_id}, "error": {"code": 500, "message": error}} if error else
+                {"metadata": {"key": custom_id},
+                 "response": {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}}
+                for custom_id, text, error in job.outcomes
+            ]}}
+        return {"name": f"batches/{job.job_id}", "metadata": metadata}
+
+    def _zhipuai_batch(self, job: _StubJob) -> Dict[str, Any]:
+        batch = {"id": job.job_id, "object": "batch", "endpoint": "/v4/chat/completions",
+                 "input_file_id": "", "completion_window": "24h", "created_at": int(job.created_at)}
+        if job.cancelled:
+            batch["status"] = "cancelled"
+        elif not self._finished(job):
+            batch["status"] = "in_progress"
+        elif self.fail_jobs:
+            batch["status"] = "failed"
+        else:
+            batch["status"] = "completed"
+            output, errors = [], []
+            for custom_id, text, error in job.outcomes:
+                if error:
+                    errors.append({"custom_id": custom_id, "response": {"status_code": 500, "body": {
+                        "error": {"code": "1234", "message": error}}}})
+                else:
+                    output.append({"custom_id": custom_id, "response": {"status_code": 200, "body": {
+                        "model": job.model, "choices": [{"index": 0, "message": {"role": "assistant", "content": text}}]}}})
+            batch["output_file_id"] = self._store_file(output, f"{job.job_id}-output")
+            batch["error_file_id"] = self._store_file(errors, f"{job.job_id}-errors") if errors else None
+        return batch
+
+    def _store_file(self, rows: List[Dict[str, Any]], file_id: str) -> str:
+        with self._lock:
+            self.files[file_id] = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+        return file_id
+
+    # --- HTTP ---
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _body(self) -> bytes:
+                length = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(length) if length else b""
+
+            def _send(self, status: int, payload: Any, content_type: str = "application/json"):
+                data = payload if isinstance(payload, bytes) else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _not_found(self):
+                self._send(404, {"error": {"code": 404, "message": f"unknown path {self.path}"}})
+
+            def do_POST(self):
+                path = self.path.split("?", 1)[0]
+                body = self._body()
+                match = re.fullmatch(r"/v1beta/models/([^/:]+):batchGenerateContent", path)
+                if match:
+                    payload = json.loads(body)
+                    requests = []
+                    for index, entry in enumerate(payload["batch"]["inputConfig"]["requests"]["requests"]):
+                        contents = entry["request"]["contents"]
+                        prompt = contents[-1]["parts"][0]["text"] if contents else ""
+                        requests.append(((entry.get("metadata") or {}).get("key", str(index)), prompt))
+                    job = stub._new_job(match.group(1), requests)
+                    return self._send(200, stub._gemini_job(job))
+                match = re.fullmatch(r"/v1beta/batches/([^/:]+):cancel", path)
+                if match and match.group(1) in stub.jobs:
+                    stub.jobs[match.group(1)].cancelled = True
+                    return self._send(200, {})
+                if path == ZHIPUAI_PREFIX + "/files":
+                    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                        f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + body
+                    )
+                    data = next(part.get_payload(decode=True) for part in message.iter_parts()
+                                if part.get_param("name", header="content-disposition") == "file")
+                    with stub._lock:
+                        file_id = f"file-{next(stub._ids)}"
+                        stub.files[file_id] = data
+                    return self._send(200, {"id": file_id, "object": "file", "bytes": len(data),
+                                            "created_at": int(time.time()), "filename": "batch.jsonl",
+                                            "purpose": "batch"})
+                if path == ZHIPUAI_PREFIX + "/batches":
+                    payload = json.loads(body)
+                    rows = [json.loads(line) for line in stub.files[payload["input_file_id"]].decode("utf-8").splitlines()
+                            if line.strip()]
+                    model = rows[0]["body"]["model"] if rows else ""
+                    requests = [(row["custom_id"], row["body"]["messages"][-1]["content"]) for row in rows]
+                    job = stub._new_job(model, requests)
+                    return self._send(200, stub._zhipuai_batch(job))
+                match = re.fullmatch(ZHIPUAI_PREFIX + r"/batches/([^/]+)/cancel", path)
+                if match and match.group(1) in stub.jobs:
+                    job = stub.jobs[match.group(1)]
+                    job.cancelled = True
+                    return self._send(200, stub._zhipuai_batch(job))
+                self._not_found()
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                match = re.fullmatch(r"/v1beta/batches/([^/:]+)", path)
+                if match and match.group(1) in stub.jobs:
+                    return self._send(200, stub._gemini_job(stub.jobs[match.group(1)]))
+                match = re.fullmatch(ZHIPUAI_PREFIX + r"/batches/([^/]+)", path)
+                if match and match.group(1) in stub.jobs:
+                    return self._send(200, stub._zhipuai_batch(stub.jobs[match.group(1)]))
+                match = re.fullmatch(ZHIPUAI_PREFIX + r"/files/([^/]+)/content", path)
+                if match and match.group(1) in stub.files:
+                    return self._send(200, stub.files[match.group(1)], "application/octet-stream")
+                self._not_found()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Many-LLM 本地替身批处理服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--completion-delay", type=float, default=5.0, help="任务从提交到完成的秒数")
+    parser.add_argument("--failure-rate", type=float, default=0.05, help="每条请求单独失败的概率")
+    args = parser.parse_args()
+    server = StubBatchServer(args.host, args.port, args.completion_delay, args.failure_rate)
+    print(f"替身批处理服务器已启动: {server.base_url}")
+    print(f"  GEMINI_BATCH_BASE_URL={server.base_urls['gemini']}")
+    print(f"  ZHIPUAI_BATCH_BASE_URL={server.base_urls['zhipuai']}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# llm_framework/circuit_breaker.py
+import re
+import threading
+import time
+from enum import Enum
+from typing import Dict, Optional, Any
+from selection_strategy import ItemGate, PoolItem, ItemIdentifier
+
+
+class ErrorKind(Enum):
+    """调用失败的分类，决定熔断的力度与冷却时长。"""
+    RATE_LIMIT = "rate_limit"   # 429 / RESOURCE_EXHAUSTED
+    AUTH = "auth"               # 401 / 403 / 密钥无效
+    SERVER = "server"           # 5xx / 服务不可用
+    CLIENT = "client"           # 其他 4xx，通常是请求本身的问题
+    UNKNOWN = "unknown"         # 网络错误等无法识别的异常
+
+
+_AUTH_PATTERN = re.compile(r"\b(401|403)\b|PERMISSION_DENIED|UNAUTHENTICATED|API[_ ]?key", re.IGNORECASE)
+_RATE_LIMIT_PATTERN = re.compile(r"\b429\b|RESOURCE_EXHAUSTED|rate.?limit|quota", re.IGNORECASE)
+_SERVER_PATTERN = re.compile(r"\b5\d\d\b|UNAVAILABLE|INTERNAL|overloaded", re.IGNORECASE)
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    """从各家 SDK 的异常中提取 HTTP 状态码 (genai: code, zai/openai: status_code)。"""
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def classify_error(exc: BaseException) -> ErrorKind:
+    """
+    把提供者抛出的异常归类为 ErrorKind。优先使用状态码，其次匹配错误信息。
+    """
+    code = _status_code(exc)
+    if code is not None:
+        if code == 429:
+            return ErrorKind.RATE_LIMIT
+        if code in (401, 403):
+            return ErrorKind.AUTH
+        if code >= 500:
+            return ErrorKind.SERVER
+        if 400 <= code < 500:
+            return ErrorKind.CLIENT
+    message = str(exc)
+    if _RATE_LIMIT_PATTERN.search(message):
+        return ErrorKind.RATE_LIMIT
+    if _AUTH_PATTERN.search(message):
+        return ErrorKind.AUTH
+    if _SERVER_PATTERN.search(message):
+        return ErrorKind.SERVER
+    return ErrorKind.UNKNOWN
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"           # 正常放行
+    OPEN = "open"               # 熔断中，冷却结束前不放行
+    HALF_OPEN = "half_open"     # 冷却结束，只放行一个探测请求
+
+
+class _Circuit:
+    __slots__ = ("state", "failures", "trips", "open_until", "probing", "probe_started", "last_error")
+
+    def __init__(self):
+        self.state = CircuitState.CLOSED
+        self.failures = 0       # 连续失败次数
+        self.trips = 0          # 连续熔断次数，用于指数冷却
+        self.open_until = 0.0
+        self.probing = False
+        self.probe_started = 0.0
+        self.last_error: Optional[ErrorKind] = None
+
+
+class HealthTracker(ItemGate):
+    """
+    跨请求共享的 (模型, 密钥) 健康状态，为每一项维护一个熔断器。
+
+    - 429 与鉴权错误会立即熔断；5xx 与未知错误连续失败 failure_threshold 次后熔断。
+    - 冷却时间按错误类别取基准值，每次连续熔断翻倍，不超过 max_cooldown。
+    - 冷却结束后进入半开状态，只放行一个探测请求：成功则闭合，失败则以更长的冷却重新熔断。
+    - 其他 4xx 错误被视为请求本身的问题，不影响该项的健康状态。
+    - 探测请求超过 probe_timeout 仍无结果 (例如流式调用被消费者中途放弃) 时，允许发起新的探测。
+    """
+    DEFAULT_COOLDOWNS = {
+        ErrorKind.RATE_LIMIT: 30.0,
+        ErrorKind.AUTH: 3600.0,
+        ErrorKind.SERVER: 10.0,
+        ErrorKind.UNKNOWN: 10.0,
+    }
+
+    def __init__(self, failure_threshold: int = 3, max_cooldown: float = 3600.0,
+                 cooldowns: Optional[Dict[ErrorKind, float]] = None, probe_timeout: float = 120.0,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.probe_timeout = probe_timeout
+        self.max_cooldown = max_cooldown
+        self.cooldowns = dict(self.DEFAULT_COOLDOWNS)
+        if cooldowns:
+            self.cooldowns.update(cooldowns)
+        self._clock = clock
+        self._circuits: Dict[ItemIdentifier, _Circuit] = {}
+        self._lock = threading.Lock()
+
+    def _circuit(self, identifier: ItemIdentifier) -> _Circuit:
+        circuit = self._circuits.get(identifier)
+        if circuit is None:
+            circuit = self._circuits[identifier] = _Circuit()
+        return circuit
+
+    def state(self, identifier: ItemIdentifier) -> CircuitState:
+        """返回该项当前的熔断状态 (冷却已结束的 OPEN 视为 HALF_OPEN)。"""
+        circuit = self._circuits.get(identifier)
+        if circuit is None:
+            return CircuitState.CLOSED
+        if circuit.state is CircuitState.OPEN and self._clock() >= circuit.open_until:
+            return CircuitState.HALF_OPEN
+        return circuit.state
+
+    def is_available(self, item: PoolItem) -> bool:
+        """策略在选择时调用，只读地判断该项当前是否可以被派发。"""
+        circuit = self._circuits.get((item[0], item[1]))
+        if circuit is None or circuit.state is CircuitState.CLOSED:
+            return True
+        if circuit.state is CircuitState.OPEN:
+            return self._clock() >= circuit.open_until
+        return not circuit.probing or self._clock() - circuit.probe_started >= self.probe_timeout
+
+    def retry_after(self, item: PoolItem) -> Optional[float]:
+        """熔断冷却中的项距离冷却结束的秒数；半开状态下探测结果未知，返回 None。"""
+        circuit = self._circuits.get((item[0], item[1]))
+        if circuit is None or circuit.state is not CircuitState.OPEN:
+            return None
+        remaining = circuit.open_until - self._clock()
+        return remaining if remaining > 0 else None
+
+    def on_dispatch(self, item: PoolItem):
+        """请求即将发往该项。若冷却已结束，则占用半开状态下唯一的探测名额。"""
+        with self._lock:
+            circuit = self._circuits.get((item[0], item[1]))
+            if circuit is None or circuit.state is CircuitState.CLOSED:
+                return
+            if circuit.state is CircuitState.OPEN and self._clock() >= circuit.open_until:
+                circuit.state = CircuitState.HALF_OPEN
+            if circuit.state is CircuitState.HALF_OPEN:
+                circuit.probing = True
+                circuit.probe_started = self._clock()
+
+    def cancel_dispatch(self, item: PoolItem):
+        """请求在发出前被取消：归还 on_dispatch 占用的探测名额，熔断状态不变。"""
+        with self._lock:
+            circuit = self._circuits.get((item[0], item[1]))
+            if circuit is not None and circuit.state is CircuitState.HALF_OPEN:
+                circuit.probing = False
+
+    def record_success(self, item: PoolItem):
+        with self._lock:
+            circuit = self._circuits.get((item[0], item[1]))
+            if circuit is None:
+                return
+            circuit.state = CircuitState.CLOSED
+            circuit.failures = 0
+            circuit.trips = 0
+            circuit.probing = False
+
+    def record_failure(self, item: PoolItem, exc: BaseException) -> ErrorKind:
+        """
+        记录一次失败并按错误类别更新熔断器。
+        :return: 该异常的分类结果。
+        """
+        kind = classify_error(exc)
+        with self._lock:
+            circuit = self._circuit((item[0], item[1]))
+            circuit.last_error = kind
+            was_probing = circuit.probing
+            circuit.probing = False
+            if kind is ErrorKind.CLIENT:
+                # 请求本身有问题，不归咎于该 (模型, 密钥)；半开状态下只归还探测名额，由下一个请求重新探测
+                return kind
+            circuit.failures += 1
+            immediate = kind in (ErrorKind.RATE_LIMIT, ErrorKind.AUTH)
+            if was_probing or immediate or circuit.failures >= self.failure_threshold:
+                self._trip(circuit, kind)
+        return kind
+
+    def _trip(self, circuit: _Circuit, kind: ErrorKind):
+        base = self.cooldowns.get(kind, self.cooldowns[ErrorKind.UNKNOWN])
+        cooldown = min(self.max_cooldown, base * (2 ** circuit.trips))
+        circuit.trips += 1
+        circuit.failures = 0
+        circuit.state = CircuitState.OPEN
+        circuit.open_until = self._clock() + cooldown
+
+    def snapshot(self) -> Dict[ItemIdentifier, Dict[str, Any]]:
+        """返回所有非健康项的状态，便于日志与调试。"""
+        now = self._clock()
+        with self._lock:
+            return {
+                identifier: {
+                    "state": self.state(identifier).value,
+                    "cooldown_remaining": max(0.0, circuit.open_until - now),
+                    "trips": circuit.trips,
+                    "last_error": circuit.last_error.value if circuit.last_error else None,
+                }
+                for identifier, circuit in self._circuits.items()
+                if circuit.state is not CircuitState.CLOSED
+            }
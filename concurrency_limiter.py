@@ -0,0 +1,183 @@
+# llm_framework/concurrency_limiter.py
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from circuit_breaker import ErrorKind
+from selection_strategy import ItemGate, PoolItem, ItemIdentifier
+
+
+class _AIMDLimit:
+    """一个 AIMD 并发上限：成功时加性增长，拥塞信号出现时乘性下降。"""
+    __slots__ = ("limit", "min_limit", "max_limit", "in_flight", "latency", "samples", "last_decrease")
+
+    def __init__(self, initial: float, min_limit: float, max_limit: float):
+        self.limit = float(initial)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.in_flight = 0
+        self.latency: Optional[float] = None    # 成功请求延迟的指数移动平均，作为延迟突增的基准
+        self.samples = 0
+        self.last_decrease = float("-inf")
+
+    def has_room(self) -> bool:
+        return self.in_flight < max(1, int(self.limit))
+
+    def increase(self, amount: float):
+        # 每个完整的并发窗口 (limit 个成功请求) 增长约 amount，与 TCP 拥塞避免相同
+        self.limit = min(self.max_limit, self.limit + amount / self.limit)
+
+    def decrease(self, factor: float, now: float, interval: float) -> bool:
+        """
+        乘性下降。同一批在途请求往往会接连报告同一次拥塞，interval 秒内只下降一次。
+        :return: 是否实际下降。
+        """
+        if now - self.last_decrease < interval:
+            return False
+        self.limit = max(self.min_limit, self.limit * factor)
+        self.last_decrease = now
+        return True
+
+    def observe(self, latency: float, alpha: float):
+        self.latency = latency if self.latency is None else self.latency + alpha * (latency - self.latency)
+        self.samples += 1
+
+
+class AdaptiveConcurrencyLimiter(ItemGate):
+    """
+    按 (模型, 密钥) 与按提供者两级的自适应并发上限 (AIMD)。
+
+    - 请求成功且该项的名额正在被充分使用时，上限加性增长 (每个并发窗口约 +increase)；
+    - 该 (模型, 密钥) 收到 429 时，密钥级上限乘以 backoff；提供者返回 5xx (过载) 时，提供者级上限乘以 backoff；
+    - 成功请求的延迟超过基准 (指数移动平均) 的 latency_tolerance 倍时，两级上限都乘以 latency_backoff；
+    - 在途请求数达到任一级上限的项对策略不可用，编排器短暂等待名额释放后再选择。
+    上限因此会逐步逼近每个密钥在当前时段实际能承受的并发，无需手工调参。
+    池元数据中的 max_concurrency / initial_concurrency 可覆盖单个项的上限与初始值，
+    提供者按元数据中的 provider 分组 (未配置时按模型名)。
+    """
+    def __init__(self, initial_limit: float = 4, min_limit: float = 1, max_limit: float = 64,
+                 provider_initial_limit: float = 32, provider_max_limit: float = 512,
+                 increase: float = 1.0, backoff: float = 0.5, latency_backoff: float = 0.9,
+                 latency_tolerance: float = 2.0, latency_alpha: float = 0.1, warmup: int = 10,
+                 poll_interval: float = 0.05, clock=time.monotonic):
+        """
+        :param initial_limit: 每个 (模型, 密钥) 的初始并发上限。
+        :param provider_initial_limit: 每个提供者 (所有密钥合计) 的初始并发上限。
+        :param increase: 每个并发窗口的加性增量。
+        :param backoff: 429 / 5xx 时的乘性下降系数。
+        :param latency_backoff: 延迟突增时的乘性下降系数，比 backoff 温和。
+        :param latency_tolerance: 延迟超过基准的多少倍视为突增。
+        :param latency_alpha: 延迟基准的指数移动平均系数。
+        :param warmup: 累计多少个成功样本后才开始判断延迟突增。
+        :param poll_interval: 所有候选项都没有并发名额时，编排器重新尝试选择前等待的秒数。
+        """
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.provider_initial_limit = provider_initial_limit
+        self.provider_max_limit = provider_max_limit
+        self.increase = increase
+        self.backoff = backoff
+        self.latency_backoff = latency_backoff
+        self.latency_tolerance = latency_tolerance
+        self.latency_alpha = latency_alpha
+        self.warmup = warmup
+        self.poll_interval = poll_interval
+        self._clock = clock
+        self._keys: Dict[ItemIdentifier, _AIMDLimit] = {}
+        self._providers: Dict[str, _AIMDLimit] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _provider(item: PoolItem) -> str:
+        return (item[2] or {}).get("provider") or item[0]
+
+    def _get_limits(self, item: PoolItem) -> Tuple[_AIMDLimit, _AIMDLimit]:
+        identifier = (item[0], item[1])
+        key_limit = self._keys.get(identifier)
+        if key_limit is None:
+            metadata = item[2] or {}
+            max_limit = metadata.get("max_concurrency", self.max_limit)
+            initial = min(metadata.get("initial_concurrency", self.initial_limit), max_limit)
+            key_limit = self._keys[identifier] = _AIMDLimit(initial, self.min_limit, max_limit)
+        provider = self._provider(item)
+        provider_limit = self._providers.get(provider)
+        if provider_limit is None:
+            provider_limit = self._providers[provider] = _AIMDLimit(
+                self.provider_initial_limit, self.min_limit, self.provider_max_limit
+            )
+        return key_limit, provider_limit
+
+    def is_available(self, item: PoolItem) -> bool:
+        """该项在两级上限下是否都还有空闲名额。"""
+        key_limit = self._keys.get((item[0], item[1]))
+        provider_limit = self._providers.get(self._provider(item))
+        return (key_limit is None or key_limit.has_room()) and (provider_limit is None or provider_limit.has_room())
+
+    def try_acquire(self, item: PoolItem) -> bool:
+        """原子地为该项占用一个名额；任一级已满则不占用并返回 False。"""
+        with self._lock:
+            key_limit, provider_limit = self._get_limits(item)
+            if not (key_limit.has_room() and provider_limit.has_room()):
+                return False
+            key_limit.in_flight += 1
+            provider_limit.in_flight += 1
+            return True
+
+    def cancel(self, item: PoolItem):
+        """归还名额而不反馈结果 (请求未真正发出，或被调用方放弃)。"""
+        with self._lock:
+            for limit in self._get_limits(item):
+                limit.in_flight = max(0, limit.in_flight - 1)
+
+    def release(self, item: PoolItem, latency: float, kind: Optional[ErrorKind] = None):
+        """
+        请求结束后归还名额并按结果调整上限。
+        :param latency: 成功请求的延迟 (流式调用为首块延迟)。
+        :param kind: 失败时的错误分类，成功时为 None。
+        """
+        now = self._clock()
+        with self._lock:
+            key_limit, provider_limit = self._get_limits(item)
+            for limit in (key_limit, provider_limit):
+                limit.in_flight = max(0, limit.in_flight - 1)
+            if kind is ErrorKind.RATE_LIMIT:
+                key_limit.decrease(self.backoff, now, self._decrease_interval(key_limit))
+            elif kind is ErrorKind.SERVER:
+                provider_limit.decrease(self.backoff, now, self._decrease_interval(provider_limit))
+            elif kind is None:
+                baseline = key_limit.latency
+                if key_limit.samples >= self.warmup and latency > baseline * self.latency_tolerance:
+                    for limit in (key_limit, provider_limit):
+                        limit.decrease(self.latency_backoff, now, self._decrease_interval(limit))
+                else:
+                    for limit in (key_limit, provider_limit):
+                        # 只有名额被充分使用时才增长，避免低负载下上限无限膨胀
+                        if (limit.in_flight + 1) * 2 >= limit.limit:
+                            limit.increase(self.increase)
+                for limit in (key_limit, provider_limit):
+                    limit.observe(latency, self.latency_alpha)
+
+    @staticmethod
+    def _decrease_interval(limit: _AIMDLimit) -> float:
+        # 约一个请求往返的时间：此前发出的请求报告的是同一次拥塞
+        return limit.latency or 0.0
+
+    def limit(self, item: PoolItem) -> int:
+        """该 (模型, 密钥) 当前的并发上限。"""
+        with self._lock:
+            return max(1, int(self._get_limits(item)[0].limit))
+
+    def snapshot(self) -> Dict[str, Dict[Any, Dict[str, Any]]]:
+        """所有密钥级与提供者级的当前上限、在途请求数与延迟基准。"""
+        def describe(limit: _AIMDLimit) -> Dict[str, Any]:
+            return {
+                "limit": round(limit.limit, 2),
+                "in_flight": limit.in_flight,
+                "latency_ms": None if limit.latency is None else limit.latency * 1000,
+            }
+
+        with self._lock:
+            return {
+                "keys": {identifier: describe(limit) for identifier, limit in self._keys.items()},
+                "providers": {provider: describe(limit) for provider, limit in self._providers.items()},
+            }
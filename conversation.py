@@ -0,0 +1,171 @@
+# llm_framework/conversation.py
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from token_counter import estimate_text_tokens, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "你负责压缩对话历史。请把“已有摘要”与“新增对话”合并为一份新的摘要：保留用户的目标、约束、偏好、"
+    "已确定的事实与结论、尚未解决的问题，以及后续回答需要引用的具体数据；省略寒暄与重复内容。"
+    "只输出摘要正文，使用与对话相同的语言。"
+)
+
+# 摘要以一对固定格式的消息放在历史最前面，系统提示词保持不变，以便继续命中服务端上下文缓存
+_SUMMARY_PREFIX = "以下是我们此前对话的摘要，请在后续回答中参考：\n"
+_SUMMARY_ACK = "好的，我已了解此前的对话内容。"
+
+
+class Conversation:
+    """
+    带状态的多轮对话：保存完整历史，但每轮只发送 token 预算之内的部分。
+
+    - 发送窗口 = 系统提示词 + 早期对话的摘要 + 最近的若干轮 + 本轮用户消息；
+    - 窗口的估算长度超过 budget_tokens 时，把最早的若干轮与已有摘要合并为新摘要 (增量压缩)，
+      一次压缩到 budget_tokens * compact_ratio 以下，之后多轮都无需再压缩；
+    - 摘要保存在会话中，只有新的轮次被移出窗口时才重新生成；摘要请求本身也经过编排器，
+      启用响应缓存时相同的压缩请求不会重复调用模型；
+    - 生成摘要失败时退化为普通的滑动窗口 (直接丢弃最早的轮次)，对话不中断。
+    每条消息的 token 估算只计算一次，因此每轮的开销与窗口大小而不是历史长度成正比。
+    """
+    def __init__(self, orchestrator: Callable[[], Any], system_prompt: str = "", budget_tokens: int = 4000,
+                 compact_ratio: float = 0.5, keep_turns: int = 2, summary_max_tokens: int = 512):
+        """
+        :param orchestrator: 返回编排器的函数 (如 ChatSession.get_orchestrator)，每轮调用一次，组件被替换后自动生效。
+        :param budget_tokens: 每轮发送的输入 token 预算 (估算值，含系统提示词与摘要)。
+        :param compact_ratio: 压缩后窗口占预算的比例，越小压缩越少发生、但每次保留的原文越少。
+        :param keep_turns: 压缩时至少保留原文的最近轮数 (一问一答为一轮)。
+        :param summary_max_tokens: 摘要的最大输出 token 数。
+        """
+        if not 0 < compact_ratio < 1:
+            raise ValueError("compact_ratio 必须在 (0, 1) 之间")
+        self._orchestrator = orchestrator
+        self.system_prompt = system_prompt
+        self.budget_tokens = budget_tokens
+        self.compact_ratio = compact_ratio
+        self.keep_turns = keep_turns
+        self.summary_max_tokens = summary_max_tokens
+        # 完整历史与每条消息的 token 估算
+        self.history: List[Dict[str, str]] = []
+        self._history_tokens: List[int] = []
+        # history[:window_start] 已被摘要覆盖，不再发送
+        self.window_start = 0
+        self.summary: Optional[str] = None
+        self._summary_tokens = 0
+        self._window_tokens = 0
+        self._system_tokens = estimate_text_tokens(system_prompt)
+        self.compactions = 0
+        self.last_turn: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    # --- 窗口 ---
+
+    def _summary_messages(self) -> List[Dict[str, str]]:
+        if not self.summary:
+            return []
+        return [
+            {"role": "user", "content": _SUMMARY_PREFIX + self.summary},
+            {"role": "assistant", "content": _SUMMARY_ACK},
+        ]
+
+    def window(self) -> List[Dict[str, str]]:
+        """当前会发送给模型的历史 (不含本轮用户消息)。"""
+        return self._summary_messages() + self.history[self.window_start:]
+
+    def window_tokens(self) -> int:
+        """当前窗口 (系统提示词 + 摘要 + 最近轮次) 的估算 token 数。"""
+        return self._system_tokens + self._summary_tokens + self._window_tokens
+
+    def _append(self, message: Dict[str, str]):
+        tokens = estimate_tokens([message])
+        self.history.append(message)
+        self._history_tokens.append(tokens)
+        self._window_tokens += tokens
+
+    def _compact(self, incoming_tokens: int):
+        """窗口加上本轮消息超出预算时，把最早的轮次并入摘要，直到低于预算的 compact_ratio。"""
+        if self.window_tokens() + incoming_tokens <= self.budget_tokens:
+            return
+        target = self.budget_tokens * self.compact_ratio
+        # 最近 keep_turns 轮 (每轮两条消息) 始终保留原文
+        last_movable = max(self.window_start, len(self.history) - 2 * self.keep_turns)
+        end = self.window_start
+        remaining = self.window_tokens() + incoming_tokens
+        while end < last_movable and remaining > target:
+            remaining -= self._history_tokens[end]
+            end += 1
+        # 以完整的一问一答为单位移出窗口，摘要之后的第一条总是用户消息 (last_movable 总是偶数)
+        if (end - self.window_start) % 2:
+            end += 1
+        if end <= self.window_start:
+            return
+        evicted = self.history[self.window_start:end]
+        summary = self._summarize(evicted)
+        if summary is not None:
+            self.summary = summary
+            self._summary_tokens = estimate_tokens(self._summary_messages())
+        else:
+            logger.warning("生成对话摘要失败，直接丢弃最早的 %d 条消息", len(evicted))
+        self._window_tokens -= sum(self._history_tokens[self.window_start:end])
+        self.window_start = end
+        self.compactions += 1
+
+    def _summarize(self, evicted: List[Dict[str, str]]) -> Optional[str]:
+        """把已有摘要与移出窗口的消息合并为新摘要，失败时返回 None。"""
+        transcript = "\n".join(
+            f"{'用户' if message['role'] == 'user' else '助手'}: {message['content']}" for message in evicted
+        )
+        prompt = f"已有摘要:\n{self.summary or '(无)'}\n\n新增对话:\n{transcript}"
+        result = self._orchestrator().chat(
+            [{"role": "user", "content": prompt}],
+            temperature=0.2,
+            max_tokens=self.summary_max_tokens,
+            system_prompt=SUMMARY_SYSTEM_PROMPT,
+        )
+        if result["status"] != "success" or not result.get("content"):
+            return None
+        return result["content"].strip()
+
+    # --- 对话 ---
+
+    def send(self, user_msg: str, temperature: float = 0.7, max_tokens: int = 1000) -> Dict[str, Any]:
+        """
+        发送一轮用户消息。成功时回复会加入历史；失败时本轮用户消息也不保留，调用方可以直接重试。
+        :return: 编排器的结果字典 (status / content / model 等)。
+        """
+        with self._lock:
+            started = time.monotonic()
+            message = {"role": "user", "content": user_msg}
+            incoming_tokens = estimate_tokens([message])
+            compactions = self.compactions
+            self._compact(incoming_tokens)
+            messages = self.window() + [message]
+            input_tokens = self.window_tokens() + incoming_tokens
+            result = self._orchestrator().chat(
+                messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                system_prompt=self.system_prompt,
+            )
+            if result["status"] == "success":
+                self._append(message)
+                self._append({"role": "assistant", "content": result["content"]})
+            self.last_turn = {
+                "input_tokens": input_tokens,
+                "latency": time.monotonic() - started,
+                "compacted": self.compactions != compactions,
+                "history_messages": len(self.history),
+            }
+            return result
+
+    def reset(self):
+        """清空历史与摘要。"""
+        with self._lock:
+            self.history.clear()
+            self._history_tokens.clear()
+            self.window_start = 0
+            self.summary = None
+            self._summary_tokens = 0
+            self._window_tokens = 0
@@ -0,0 +1,293 @@
+# llm_framework/dataset_io.py
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# 偏移索引文件头: 魔数, 源文件大小, 源文件 mtime_ns, 记录数, 源文件末尾 4KB 的 CRC32
+_INDEX_MAGIC = b"MLIDX001"
+_INDEX_HEADER = struct.Struct("<8sQQQI")
+_TAIL_BYTES = 4096
+
+
+def index_path(path: str) -> str:
+    return path + ".idx"
+
+
+def checkpoint_path(path: str) -> str:
+    return path + ".ckpt.json"
+
+
+def _tail_crc(data, size: int) -> int:
+    return zlib.crc32(data[max(0, size - _TAIL_BYTES):size])
+
+
+def _scan_offsets(data, start: int, end: int, offsets: array):
+    """把 [start, end) 范围内每一个换行符之后的行起始偏移追加到 offsets (不含 end)。"""
+    find = data.find
+    position = find(b"\n", start, end)
+    while position != -1 and position + 1 < end:
+        offsets.append(position + 1)
+        position = find(b"\n", position + 1, end)
+
+
+class JsonlIndex:
+    """
+    JSONL 文件的行偏移索引，保存在旁路文件 "<路径>.idx" 中。
+
+    offsets[i] 为第 i+1 行的起始字节偏移，末尾额外保存文件大小作为哨兵，
+    因此第 i 行的内容为 data[offsets[i-1]:offsets[i]]，记录总数与随机访问都是 O(1)。
+    索引头记录了源文件的大小、修改时间与末尾内容的校验和：大小与修改时间不变时直接复用；
+    源文件只是在末尾追加了完整的行时，只扫描新增部分；其他情况重建索引。
+    """
+    def __init__(self, offsets: array):
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @classmethod
+    def load_or_build(cls, path: str, data) -> "JsonlIndex":
+        """
+        :param data: 文件内容 (mmap 或 bytes)。
+        """
+        size = len(data)
+        mtime_ns = os.stat(path).st_mtime_ns
+        header, offsets = cls._load(path)
+        if header is not None:
+            old_size, old_mtime_ns, old_crc = header
+            if old_size == size and old_mtime_ns == mtime_ns:
+                return cls(offsets)
+            appended = old_size < size and (old_size == 0 or data[old_size - 1:old_size] == b"\n") \
+                and _tail_crc(data, old_size) == old_crc
+        else:
+            appended = False
+        if appended:
+            # 源文件在上次建索引后只追加了内容：旧的哨兵正是新增第一行的起始偏移，从这里继续扫描
+            start = offsets[-1]
+        else:
+            offsets = array("Q", [0])
+            start = 0
+        _scan_offsets(data, start, size, offsets)
+        if size:
+            offsets.append(size)
+        index = cls(offsets)
+        index._save(path, size, mtime_ns, _tail_crc(data, size))
+        return index
+
+    @staticmethod
+    def _load(path: str) -> Tuple[Optional[Tuple[int, int, int]], Optional[array]]:
+        try:
+            with open(index_path(path), "rb") as f:
+                magic, size, mtime_ns, count, crc = _INDEX_HEADER.unpack(f.read(_INDEX_HEADER.size))
+                offsets = array("Q")
+                offsets.frombytes(f.read())
+        except (OSError, struct.error, ValueError):
+            return None, None
+        if magic != _INDEX_MAGIC or len(offsets) != count + 1:
+            return None, None
+        return (size, mtime_ns, crc), offsets
+
+    def _save(self, path: str, size: int, mtime_ns: int, crc: int):
+        temp_path = index_path(path) + ".tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, size, mtime_ns, len(self), crc))
+                self.offsets.tofile(f)
+            os.replace(temp_path, index_path(path))
+        except OSError:
+            # 索引只是加速手段，目录不可写时仍可使用内存中的索引
+            pass
+
+
+class JsonlReader:
+    """
+    基于 mmap 与偏移索引的 JSONL 读取器。行号从 1 开始，与输出记录中的 line_number 一致。
+
+    - len(reader) 为 O(1)，不再为统计总行数而完整读一遍文件；
+    - reader.line(n) 随机读取第 n 行；
+    - reader.iter_lines(start=n) 直接从第 n 行开始迭代，断点续传无需逐行跳过已处理的部分。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # 空文件无法映射
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.index = JsonlIndex.load_or_build(path, self._data)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def line(self, line_number: int) -> str:
+        """第 line_number 行的内容 (含行尾换行符)。"""
+        if not 1 <= line_number <= len(self.index):
+            raise IndexError(f"行号超出范围: {line_number}")
+        offsets = self.index.offsets
+        return self._data[offsets[line_number - 1]:offsets[line_number]].decode("utf-8")
+
+    def iter_lines(self, start: int = 1) -> Iterator[Tuple[int, str]]:
+        """从第 start 行开始按顺序产出 (行号, 行内容)。"""
+        offsets = self.index.offsets
+        data = self._data
+        for line_number in range(max(1, start), len(self.index) + 1):
+            yield line_number, data[offsets[line_number - 1]:offsets[line_number]].decode("utf-8")
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _to_ranges(numbers: Iterable[int]) -> List[List[int]]:
+    ranges: List[List[int]] = []
+    for number in sorted(numbers):
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        elif not ranges or number > ranges[-1][1]:
+            ranges.append([number, number])
+    return ranges
+
+
+def _from_ranges(ranges: Iterable[List[int]]) -> Set[int]:
+    numbers: Set[int] = set()
+    for first, last in ranges:
+        numbers.update(range(first, last + 1))
+    return numbers
+
+
+def first_pending(processed: Set[int]) -> int:
+    """最小的尚未处理的行号，用于直接定位断点续传的起始行。"""
+    line_number = 1
+    while line_number in processed:
+        line_number += 1
+    return line_number
+
+
+class GroupCommitWriter:
+    """
+    JSONL 输出的组提交写入器。
+
+    记录先缓存在内存中，累计 flush_records 条或距上次提交超过 flush_interval 秒时，
+    一次性写入并 flush (可选 fsync)，随后以 "写临时文件 + os.replace" 的方式原子地更新检查点
+    "<路径>.ckpt.json"。检查点保存已提交的字节数与已完成记录的 key (按连续区间压缩)，
+    检查点中的内容一定已经完整写入输出文件；进程中断时最多丢失最后一组尚未提交的记录。
+    """
+    def __init__(self, path: str, append: bool = False, flush_records: int = 64, flush_interval: float = 2.0,
+                 fsync: bool = False, key: str = "line_number", committed: Optional[Set[int]] = None):
+        """
+        :param append: 追加到已有的输出文件，否则清空重写。
+        :param fsync: 每次提交时调用 os.fsync，防御断电而不仅是进程崩溃。
+        :param key: 记录中用于断点续传的字段。
+        :param committed: 续传时已完成的 key 集合，会一并写入检查点。
+        """
+        self.path = path
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.key = key
+        self.committed: Set[int] = set(committed or ()) if append else set()
+        # 二进制模式下 tell() 即为字节偏移，可直接作为检查点
+        self._file = open(path, "ab" if append else "wb")
+        self._buffer: List[str] = []
+        self._buffer_keys: List[Any] = []
+        self._last_commit = time.monotonic()
+        if not append:
+            self._write_checkpoint()
+
+    def write(self, record: Dict[str, Any]):
+        self._buffer.append(json.dumps(record, ensure_ascii=False) + "\n")
+        self._buffer_keys.append(record.get(self.key))
+        if len(self._buffer) >= self.flush_records or time.monotonic() - self._last_commit >= self.flush_interval:
+            self.commit()
+
+    def commit(self):
+        """写入缓存的记录并更新检查点。"""
+        self._last_commit = time.monotonic()
+        if not self._buffer:
+            return
+        self._file.write("".join(self._buffer).encode("utf-8"))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.committed.update(key for key in self._buffer_keys if key is not None)
+        self._buffer.clear()
+        self._buffer_keys.clear()
+        self._write_checkpoint()
+
+    def _write_checkpoint(self):
+        checkpoint = {"size": self._file.tell(), "committed": _to_ranges(self.committed)}
+        temp_path = checkpoint_path(self.path) + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, checkpoint_path(self.path))
+
+    def close(self):
+        try:
+            self.commit()
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _scan_output(path: str, start: int, key: str) -> Tuple[Set[int], int]:
+    """
+    从字节偏移 start 开始读取输出文件中完整的记录，返回 (其中的 key 集合, 最后一个完整行的结束偏移)。
+    进程中断时最后一行可能只写了一半，它不计入结果。
+    """
+    keys: Set[int] = set()
+    end = start
+    with open(path, "rb") as f:
+        f.seek(start)
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            end += len(raw)
+            try:
+                keys.add(json.loads(raw)[key])
+            except (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError):
+                continue
+    return keys, end
+
+
+def recover_output(path: str, key: str = "line_number") -> Set[int]:
+    """
+    断点续传前恢复输出文件：截掉末尾残留的半行，返回已完成记录的 key 集合。
+    有有效的检查点时只需读取检查点之后写入的部分；没有检查点 (旧版本的输出) 时扫描整个文件。
+    """
+    if not os.path.exists(path):
+        return set()
+    size = os.path.getsize(path)
+    committed: Set[int] = set()
+    start = 0
+    try:
+        with open(checkpoint_path(path), "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        if checkpoint["size"] <= size:
+            committed = _from_ranges(checkpoint["committed"])
+            start = checkpoint["size"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    keys, end = _scan_output(path, start, key)
+    if end < size:
+        with open(path, "rb+") as f:
+            f.truncate(end)
+    return committed | keys
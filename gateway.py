@@ -0,0 +1,365 @@
+# llm_framework/gateway.py
+"""
+本地 OpenAI 兼容网关：在一个进程中持有共享的模型池与编排器，通过 HTTP 对外提供 /v1/chat/completions (含 SSE 流式)。
+多个本地进程改为请求网关后，共享同一份密钥健康状态、限流与并发额度、每日额度账本以及提供者连接池。
+
+    POST /v1/chat/completions   OpenAI Chat Completions 格式，"stream": true 时以 SSE 返回
+    GET  /v1/models             池中的模型列表
+    GET  /health                熔断、并发上限与指标快照
+
+用法 (在项目根目录下运行):
+    python gateway.py --port 8000
+    curl http://127.0.0.1:8000/v1/chat/completions -H 'Content-Type: application/json' \
+        -d '{"model": "auto", "messages": [{"role": "user", "content": "你好"}], "stream": true}'
+
+只依赖标准库 asyncio，实现了 HTTP/1.1 的最小子集 (Content-Length 请求体、keep-alive、分块传输的流式响应)，
+只应监听本机地址。设置 MANYLLM_GATEWAY_TOKEN 后，请求需携带 "Authorization: Bearer <token>"。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from streaming import StreamRestart
+from token_counter import estimate_text_tokens, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 编排器在所有项都失败时，流式调用最后产出的错误文本的前缀
+_STREAM_ERROR_PREFIX = "ERROR: 所有可用选项都无法处理请求"
+_MAX_HEADER_BYTES = 64 * 1024
+_REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed",
+            411: "Length Required", 413: "Payload Too Large", 502: "Bad Gateway"}
+
+
+class GatewayError(Exception):
+    """以 OpenAI 错误格式返回给客户端的错误。"""
+    def __init__(self, status: int, message: str, error_type: str = "invalid_request_error"):
+        super().__init__(message)
+        self.status = status
+        self.error_type = error_type
+
+    def body(self) -> Dict[str, Any]:
+        return {"error": {"message": str(self), "type": self.error_type}}
+
+
+def _text(content: Any) -> str:
+    """OpenAI 消息的 content 可以是字符串，也可以是 [{"type": "text", "text": ...}] 形式的分段。"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return "" if content is None else str(content)
+
+
+def parse_chat_request(body: Dict[str, Any]) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    """
+    把 Chat Completions 请求转换为编排器的 (messages, 生成参数)。
+    system / developer 消息合并为 system_prompt，其余消息保留 user / assistant 角色。
+    """
+    raw_messages = body.get("messages")
+    if not isinstance(raw_messages, list) or not raw_messages:
+        raise GatewayError(400, "messages 必须是非空数组")
+    system_parts: List[str] = []
+    messages: List[Dict[str, str]] = []
+    for message in raw_messages:
+        if not isinstance(message, dict) or "role" not in message:
+            raise GatewayError(400, "messages 中的每一项都必须包含 role")
+        role = message["role"]
+        content = _text(message.get("content"))
+        if role in ("system", "developer"):
+            system_parts.append(content)
+        elif role in ("user", "assistant"):
+            messages.append({"role": role, "content": content})
+        else:
+            raise GatewayError(400, f"不支持的消息角色: {role}")
+    if not messages:
+        raise GatewayError(400, "messages 中至少需要一条 user 消息")
+    params: Dict[str, Any] = {}
+    if body.get("temperature") is not None:
+        params["temperature"] = body["temperature"]
+    max_tokens = body.get("max_completion_tokens", body.get("max_tokens"))
+    if max_tokens is not None:
+        params["max_tokens"] = max_tokens
+    if system_parts:
+        params["system_prompt"] = "\n\n".join(system_parts)
+    return messages, params
+
+
+class GatewayServer:
+    """
+    asyncio 实现的 OpenAI 兼容 HTTP 网关。
+    :param orchestrator_for: 接收请求中的 model，返回处理该请求的编排器；model 不在池中时应抛出 ValueError。
+                             通常为 ChatSession.get_orchestrator，所有编排器共享同一组健康状态、限流与连接。
+    :param models: /v1/models 返回的模型名列表。
+    :param token: 非空时要求请求携带该 Bearer 令牌。
+    :param status: 可选，返回 /health 附加内容的函数。
+    """
+    def __init__(self, orchestrator_for: Callable[[Optional[str]], Any], models: List[str],
+                 host: str = "127.0.0.1", port: int = 8000, token: Optional[str] = None,
+                 status: Optional[Callable[[], Dict[str, Any]]] = None, max_body_bytes: int = 8 * 1024 * 1024):
+        self.orchestrator_for = orchestrator_for
+        self.models = models
+        self.host = host
+        self.port = port
+        self.token = token
+        self.status = status
+        self.max_body_bytes = max_body_bytes
+        self.requests = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> "GatewayServer":
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # port=0 时由系统分配端口
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("网关已启动: http://%s:%d/v1", self.host, self.port)
+        return self
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # --- HTTP ---
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except GatewayError as e:
+                    # 请求的边界已无法确定，回复错误后关闭连接
+                    await self._send_json(writer, e.status, e.body(), keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._dispatch(method, path, headers, body, writer, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception:
+            logger.exception("处理网关连接时出错")
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        """读取一个请求；连接已关闭时返回 None，请求格式错误时抛出 GatewayError。"""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            raise GatewayError(413, "请求头过大")
+        if len(head) > _MAX_HEADER_BYTES:
+            raise GatewayError(413, "请求头过大")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise GatewayError(400, "无效的请求行")
+        headers: Dict[str, str] = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        body = b""
+        if "transfer-encoding" in headers:
+            raise GatewayError(411, "请求体需使用 Content-Length")
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise GatewayError(400, f"无效的 Content-Length: {headers['content-length']}")
+        if length > self.max_body_bytes:
+            raise GatewayError(413, "请求体过大")
+        if length:
+            body = await reader.readexactly(length)
+        return method.upper(), target.split("?", 1)[0], headers, body
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any], keep_alive: bool):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data
+        )
+        await writer.drain()
+
+    async def _dispatch(self, method: str, path: str, headers: Dict[str, str], body: bytes,
+                        writer: asyncio.StreamWriter, keep_alive: bool):
+        try:
+            if self.token and headers.get("authorization") != f"Bearer {self.token}":
+                raise GatewayError(401, "缺少或错误的 Bearer 令牌", "authentication_error")
+            if path == "/v1/chat/completions":
+                if method != "POST":
+                    raise GatewayError(405, "只支持 POST")
+                try:
+                    payload = json.loads(body or b"{}")
+                except ValueError:
+                    raise GatewayError(400, "请求体不是有效的 JSON")
+                if not isinstance(payload, dict):
+                    raise GatewayError(400, "请求体必须是 JSON 对象")
+                self.requests += 1
+                if payload.get("stream"):
+                    await self._chat_stream(payload, writer, keep_alive)
+                else:
+                    await self._send_json(writer, 200, await self._chat(payload), keep_alive)
+            elif path == "/v1/models" and method == "GET":
+                await self._send_json(writer, 200, {
+                    "object": "list",
+                    "data": [{"id": model, "object": "model", "owned_by": "manyllm"} for model in self.models],
+                }, keep_alive)
+            elif path == "/health" and method == "GET":
+                await self._send_json(writer, 200, dict(self.status() if self.status else {}, status="ok",
+                                                        requests=self.requests), keep_alive)
+            else:
+                raise GatewayError(404, f"未知的路径: {path}")
+        except GatewayError as e:
+            await self._send_json(writer, e.status, e.body(), keep_alive)
+
+    # --- Chat Completions ---
+
+    def _route(self, payload: Dict[str, Any]):
+        """model 为空或 "auto" 时使用整个池，否则只在该模型的 (模型, 密钥) 中故障切换。"""
+        model = payload.get("model")
+        try:
+            return self.orchestrator_for(None if model in (None, "", "auto") else model)
+        except ValueError as e:
+            raise GatewayError(404, f"模型不可用: {model} ({e})", "model_not_found")
+
+    async def _chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        messages, params = parse_chat_request(payload)
+        orchestrator = self._route(payload)
+        result = await orchestrator.achat(messages, **params)
+        if result["status"] != "success":
+            raise GatewayError(502, result["message"], "upstream_error")
+        prompt_tokens = estimate_tokens(messages, params.get("system_prompt"))
+        completion_tokens = estimate_text_tokens(result["content"])
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": result.get("model") or payload.get("model") or "auto",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": result["content"]},
+                "finish_reason": "stop",
+            }],
+            # 本地估算值，仅供参考
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    async def _chat_stream(self, payload: Dict[str, Any], writer: asyncio.StreamWriter, keep_alive: bool = True):
+        messages, params = parse_chat_request(payload)
+        orchestrator = self._route(payload)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = payload.get("model") or "auto"
+
+        def event(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> Dict[str, Any]:
+            return {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        # 流式响应使用分块传输编码，结束后连接仍可复用 (客户端要求关闭时除外)
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+            b"Cache-Control: no-cache\r\nTransfer-Encoding: chunked\r\n"
+            + (b"Connection: keep-alive\r\n\r\n" if keep_alive else b"Connection: close\r\n\r\n")
+        )
+        stream = orchestrator.achat_stream(messages, **params)
+        try:
+            await self._send_event(writer, event({"role": "assistant", "content": ""}))
+            async for chunk in stream:
+                if isinstance(chunk, StreamRestart):
+                    # OpenAI 格式无法表达“丢弃已输出内容”，网关的编排器应使用 stream_failover="continue"
+                    logger.warning("网关流式响应中途重启，客户端可能收到重复内容: %s", chunk)
+                    continue
+                if chunk.startswith(_STREAM_ERROR_PREFIX):
+                    await self._send_event(writer, {"error": {"message": chunk[len("ERROR: "):],
+                                                              "type": "upstream_error"}})
+                    break
+                await self._send_event(writer, event({"content": chunk}))
+            else:
+                await self._send_event(writer, event({}, "stop"))
+            await self._send_chunk(writer, b"data: [DONE]\n\n")
+            await self._send_chunk(writer, b"")
+        finally:
+            # 客户端中途断开时关闭上游流，编排器随之归还并发名额
+            await stream.aclose()
+
+    @staticmethod
+    async def _send_chunk(writer: asyncio.StreamWriter, data: bytes):
+        writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+        await writer.drain()
+
+    async def _send_event(self, writer: asyncio.StreamWriter, payload: Dict[str, Any]):
+        await self._send_chunk(writer, f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Many-LLM 本地 OpenAI 兼容网关")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址，默认只监听本机")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    from manyllm import ChatSession
+    session = ChatSession()
+
+    def masked(identifier: Tuple[str, str]) -> str:
+        return f"{identifier[0]}/...{identifier[1][-4:]}"
+
+    def status() -> Dict[str, Any]:
+        # 状态中的密钥只保留末四位
+        concurrency = session.concurrency.snapshot()
+        metrics = session.metrics.snapshot()
+        metrics["items"] = {masked(name.split("|", 1)): value for name, value in metrics.get("items", {}).items()}
+        return {
+            "circuits": {masked(identifier): state for identifier, state in session.health.snapshot().items()},
+            "concurrency": {
+                "keys": {masked(identifier): limit for identifier, limit in concurrency["keys"].items()},
+                "providers": concurrency["providers"],
+            },
+            "metrics": metrics,
+        }
+
+    models = sorted({item[0] for item in session.pool})
+    server = GatewayServer(session.get_orchestrator, models, host=args.host, port=args.port,
+                           token=os.getenv("MANYLLM_GATEWAY_TOKEN") or None, status=status)
+
+    async def run():
+        try:
+            await server.serve_forever()
+        finally:
+            await session.factory.aclose()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# llm_framework/hedging.py
+import math
+import threading
+from collections import defaultdict, deque
+from typing import Dict, Deque, Optional
+
+
+class HedgingPolicy:
+    """
+    对冲请求策略：首个请求在截止时间内仍未返回时，向另一个 (模型, 密钥) 发出备份请求，
+    先成功的结果胜出。
+
+    - 截止时间可以是固定值 (delay)，也可以取该模型观测到的延迟分位数 (默认 p95)；
+      样本不足 min_samples 时使用 default_delay。
+    - 额外请求受预算约束：对冲请求数不超过主请求数的 budget 倍 (例如 0.1 即最多多发 10%)。
+    """
+    def __init__(self, delay: Optional[float] = None, percentile: float = 0.95, budget: float = 0.1,
+                 default_delay: float = 10.0, min_samples: int = 20, window: int = 200):
+        if not 0 < percentile < 1:
+            raise ValueError("percentile 必须在 (0, 1) 之间")
+        self.delay = delay
+        self.percentile = percentile
+        self.budget = budget
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self.requests = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def hedge_delay(self, model_name: str) -> float:
+        """该模型的请求在多少秒内未返回就应发出对冲请求。"""
+        if self.delay is not None:
+            return self.delay
+        with self._lock:
+            samples = sorted(self._samples[model_name])
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        index = min(len(samples) - 1, math.ceil(self.percentile * len(samples)) - 1)
+        return samples[index]
+
+    def observe(self, model_name: str, latency: float):
+        """记录一次成功请求的延迟，用于计算分位数截止时间。"""
+        with self._lock:
+            self._samples[model_name].append(latency)
+
+    def on_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def can_hedge(self) -> bool:
+        """预算是否还允许再发一个对冲请求。"""
+        with self._lock:
+            return self.hedges + 1 <= self.budget * self.requests
+
+    def on_hedge(self):
+        with self._lock:
+            self.hedges += 1
@@ -1,28 +1,314 @@
 # llm_framework/llm_factory.py (重构后)
-from typing import Optional
+import fnmatch
+import importlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from importlib import metadata
+from typing import Optional, Dict, Any, Tuple, Callable, List, Type, Union, Set, Iterator
 from providers.base_provider import LLMProvider
-from providers.gemini_provider import GeminiProvider
-from providers.zhipuai_provider import ZhipuAIProvider
-from providers.cloudflare_provider import CloudflareProvider
-# from providers.openai_provider import OpenAIProvider
+from metrics import MetricsRecorder
+
+logger = logging.getLogger(__name__)
+
+# 缓存键: (model_name, api_key, 冻结后的构造配置)
+ProviderKey = Tuple[str, str, Tuple]
+
+# 第三方插件通过该入口点组注册提供者：入口点名称为模型名模式，值为 "模块:类"。
+# 例如在插件的 pyproject.toml 中:
+#   [project.entry-points."manyllm.providers"]
+#   "mistral-*" = "manyllm_mistral:MistralProvider"
+ENTRY_POINT_GROUP = "manyllm.providers"
+
+# 内置提供者: (模型名模式, "模块:类")。类在第一次匹配到时才导入，
+# 只使用某一家模型的进程不会加载其他厂商的 SDK。
+BUILTIN_PROVIDERS: List[Tuple[str, str]] = [
+    ("*gemini*", "providers.gemini_provider:GeminiProvider"),
+    ("*gemma*", "providers.gemini_provider:GeminiProvider"),
+    ("*glm*", "providers.zhipuai_provider:ZhipuAIProvider"),
+    ("*cloudflare*", "providers.cloudflare_provider:CloudflareProvider"),
+    ("@cf/*", "providers.cloudflare_provider:CloudflareProvider"),
+]
+
+ProviderTarget = Union[str, Type[LLMProvider]]
+
+
+def _matcher(pattern: Union[str, Callable[[str], bool]]) -> Callable[[str], bool]:
+    """
+    把模型名模式转换为匹配函数 (不区分大小写)。
+    含通配符 (*, ?, [) 的模式按 fnmatch 匹配整个模型名，否则按前缀匹配。
+    """
+    if callable(pattern):
+        return pattern
+    pattern = pattern.lower()
+    if any(char in pattern for char in "*?["):
+        return lambda model_name: fnmatch.fnmatchcase(model_name.lower(), pattern)
+    return lambda model_name: model_name.lower().startswith(pattern)
+
+
+class _ProviderEntry:
+    """注册表中的一项：匹配函数与延迟解析的提供者类。"""
+    __slots__ = ("matcher", "target", "source")
+
+    def __init__(self, pattern: Union[str, Callable[[str], bool]], target: ProviderTarget, source: str):
+        self.matcher = _matcher(pattern)
+        self.target = target
+        self.source = source
+
+    def resolve(self) -> Type[LLMProvider]:
+        """第一次解析时导入 "模块:类" 并缓存结果。"""
+        if isinstance(self.target, str):
+            module_name, _, attribute = self.target.partition(":")
+            provider_cls = getattr(importlib.import_module(module_name), attribute)
+            if not (isinstance(provider_cls, type) and issubclass(provider_cls, LLMProvider)):
+                raise TypeError(f"{self.source} 提供者 '{self.target}' 不是 LLMProvider 的子类")
+            self.target = provider_cls
+        return self.target
+
+
+def _freeze(value: Any) -> Any:
+    """把构造配置转换为可哈希的形式，用于缓存键。"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class _CacheEntry:
+    """缓存中的一个提供者及其当前的使用者数。"""
+    __slots__ = ("provider", "users", "pinned", "evicted")
+
+    def __init__(self, provider: LLMProvider, pinned: bool):
+        self.provider = provider
+        self.users = 1
+        # 经 get_or_create 取得的实例没有归还时机，被淘汰后也只在 close() 时关闭
+        self.pinned = pinned
+        self.evicted = False
+
+
+class ProviderCache:
+    """
+    按 (model_name, api_key, config) 缓存提供者实例的 LRU 缓存。
+    复用提供者即复用其底层客户端的 HTTP 连接池，避免每次请求都重新握手。
+
+    调用方通过 lease() 租用实例，用完归还。超出容量时淘汰最久未使用的实例：
+    没有使用者的立即关闭，仍有请求在用的等最后一个使用者归还后再关闭。
+    模型池是 密钥 × 模型 的组合，随机类策略会把请求分散到整个池上，容量应不小于池大小，
+    否则缓存会反复淘汰、重建，丢掉本该复用的连接；默认不限容量。
+    """
+    def __init__(self, max_size: Optional[int] = None):
+        if max_size is not None and max_size < 1:
+            raise ValueError("max_size 必须大于 0")
+        self.max_size = max_size
+        self._items: "OrderedDict[ProviderKey, _CacheEntry]" = OrderedDict()
+        # 已淘汰但仍有使用者的实例
+        self._evicted: Set[_CacheEntry] = set()
+        # 正在构造的键：其他线程等待同一个 Future，而不是重复构造
+        self._pending: Dict[ProviderKey, Future] = {}
+        self._lock = threading.Lock()
+
+    def _evict(self) -> List[LLMProvider]:
+        """在持有锁时淘汰超出容量的实例，返回可以立即关闭的提供者。"""
+        closable = []
+        while self.max_size is not None and len(self._items) > self.max_size:
+            _, entry = self._items.popitem(last=False)
+            if entry.users or entry.pinned:
+                entry.evicted = True
+                self._evicted.add(entry)
+            else:
+                closable.append(entry.provider)
+        return closable
+
+    def _acquire(self, key: ProviderKey, builder: Callable[[], LLMProvider], pinned: bool) -> _CacheEntry:
+        """
+        取得键对应的实例并登记一个使用者；未命中时调用 builder 创建。
+        builder 在锁外执行，构造较慢的 SDK 客户端不会阻塞其他键的查找；
+        同一个键并发未命中时只构造一次，构造失败时等待者收到同一个异常。
+        """
+        while True:
+            with self._lock:
+                entry = self._items.get(key)
+                if entry is not None:
+                    self._items.move_to_end(key)
+                    entry.users += 1
+                    entry.pinned = entry.pinned or pinned
+                    return entry
+                pending = self._pending.get(key)
+                building = pending is None
+                if building:
+                    pending = self._pending[key] = Future()
+            if not building:
+                pending.result()
+                continue
+
+            try:
+                provider = builder()
+            except BaseException as e:
+                with self._lock:
+                    del self._pending[key]
+                pending.set_exception(e)
+                raise
+            entry = _CacheEntry(provider, pinned)
+            with self._lock:
+                del self._pending[key]
+                self._items[key] = entry
+                closable = self._evict()
+            pending.set_result(None)
+            for old in closable:
+                old.close()
+            return entry
+
+    def _release(self, entry: _CacheEntry):
+        with self._lock:
+            entry.users -= 1
+            # close() 已经清空并关闭了它时 entry 不在 _evicted 中
+            if entry.users or entry.pinned or entry not in self._evicted:
+                return
+            self._evicted.remove(entry)
+        entry.provider.close()
+
+    @contextmanager
+    def lease(self, key: ProviderKey, builder: Callable[[], LLMProvider]) -> Iterator[LLMProvider]:
+        """租用键对应的实例，退出时归还；实例在租用期间被淘汰时，由最后一个使用者归还时关闭。"""
+        entry = self._acquire(key, builder, pinned=False)
+        try:
+            yield entry.provider
+        finally:
+            self._release(entry)
+
+    def get_or_create(self, key: ProviderKey, builder: Callable[[], LLMProvider]) -> LLMProvider:
+        """
+        命中则返回缓存的实例，否则调用 builder 创建并放入缓存。
+        返回的实例没有归还时机，被淘汰后不会被关闭，直到 close()；需要按容量回收的调用方应使用 lease()。
+        """
+        return self._acquire(key, builder, pinned=True).provider
+
+    def _drain(self) -> List[LLMProvider]:
+        with self._lock:
+            providers = [entry.provider for entry in self._items.values()]
+            providers += [entry.provider for entry in self._evicted]
+            self._items.clear()
+            self._evicted.clear()
+        return providers
+
+    def close(self):
+        """关闭并清空所有缓存的提供者 (含已淘汰但仍在使用的实例)。"""
+        for provider in self._drain():
+            provider.close()
+
+    async def aclose(self):
+        """异步关闭并清空所有缓存的提供者，同时释放它们的异步连接池。"""
+        for provider in self._drain():
+            await provider.aclose()
+
+    def __len__(self):
+        return len(self._items)
+
 
 class LLMFactory:
-    @staticmethod
-    def get_provider(model_name: str, api_key: str) -> Optional[LLMProvider]:
+    """
+    提供者工厂。同一个 (模型, 密钥, 配置) 在工厂的生命周期内只创建一次提供者，
+    连接在多次请求与故障切换之间保持复用。
+    """
+    # 显式注册的提供者，优先于入口点插件与内置规则匹配
+    _registered: List[_ProviderEntry] = []
+    _builtin: List[_ProviderEntry] = [_ProviderEntry(pattern, target, "内置") for pattern, target in BUILTIN_PROVIDERS]
+    _plugins: Optional[List[_ProviderEntry]] = None
+    _plugins_lock = threading.Lock()
+
+    def __init__(self, max_cached_providers: Optional[int] = None, metrics: Optional[MetricsRecorder] = None):
+        """
+        :param max_cached_providers: 最多缓存的提供者实例数，超出时淘汰最久未使用的实例；默认不限，设置时应不小于模型池大小。
+        :param metrics: 可选的指标记录器，记录提供者的构造次数与耗时。
+        """
+        self.cache = ProviderCache(max_size=max_cached_providers)
+        self.metrics = metrics
+
+    @classmethod
+    def register_provider(cls, matcher: Union[str, Callable[[str], bool]], provider_cls: ProviderTarget):
+        """
+        注册一个提供者类。
+        :param matcher: 模型名模式 (含通配符时按 fnmatch 匹配，否则为前缀)，或接收模型名并返回是否匹配的函数。
+        :param provider_cls: 以 (model_name=..., api_key=..., **config) 构造的 LLMProvider 子类，
+                             或 "模块:类" 字符串 (第一次匹配到时才导入)。
+        """
+        cls._registered.append(_ProviderEntry(matcher, provider_cls, "注册的"))
+
+    @classmethod
+    def _plugin_entries(cls) -> List[_ProviderEntry]:
+        """第一次需要时读取入口点插件。只读取元数据，插件模块同样在第一次匹配到时才导入。"""
+        if cls._plugins is None:
+            with cls._plugins_lock:
+                if cls._plugins is None:
+                    entries = []
+                    try:
+                        entry_points = metadata.entry_points(group=ENTRY_POINT_GROUP)
+                    except Exception as e:
+                        logger.warning("读取提供者插件入口点失败: %s", e)
+                        entry_points = ()
+                    for entry_point in entry_points:
+                        entries.append(_ProviderEntry(entry_point.name, entry_point.value, f"插件 {entry_point.name}"))
+                    cls._plugins = entries
+        return cls._plugins
+
+    @classmethod
+    def resolve_provider_class(cls, model_name: str) -> Type[LLMProvider]:
+        """
+        按 显式注册 → 入口点插件 → 内置规则 的顺序查找第一个匹配该模型名的提供者类。
         """
-        根据模型名称和传入的API密钥获取相应的LLM提供者实例。
+        for entries in (cls._registered, cls._plugin_entries(), cls._builtin):
+            for entry in entries:
+                if entry.matcher(model_name):
+                    return entry.resolve()
+        raise ValueError(f"不支持的模型或未在工厂中注册: {model_name}")
+
+    @classmethod
+    def create_provider(cls, model_name: str, api_key: str, **config) -> Optional[LLMProvider]:
+        """
+        根据模型名称和传入的API密钥创建新的LLM提供者实例 (不经过缓存)。
+        """
+        if not api_key:
+            raise ValueError("API Key 不能为空")
+        provider_cls = cls.resolve_provider_class(model_name)
+        return provider_cls(model_name=model_name, api_key=api_key, **config)
+
+    def get_provider(self, model_name: str, api_key: str, **config) -> Optional[LLMProvider]:
+        """
+        根据模型名称和传入的API密钥获取相应的LLM提供者实例，优先从缓存中复用。
+        以这种方式取得的实例在工厂关闭前一直有效 (不会因淘汰被关闭)；逐次请求的调用方应使用 lease()。
+        :param config: 提供者的构造参数 (如 system_prompt, thinking)，参与缓存键的计算。
         """
         if not api_key:
             raise ValueError("API Key 不能为空")
+        key = (model_name, api_key, _freeze(config))
+        return self.cache.get_or_create(key, lambda: self._build(model_name, api_key, **config))
+
+    def lease(self, model_name: str, api_key: str, **config):
+        """
+        租用提供者实例，用于一次请求：with factory.lease(model, key) as provider: ...
+        实例在租用期间被淘汰时，等所有租用者归还后才关闭，不会打断在途的请求。
+        """
+        if not api_key:
+            raise ValueError("API Key 不能为空")
+        key = (model_name, api_key, _freeze(config))
+        return self.cache.lease(key, lambda: self._build(model_name, api_key, **config))
+
+    def _build(self, model_name: str, api_key: str, **config) -> Optional[LLMProvider]:
+        if self.metrics is None:
+            return self.create_provider(model_name, api_key, **config)
+        started = time.perf_counter()
+        provider = self.create_provider(model_name, api_key, **config)
+        self.metrics.on_provider_created(model_name, time.perf_counter() - started)
+        return provider
+
+    def close(self):
+        """关闭工厂缓存的所有提供者及其连接。"""
+        self.cache.close()
 
-        if "gemini" in model_name.lower() or "gemma" in model_name.lower():
-            return GeminiProvider(model_name=model_name, api_key=api_key)
-        elif "glm" in model_name.lower():
-            return ZhipuAIProvider(model_name=model_name, api_key=api_key)
-        elif "cloudflare" in model_name.lower() or "@cf/" in model_name.lower():
-            return CloudflareProvider()
-        # elif "gpt" in model_name.lower():
-        #     return OpenAIProvider(model_name=model_name, api_key=api_key)
-        
-        else:
-            raise ValueError(f"不支持的模型或未在工厂中注册: {model_name}")
\ No newline at end of file
+    async def aclose(self):
+        """异步关闭工厂缓存的所有提供者及其同步/异步连接。"""
+        await self.cache.aclose()
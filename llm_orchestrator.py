@@ -1,20 +1,347 @@
 # llm_framework/llm_orchestrator.py
-# ... __init__ 和 chat 方法不变 ...
-# llm_framework/llm_orchestrator.py
-from typing import List, Dict, Any, Generator
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Generator, AsyncGenerator, Optional, Set, Tuple, Union
 from llm_factory import LLMFactory
 from selection_strategy import SelectionStrategy, PoolItem, ItemIdentifier
+from model_pool import ModelPool, SkipSet
+from circuit_breaker import HealthTracker, ErrorKind, classify_error
+from rate_limiter import RateLimiter
+from quota_ledger import QuotaLedger
+from concurrency_limiter import AdaptiveConcurrencyLimiter
+from token_counter import ContextWindowIndex, ContextOverflowError, estimate_tokens, estimate_text_tokens
+from hedging import HedgingPolicy
+from response_cache import ResponseCache
+from streaming import StreamRestart, iter_with_timeouts, aiter_with_timeouts
+from metrics import MetricsRecorder
+from single_flight import SingleFlight, request_key
+from output_validator import Validator, OutputRejected
+
+logger = logging.getLogger(__name__)
+
+
+class _HedgeAttempt:
+    """对冲模式下一次已派发的尝试。started 在执行线程真正开始调用时更新。"""
+    __slots__ = ("item", "identifier", "started", "began")
+
+    def __init__(self, item: PoolItem):
+        self.item = item
+        self.identifier: ItemIdentifier = (item[0], item[1])
+        self.started = time.monotonic()
+        self.began = threading.Event()
+
 
 class LLMOrchestrator:
     """
     模型编排器，负责根据优先级列表调用模型，并处理故障切换。
     """
-    def __init__(self, pool: List[PoolItem], strategy: SelectionStrategy):
+    def __init__(self, pool: Union[ModelPool, List[PoolItem]], strategy: SelectionStrategy, factory: Optional[LLMFactory] = None,
+                 health: Optional[HealthTracker] = None, rate_limiter: Optional[RateLimiter] = None,
+                 hedging: Optional[HedgingPolicy] = None, cache: Optional[ResponseCache] = None,
+                 first_token_timeout: Optional[float] = None, stall_timeout: Optional[float] = None,
+                 stream_failover: str = "continue", metrics: Optional[MetricsRecorder] = None,
+                 single_flight: Optional[SingleFlight] = None, quota: Optional[QuotaLedger] = None,
+                 concurrency: Optional[AdaptiveConcurrencyLimiter] = None, validator: Optional[Validator] = None):
+        """
+        :param pool: 模型密钥池。普通列表会在构造时包装为带索引的 ModelPool；
+                     多个编排器共享同一个 ModelPool 时，也共享其中的屏蔽状态。
+        :param factory: 可选的共享工厂。传入后多个编排器可复用同一批提供者与连接；
+                        未传入时编排器自建工厂，并在 close() 时负责关闭。
+        :param health: 可选的跨请求健康状态 (熔断器)。传入后会注册为策略的关卡，
+                       处于熔断冷却中的 (模型, 密钥) 在选择阶段就会被跳过。
+        :param rate_limiter: 可选的 RPM/TPM 限流器。派发前先预留额度，优先选择仍有额度的项；
+                             全部项都没有额度时等待最早的令牌补充。
+        :param hedging: 可选的对冲策略。chat 的请求超过截止时间未返回时，
+                        向另一项发出备份请求，先成功者胜出。
+        :param cache: 可选的持久化响应缓存。chat/achat 命中时直接返回缓存结果，不发起任何调用。
+        :param first_token_timeout: 流式调用等待首个文本块的最长秒数，超时视为该项失败。
+        :param stall_timeout: 流式调用两个文本块之间的最长停顿秒数，超时视为该项失败。
+        :param stream_failover: 流式调用中途失败时的处理方式。
+                                "continue": 把已输出的部分作为 assistant 前缀交给下一项续写，消费者不会收到重复内容；
+                                "restart": 先产出一个 StreamRestart 信号，再由下一项从头生成。
+        :param metrics: 可选的指标记录器。记录每次选择的耗时、每次网络调用的结果、错误类别与延迟、
+                        流式首块延迟与输出速率，以及每个请求的故障切换深度。
+        :param single_flight: 可选的在途请求合并器。消息与参数完全相同的确定性请求 (temperature 为 0)
+                              同时在途时只派发一次，其余调用者等待同一个结果，流式调用则收到领头者输出的完整副本。
+                              合并发生在缓存之前，与缓存可以同时使用。
+        :param quota: 可选的持久化每日额度账本。传入后会注册为策略的关卡，
+                      每日额度已耗尽的 (模型, 密钥) 在额度重置前不再被选择，进程重启后依然有效。
+        :param concurrency: 可选的自适应并发上限 (AIMD)。派发前为选中的项占用名额，
+                            在途请求数达到上限的项被跳过；所有候选项都满时等待名额释放。
+        :param validator: 可选的输出校验器 (接收输出文本，通过时返回 None，否则返回拒绝原因)。
+                          chat/achat 的输出被拒绝时立即换一项重试，优先转向元数据中 quality 更高的项；
+                          缓存中未通过校验的结果视为未命中。流式输出已经产出给消费者，不做校验。
+        """
+        if stream_failover not in ("continue", "restart"):
+            raise ValueError(f"不支持的 stream_failover: {stream_failover}")
         if not pool:
             raise ValueError("模型密钥池不能为空")
-        self.pool = pool
+        self.pool = ModelPool.of(pool)
+        # 按上下文窗口分组：派发前跳过放不下请求的模型，并把 max_tokens 限制在剩余空间之内
+        self.context = ContextWindowIndex(self.pool)
         self.strategy = strategy
-        self.factory = LLMFactory()
+        self.metrics = metrics
+        self._owns_factory = factory is None
+        self.factory = factory if factory is not None else LLMFactory(metrics=metrics)
+        self.health = health
+        if health is not None:
+            strategy.add_gate(health)
+        self.rate_limiter = rate_limiter
+        if rate_limiter is not None:
+            strategy.add_gate(rate_limiter)
+        self.quota = quota
+        if quota is not None:
+            strategy.add_gate(quota)
+        self.concurrency = concurrency
+        if concurrency is not None:
+            strategy.add_gate(concurrency)
+        self.hedging = hedging
+        # 对冲请求的执行线程池在构造时创建，避免并发的首次调用各自创建而泄漏
+        self._hedge_executor: Optional[ThreadPoolExecutor] = (
+            ThreadPoolExecutor(thread_name_prefix="llm-hedge") if hedging is not None else None
+        )
+        self.cache = cache
+        self.first_token_timeout = first_token_timeout
+        self.stall_timeout = stall_timeout
+        self.stream_failover = stream_failover
+        self.single_flight = single_flight
+        self.validator = validator
+
+    def close(self):
+        """释放编排器自建工厂中缓存的提供者连接。"""
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        if self._owns_factory:
+            self.factory.close()
+
+    async def aclose(self):
+        """异步版本的 close()，同时释放异步客户端的连接池。"""
+        if self._owns_factory:
+            await self.factory.aclose()
+
+    def _try_select(self, failed_items: set, request_tokens: int) -> Tuple[Optional[PoolItem], Optional[float]]:
+        """
+        向策略请求下一个要尝试的项，并为其预留限流额度。
+        :return: (选中的项, None)；无项可选时返回 (None, 需等待的秒数)，
+                 等待秒数为 None 表示即使等待也没有可用项。
+        """
+        excluded = self.context.excluded(request_tokens)
+        skipped = SkipSet(failed_items, excluded) if excluded else failed_items
+        while True:
+            if self.metrics is None:
+                selected_item = self.strategy.select(self.pool, skipped)
+            else:
+                select_started = time.perf_counter()
+                selected_item = self.strategy.select(self.pool, skipped)
+                self.metrics.on_select(time.perf_counter() - select_started, selected_item)
+            if selected_item is None:
+                return None, self._rate_limit_wait(failed_items, request_tokens)
+            if self._acquire(selected_item, request_tokens):
+                if self.health is not None:
+                    self.health.on_dispatch(selected_item)
+                return selected_item, None
+            # 并发请求抢先占用了额度或名额，本轮跳过该项
+            if skipped is failed_items:
+                skipped = SkipSet(failed_items)
+            skipped.add((selected_item[0], selected_item[1]))
+
+    def _acquire(self, item: PoolItem, request_tokens: int) -> bool:
+        """为选中的项占用并发名额并预留限流额度；任一不足时都不占用。"""
+        if self.concurrency is not None and not self.concurrency.try_acquire(item):
+            return False
+        if self.rate_limiter is not None and not self.rate_limiter.try_acquire(item, request_tokens):
+            if self.concurrency is not None:
+                self.concurrency.cancel(item)
+            return False
+        return True
+
+    def _rate_limit_wait(self, failed_items: set, request_tokens: int) -> Optional[float]:
+        """
+        所有项都不可选时，计算仅因限流或并发名额已满而不可用的项中最早可能恢复的等待时间。
+        """
+        if self.rate_limiter is None and self.concurrency is None:
+            return None
+        waiting_gates = (self.rate_limiter, self.concurrency)
+        other_gates = [gate for gate in self.strategy.gates if gate not in waiting_gates]
+        excluded = self.context.excluded(request_tokens)
+        waits = []
+        for item in self.pool:
+            if (item[0], item[1]) in failed_items or (item[0], item[1]) in excluded \
+                    or not all(gate.is_available(item) for gate in other_gates):
+                continue
+            wait = 0.0 if self.rate_limiter is None else self.rate_limiter.wait_time(item, request_tokens)
+            if self.concurrency is not None and not self.concurrency.is_available(item):
+                # 名额何时释放无法预知，短暂等待后重新选择
+                wait = max(wait, self.concurrency.poll_interval)
+            waits.append(wait)
+        if not waits:
+            return None
+        wait = min(waits)
+        if self.rate_limiter is not None and wait > self.rate_limiter.max_wait:
+            return None
+        # 令牌按连续速率补充，略微多等一点以免浮点误差导致再次扑空
+        return wait + 0.01
+
+    def _select(self, failed_items: set, request_tokens: int = 0) -> Optional[PoolItem]:
+        """同步选择；所有项都被限流时阻塞等待令牌补充。"""
+        while True:
+            selected_item, wait = self._try_select(failed_items, request_tokens)
+            if selected_item is not None or wait is None:
+                return selected_item
+            logger.info("所有可用项均已达到速率限制，等待 %.2fs", wait)
+            time.sleep(wait)
+
+    async def _aselect(self, failed_items: set, request_tokens: int = 0) -> Optional[PoolItem]:
+        """异步选择；等待令牌补充时不阻塞事件循环。"""
+        while True:
+            selected_item, wait = self._try_select(failed_items, request_tokens)
+            if selected_item is not None or wait is None:
+                return selected_item
+            await asyncio.sleep(wait)
+
+    def _record_success(self, item: PoolItem, started: float, output_tokens: int = 0,
+                        stream: bool = False, ttft: Optional[float] = None, chunks: int = 0):
+        latency = time.monotonic() - started
+        self.strategy.record_outcome(item, True, latency)
+        if self.metrics is not None:
+            self.metrics.on_attempt(item, latency, None, stream=stream, ttft=ttft,
+                                    chunks=chunks, tokens=output_tokens)
+        if self.health is not None:
+            self.health.record_success(item)
+        if self.rate_limiter is not None:
+            self.rate_limiter.commit(item, output_tokens)
+        if self.quota is not None:
+            self.quota.record_success(item)
+        if self.concurrency is not None:
+            self.concurrency.release(item, ttft if stream and ttft is not None else latency)
+
+    def _record_failure(self, item: PoolItem, started: float, error: Exception, failed_items: set,
+                        stream: bool = False, ttft: Optional[float] = None):
+        # 将失败的项加入集合，以便策略下次选择时跳过
+        failed_items.add((item[0], item[1]))
+        latency = time.monotonic() - started
+        self.strategy.record_outcome(item, False, latency)
+        kind = self.health.record_failure(item, error) if self.health is not None else None
+        if kind is None and (self.rate_limiter is not None or self.quota is not None
+                             or self.concurrency is not None or self.metrics is not None):
+            kind = classify_error(error)
+        if self.rate_limiter is not None and kind is ErrorKind.RATE_LIMIT:
+            self.rate_limiter.penalize(item)
+        if self.quota is not None and kind is ErrorKind.RATE_LIMIT:
+            self.quota.record_failure(item, error)
+        if self.concurrency is not None:
+            self.concurrency.release(item, latency, kind)
+        if self.metrics is not None:
+            self.metrics.on_attempt(item, latency, kind.value, stream=stream, ttft=ttft)
+        logger.warning("调用失败: 模型=%s, Key=...%s, 错误: %s", item[0], item[1][-4:], error)
+
+    def _record_abandoned(self, item: PoolItem):
+        """调用方放弃了请求 (流被提前关闭、任务被取消)，没有可供反馈的结果，只归还并发名额。"""
+        if self.concurrency is not None:
+            self.concurrency.cancel(item)
+
+    def _record_cancelled(self, item: PoolItem, request_tokens: int):
+        """请求在发出前就被取消 (排队中的对冲请求)：归还选择时占用的并发名额、探测名额与限流额度。"""
+        self._record_abandoned(item)
+        if self.health is not None:
+            self.health.cancel_dispatch(item)
+        if self.rate_limiter is not None:
+            self.rate_limiter.refund(item, request_tokens)
+
+    def _check_output(self, item: PoolItem, response_text: str, failed_items: set,
+                      rejected: Set[ItemIdentifier]) -> Optional[OutputRejected]:
+        """
+        用校验器检查一次成功调用的输出并记录结果。被拒绝时该项计为一次失败的尝试，
+        不比它更好的项加入 rejected，本次请求的后续选择会跳过它们。
+        :return: 被拒绝时返回 OutputRejected，通过或未配置校验器时返回 None。
+        """
+        if self.validator is None:
+            return None
+        reason = self.validator(response_text)
+        if self.metrics is not None:
+            self.metrics.on_validation(item, reason)
+        if reason is None:
+            return None
+        failed_items.add((item[0], item[1]))
+        rejected.update(self._reroute_exclusions(item, failed_items, rejected))
+        error = OutputRejected(item[0], reason)
+        logger.warning("%s (Key=...%s)，换一项重试", error, item[1][-4:])
+        return error
+
+    def _reroute_exclusions(self, item: PoolItem, failed_items: set,
+                            rejected: Set[ItemIdentifier]) -> Set[ItemIdentifier]:
+        """
+        输出被拒绝后本次请求不再尝试的项。元数据配置了 quality (数值越大质量越高) 时，
+        只要还有未尝试过的更高质量的项，就排除所有质量不高于被拒绝项的项；
+        否则只排除同一模型的其他密钥 (同一模型换一个密钥通常会给出同样不合格的输出)。
+        """
+        quality = (item[2] or {}).get("quality", 0)
+        not_better = set()
+        has_better = False
+        for candidate in self.pool:
+            identifier = (candidate[0], candidate[1])
+            if (candidate[2] or {}).get("quality", 0) <= quality:
+                not_better.add(identifier)
+            elif identifier not in failed_items and identifier not in rejected:
+                has_better = True
+        if has_better:
+            return not_better
+        return {(candidate[0], candidate[1]) for candidate in self.pool if candidate[0] == item[0]}
+
+    @staticmethod
+    def _skipping(failed_items: set, rejected: Set[ItemIdentifier]):
+        """选择时要跳过的项：失败过的项，以及因输出被拒绝而排除的项。"""
+        return SkipSet(failed_items, rejected) if rejected else failed_items
+
+    def _accepts(self, result: Dict[str, Any]) -> bool:
+        """缓存中的结果是否仍能通过当前的校验器。"""
+        return self.validator is None or self.validator(result["content"]) is None
+
+    def _on_dispatch(self, item: PoolItem, mode: str = ""):
+        logger.debug("策略选择%s: 模型=%s, 元数据=%s, Key=...%s", mode, item[0], item[2], item[1][-4:])
+
+    def _finish(self, result: Dict[str, Any], attempts: int, started: float) -> Dict[str, Any]:
+        """记录一个请求的最终结果与故障切换深度。"""
+        if self.metrics is not None:
+            self.metrics.on_request(result["status"], attempts, time.monotonic() - started,
+                                    cached=bool(result.get("cached")), coalesced=bool(result.get("coalesced")))
+        if result["status"] != "success":
+            logger.error("%s", result["message"])
+        return result
+
+    @staticmethod
+    def _success_result(item: PoolItem, response_text: str) -> Dict[str, Any]:
+        model_name, api_key, metadata = item
+        return {
+            "status": "success",
+            "model": model_name,
+            "key_used": f"...{api_key[-4:]}",
+            "metadata": metadata,
+            "content": response_text
+        }
+
+    def _fit(self, item: PoolItem, request_tokens: int, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """按该项的输出上限与剩余上下文调整 max_tokens，未调整时原样返回 kwargs。"""
+        max_tokens = self.context.fit_max_tokens(item, request_tokens, kwargs.get("max_tokens"))
+        if max_tokens == kwargs.get("max_tokens"):
+            return kwargs
+        return dict(kwargs, max_tokens=max_tokens)
+
+    def _exhausted(self, last_exception: Optional[Exception], request_tokens: int) -> Dict[str, Any]:
+        """没有可用项时的错误结果；请求放不进任何模型时直接说明原因，而不是报告空的最后错误。"""
+        if last_exception is None and self.context.fits_nowhere(request_tokens):
+            last_exception = ContextOverflowError(request_tokens, self.context.largest_window)
+        return self._error_result(last_exception)
+
+    @staticmethod
+    def _error_result(last_exception: Optional[Exception]) -> Dict[str, Any]:
+        return {
+            "status": "error",
+            "message": f"所有可用选项都无法处理请求。最后一个错误: {last_exception}"
+        }
 
     def chat(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
         """
@@ -23,12 +350,43 @@ class LLMOrchestrator:
         :param kwargs: 其他生成参数。
         :return: 一个包含成功模型和其回复的字典，或者一个错误信息。
         """
-        failed_items: set[ItemIdentifier] = set()
+        if self.single_flight is None or not self.single_flight.applies(kwargs):
+            return self._chat_cached(messages, **kwargs)
+        started = time.monotonic()
+        result, leader = self.single_flight.do(request_key(messages, kwargs),
+                                               lambda: self._chat_cached(messages, **kwargs))
+        return result if leader else self._coalesced(result, started)
+
+    def _coalesced(self, result: Dict[str, Any], started: float) -> Dict[str, Any]:
+        """跟随者拿到的是领头者结果的浅拷贝，并带上 coalesced 标记。"""
+        return self._finish(dict(result, coalesced=True), 0, started)
+
+    def _chat_cached(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        if self.cache is None:
+            return self._chat_uncached(messages, **kwargs)
+        started = time.monotonic()
+        cache_key = self.cache.make_key(messages, kwargs)
+        cached = self.cache.get(cache_key)
+        if cached is not None and self._accepts(cached):
+            return self._finish(cached, 0, started)
+        result = self._chat_uncached(messages, **kwargs)
+        if result["status"] == "success":
+            self.cache.put(cache_key, result)
+        return result
+
+    def _chat_uncached(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        request_tokens = estimate_tokens(messages, kwargs.get("system_prompt"))
+        if self.hedging is not None:
+            return self._chat_hedged(messages, request_tokens, **kwargs)
+
+        failed_items: Set[ItemIdentifier] = self.pool.item_set()
+        rejected: Set[ItemIdentifier] = self.pool.item_set()
         last_exception = None
+        request_started = time.monotonic()
 
         while True:
             # 向策略请求下一个要尝试的项
-            selected_item = self.strategy.select(self.pool, failed_items)
+            selected_item = self._select(self._skipping(failed_items, rejected), request_tokens)
 
             # 如果策略返回None，说明所有选项都已尝试失败
             if selected_item is None:
@@ -36,54 +394,324 @@ class LLMOrchestrator:
             
             model_name, api_key, metadata = selected_item
             
+            started = time.monotonic()
             try:
-                print(f"--- 策略选择: 模型={model_name}, 元数据={metadata}, Key=...{api_key[-4:]} ---")
-                provider = self.factory.get_provider(model_name, api_key)
-                response_text = provider.chat(messages, **kwargs)
-                
-                print(f"--- 调用成功! ---")
-                return {
-                    "status": "success",
-                    "model": model_name,
-                    "key_used": f"...{api_key[-4:]}",
-                    "metadata": metadata,
-                    "content": response_text
-                }
+                self._on_dispatch(selected_item)
+                with self.factory.lease(model_name, api_key) as provider:
+                    response_text = provider.chat(messages, **self._fit(selected_item, request_tokens, kwargs))
+
+                self._record_success(selected_item, started, estimate_text_tokens(response_text))
+                rejection = self._check_output(selected_item, response_text, failed_items, rejected)
+                if rejection is not None:
+                    last_exception = rejection
+                    continue
+                result = self._success_result(selected_item, response_text)
+                return self._finish(result, len(failed_items) + 1, request_started)
             except Exception as e:
-                print(f"--- 调用失败。错误: {e} ---")
                 last_exception = e
-                # 将失败的项加入集合，以便策略下次选择时跳过
-                failed_items.add((model_name, api_key))
-        
-        print("--- 所有可用 (模型,密钥) 对均调用失败 ---")
-        return {
-            "status": "error",
-            "message": f"所有可用选项都无法处理请求。最后一个错误: {last_exception}"
-        }
+                self._record_failure(selected_item, started, e, failed_items)
+            except BaseException:
+                self._record_abandoned(selected_item)
+                raise
+
+        return self._finish(self._exhausted(last_exception, request_tokens), len(failed_items), request_started)
+
+    def _attempt(self, item: PoolItem, messages: List[Dict[str, str]], **kwargs) -> str:
+        with self.factory.lease(item[0], item[1]) as provider:
+            return provider.chat(messages, **kwargs)
+
+    def _run_hedge_attempt(self, attempt: "_HedgeAttempt", messages: List[Dict[str, str]], **kwargs) -> str:
+        # 在执行线程上记下真正开始的时间，线程池排队的时间不计入对冲截止时间与延迟统计
+        attempt.started = time.monotonic()
+        attempt.began.set()
+        return self._attempt(attempt.item, messages, **kwargs)
 
-    # chat_stream 方法也需要进行同样的修改
-    def chat_stream(self, messages: List[Dict[str, str]], **kwargs) -> Generator[str, None, None]:
-        failed_items: set[ItemIdentifier] = set()
+    def _chat_hedged(self, messages: List[Dict[str, str]], request_tokens: int, **kwargs) -> Dict[str, Any]:
+        """
+        带对冲的 chat。同一时刻至多有主请求和一个对冲请求在途：
+        主请求开始执行后超过截止时间仍未返回且预算允许时，向另一项发出对冲请求；先成功者胜出。
+        截止时间从主请求在执行线程上真正开始时算起，在线程池中排队的时间不计入。
+        落败的请求无法在线程中强行中断，其结果会被丢弃，但仍会计入健康状态与策略统计。
+        """
+        executor = self._hedge_executor
+        policy = self.hedging
+        policy.on_request()
+
+        failed_items: Set[ItemIdentifier] = self.pool.item_set()
+        rejected: Set[ItemIdentifier] = self.pool.item_set()
         last_exception = None
+        in_flight: Dict[Any, _HedgeAttempt] = {}
+        # 已派发但截止时间尚未确定 (仍在排队) 的主请求
+        primary: Optional[_HedgeAttempt] = None
+        hedge_deadline: Optional[float] = None
+        hedged = False
+        request_started = time.monotonic()
+
+        def submit(item: PoolItem) -> _HedgeAttempt:
+            self._on_dispatch(item, " (对冲)" if in_flight else "")
+            attempt = _HedgeAttempt(item)
+            future = executor.submit(self._run_hedge_attempt, attempt, messages,
+                                     **self._fit(item, request_tokens, kwargs))
+            in_flight[future] = attempt
+            return attempt
 
         while True:
-            selected_item = self.strategy.select(self.pool, failed_items)
+            if not in_flight:
+                selected_item = self._select(self._skipping(failed_items, rejected), request_tokens)
+                if selected_item is None:
+                    break
+                attempt = submit(selected_item)
+                primary = None if hedged else attempt
+
+            if primary is not None:
+                # 主请求开始前不可能完成，等它开始执行后再计时
+                primary.began.wait()
+                hedge_deadline = primary.started + policy.hedge_delay(primary.item[0])
+                primary = None
+
+            timeout = None if hedge_deadline is None else max(0.0, hedge_deadline - time.monotonic())
+            done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # 截止时间已过：预算允许时向另一项发出对冲请求 (每个请求至多对冲一次)
+                hedge_deadline = None
+                hedged = True
+                if policy.can_hedge():
+                    skipped = failed_items | rejected | {attempt.identifier for attempt in in_flight.values()}
+                    hedge_item, _ = self._try_select(skipped, request_tokens)
+                    if hedge_item is not None:
+                        policy.on_hedge()
+                        submit(hedge_item)
+                continue
+
+            for future in done:
+                attempt = in_flight.pop(future)
+                selected_item, started = attempt.item, attempt.started
+                try:
+                    response_text = future.result()
+                except Exception as e:
+                    last_exception = e
+                    self._record_failure(selected_item, started, e, failed_items)
+                    continue
+                policy.observe(selected_item[0], time.monotonic() - started)
+                self._record_success(selected_item, started, estimate_text_tokens(response_text))
+                rejection = self._check_output(selected_item, response_text, failed_items, rejected)
+                if rejection is not None:
+                    # 另一个在途请求的输出可能合格，继续等待
+                    last_exception = rejection
+                    continue
+                self._abandon(in_flight, request_tokens)
+                result = self._success_result(selected_item, response_text)
+                return self._finish(result, len(failed_items) + 1, request_started)
+
+        return self._finish(self._exhausted(last_exception, request_tokens), len(failed_items), request_started)
+
+    def _abandon(self, in_flight: Dict[Any, "_HedgeAttempt"], request_tokens: int):
+        """
+        取消落败的请求。尚在排队的请求直接取消并归还其占用的名额与额度；
+        已在执行的请求结束后仍把结果计入健康状态与策略统计。
+        """
+        for future, attempt in in_flight.items():
+            if future.cancel():
+                self._record_cancelled(attempt.item, request_tokens)
+                continue
+
+            def settle(f, attempt=attempt):
+                item, started = attempt.item, attempt.started
+                error = f.exception()
+                if error is None:
+                    self.hedging.observe(item[0], time.monotonic() - started)
+                    self._record_success(item, started, estimate_text_tokens(f.result()))
+                else:
+                    self._record_failure(item, started, error, set())
+
+            future.add_done_callback(settle)
+        in_flight.clear()
+
+    def _stream_messages(self, messages: List[Dict[str, str]], emitted: List[str]) -> List[Dict[str, str]]:
+        """续写模式下，把已输出给消费者的部分作为 assistant 前缀附加到消息末尾。"""
+        if not emitted or self.stream_failover != "continue":
+            return messages
+        return messages + [{"role": "assistant", "content": "".join(emitted)}]
+
+    def _on_stream_interrupted(self, emitted: List[str], error: Exception) -> Optional[StreamRestart]:
+        """
+        流式调用中途失败后的处理。续写模式下保留已输出内容；
+        重启模式下清空已输出内容并返回需要产出给消费者的 StreamRestart 信号。
+        """
+        if not emitted:
+            return None
+        if self.stream_failover == "continue":
+            logger.info("流式中途失败，已输出 %d 字符，由下一项续写", sum(map(len, emitted)))
+            return None
+        signal = StreamRestart(str(error), sum(map(len, emitted)))
+        emitted.clear()
+        return signal
+
+    def chat_stream(self, messages: List[Dict[str, str]], **kwargs) -> Generator[Any, None, None]:
+        """
+        流式对话，支持故障切换、首块超时与停顿超时。
+        某项中途失败时按 stream_failover 续写或重启，消费者不会收到重复拼接的文本。
+        """
+        if self.single_flight is None or not self.single_flight.applies(kwargs):
+            return self._chat_stream(messages, **kwargs)
+        return self.single_flight.stream(request_key(messages, kwargs), lambda: self._chat_stream(messages, **kwargs))
+
+    def _chat_stream(self, messages: List[Dict[str, str]], **kwargs) -> Generator[Any, None, None]:
+        failed_items: Set[ItemIdentifier] = self.pool.item_set()
+        last_exception = None
+        request_tokens = estimate_tokens(messages, kwargs.get("system_prompt"))
+        # 已经产出给消费者的文本块
+        emitted: List[str] = []
+        request_started = time.monotonic()
+
+        while True:
+            selected_item = self._select(failed_items, request_tokens)
             if selected_item is None:
                 break
 
             model_name, api_key, metadata = selected_item
+            started = time.monotonic()
+            ttft = None
             try:
-                print(f"--- 策略选择 (流式): 模型={model_name}, 元数据={metadata}, Key=...{api_key[-4:]} ---")
-                provider = self.factory.get_provider(model_name, api_key)
-                yield from provider.chat_stream(messages, **kwargs)
-                print(f"\n--- 模型 {model_name} 流式传输成功！ ---")
+                self._on_dispatch(selected_item, " (流式)")
+                output_tokens = chunks = 0
+                # 租约覆盖整个流：流式输出期间实例被淘汰也不会被关闭
+                with self.factory.lease(model_name, api_key) as provider:
+                    stream = provider.chat_stream(self._stream_messages(messages, emitted),
+                                                   **self._fit(selected_item, request_tokens, kwargs))
+                    for chunk in iter_with_timeouts(stream, self.first_token_timeout, self.stall_timeout):
+                        if ttft is None:
+                            ttft = time.monotonic() - started
+                        output_tokens += estimate_text_tokens(chunk)
+                        chunks += 1
+                        emitted.append(chunk)
+                        yield chunk
+                self._record_success(selected_item, started, output_tokens, stream=True, ttft=ttft, chunks=chunks)
+                self._finish({"status": "success"}, len(failed_items) + 1, request_started)
                 return
             except Exception as e:
-                print(f"--- 调用失败 (流式)。错误: {e} ---")
                 last_exception = e
-                # --- 核心修改 ---
-                failed_items.add((model_name, api_key))
+                self._record_failure(selected_item, started, e, failed_items, stream=True, ttft=ttft)
+                signal = self._on_stream_interrupted(emitted, e)
+                if signal is not None:
+                    yield signal
+            except BaseException:
+                self._record_abandoned(selected_item)
+                raise
+
+        result = self._finish(self._exhausted(last_exception, request_tokens), len(failed_items), request_started)
+        yield f"ERROR: {result['message']}"
+
+    async def achat(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        """
+        chat 的原生异步版本，故障切换语义与 chat 相同。
+        单个事件循环可以同时驱动大量 achat 调用，分散到整个模型密钥池上。
+        """
+        if self.single_flight is None or not self.single_flight.applies(kwargs):
+            return await self._achat_cached(messages, **kwargs)
+        started = time.monotonic()
+        result, leader = await self.single_flight.ado(request_key(messages, kwargs),
+                                                      lambda: self._achat_cached(messages, **kwargs))
+        return result if leader else self._coalesced(result, started)
+
+    async def _achat_cached(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        if self.cache is None:
+            return await self._achat_uncached(messages, **kwargs)
+        started = time.monotonic()
+        cache_key = self.cache.make_key(messages, kwargs)
+        cached = await asyncio.to_thread(self.cache.get, cache_key)
+        if cached is not None and self._accepts(cached):
+            return self._finish(cached, 0, started)
+        result = await self._achat_uncached(messages, **kwargs)
+        if result["status"] == "success":
+            await asyncio.to_thread(self.cache.put, cache_key, result)
+        return result
+
+    async def _achat_uncached(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        failed_items: Set[ItemIdentifier] = self.pool.item_set()
+        rejected: Set[ItemIdentifier] = self.pool.item_set()
+        last_exception = None
+        request_tokens = estimate_tokens(messages, kwargs.get("system_prompt"))
+        request_started = time.monotonic()
+
+        while True:
+            selected_item = await self._aselect(self._skipping(failed_items, rejected), request_tokens)
+            if selected_item is None:
+                break
+
+            model_name, api_key, metadata = selected_item
+
+            started = time.monotonic()
+            try:
+                self._on_dispatch(selected_item, " (异步)")
+                with self.factory.lease(model_name, api_key) as provider:
+                    response_text = await provider.achat(messages, **self._fit(selected_item, request_tokens, kwargs))
+
+                self._record_success(selected_item, started, estimate_text_tokens(response_text))
+                rejection = self._check_output(selected_item, response_text, failed_items, rejected)
+                if rejection is not None:
+                    last_exception = rejection
+                    continue
+                result = self._success_result(selected_item, response_text)
+                return self._finish(result, len(failed_items) + 1, request_started)
+            except Exception as e:
+                last_exception = e
+                self._record_failure(selected_item, started, e, failed_items)
+            except BaseException:
+                self._record_abandoned(selected_item)
+                raise
+
+        return self._finish(self._exhausted(last_exception, request_tokens), len(failed_items), request_started)
 
-        print("--- 所有可用 (模型,密钥) 对均调用失败 (流式) ---")
-        yield f"ERROR: 所有可用选项都无法处理请求。最后一个错误: {last_exception}"
+    def achat_stream(self, messages: List[Dict[str, str]], **kwargs) -> AsyncGenerator[Any, None]:
+        """
+        chat_stream 的原生异步版本，故障切换、超时与中途失败的处理语义与 chat_stream 相同。
+        """
+        if self.single_flight is None or not self.single_flight.applies(kwargs):
+            return self._achat_stream(messages, **kwargs)
+        return self.single_flight.astream(request_key(messages, kwargs), lambda: self._achat_stream(messages, **kwargs))
+
+    async def _achat_stream(self, messages: List[Dict[str, str]], **kwargs) -> AsyncGenerator[Any, None]:
+        failed_items: Set[ItemIdentifier] = self.pool.item_set()
+        last_exception = None
+        request_tokens = estimate_tokens(messages, kwargs.get("system_prompt"))
+        emitted: List[str] = []
+        request_started = time.monotonic()
+
+        while True:
+            selected_item = await self._aselect(failed_items, request_tokens)
+            if selected_item is None:
+                break
+
+            model_name, api_key, metadata = selected_item
+            started = time.monotonic()
+            ttft = None
+            try:
+                self._on_dispatch(selected_item, " (异步流式)")
+                output_tokens = chunks = 0
+                with self.factory.lease(model_name, api_key) as provider:
+                    stream = provider.achat_stream(self._stream_messages(messages, emitted),
+                                                    **self._fit(selected_item, request_tokens, kwargs))
+                    async for chunk in aiter_with_timeouts(stream, self.first_token_timeout, self.stall_timeout):
+                        if ttft is None:
+                            ttft = time.monotonic() - started
+                        output_tokens += estimate_text_tokens(chunk)
+                        chunks += 1
+                        emitted.append(chunk)
+                        yield chunk
+                self._record_success(selected_item, started, output_tokens, stream=True, ttft=ttft, chunks=chunks)
+                self._finish({"status": "success"}, len(failed_items) + 1, request_started)
+                return
+            except Exception as e:
+                last_exception = e
+                self._record_failure(selected_item, started, e, failed_items, stream=True, ttft=ttft)
+                signal = self._on_stream_interrupted(emitted, e)
+                if signal is not None:
+                    yield signal
+            except BaseException:
+                self._record_abandoned(selected_item)
+                raise
 
+        result = self._finish(self._exhausted(last_exception, request_tokens), len(failed_items), request_started)
+        yield f"ERROR: {result['message']}"
@@ -2,6 +2,7 @@
 import os
 import sys
 import json
+import logging
 from dotenv import load_dotenv
 from llm_orchestrator import LLMOrchestrator
 # 引入策略类
@@ -97,6 +98,7 @@ if __name__ == "__main__":
     # print("--- 运行流式聊天会话 ---")
     # run_streaming_chat_session()
     
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     # 你也可以保留非流式测试
     print("\n\n--- 运行非流式聊天会话 ---")
     # from main import run_chat_session # 假设你把原来的代码放到了同名函数
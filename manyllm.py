@@ -1,18 +1,114 @@
 import os
 import sys
 import json
+import logging
 from dotenv import load_dotenv
 from llm_orchestrator import LLMOrchestrator
+from llm_factory import LLMFactory
+from circuit_breaker import HealthTracker
+from rate_limiter import RateLimiter
+from quota_ledger import QuotaLedger
+from concurrency_limiter import AdaptiveConcurrencyLimiter
+from response_cache import ResponseCache
+from metrics import MetricsRecorder
+from single_flight import SingleFlight
+from model_pool import ModelPool
+from conversation import Conversation
 # 引入策略类
 from selection_strategy import SequentialStrategy, RandomStrategy 
 from tqdm import tqdm
 
+logger = logging.getLogger(__name__)
+
 
 class ChatSession:
     def __init__(self):
         load_dotenv()
         self.load_model_key_pool_from_env()
         self.strategy = RandomStrategy()    # 或者使用随机策略进行负载均衡
+        # 会话级的指标记录器：按 (模型, 密钥) 聚合调用次数、错误类别与延迟，见 self.metrics.snapshot()
+        self.metrics = MetricsRecorder()
+        # 会话级共享的提供者缓存，使连接在多次 run_chat 之间保持复用
+        self.factory = LLMFactory(metrics=self.metrics)
+        # 跨请求共享的健康状态：失败或被限流的 (模型, 密钥) 在冷却期内直接跳过
+        self.health = HealthTracker()
+        # 按元数据中的 rpm/tpm 在派发前预留额度，避免主动触发 429
+        self.rate_limiter = RateLimiter()
+        # 持久化的每日额度账本：已耗尽每日额度的密钥在重置前直接跳过，重启后依然有效。
+        # 默认关闭，设置环境变量 MANYLLM_QUOTA_LEDGER=<数据库路径> 即可启用
+        quota_path = os.getenv("MANYLLM_QUOTA_LEDGER")
+        self.quota = QuotaLedger(quota_path) if quota_path else None
+        # 按 (模型, 密钥) 与提供者自适应调整并发上限：成功时加性增长，429 / 延迟突增时乘性下降。
+        # 当前上限见 self.concurrency.snapshot()
+        self.concurrency = AdaptiveConcurrencyLimiter()
+        # 对冲请求默认关闭，设为 HedgingPolicy() 即可启用
+        self.hedging = None
+        # 持久化响应缓存默认关闭，设置环境变量 MANYLLM_RESPONSE_CACHE=<数据库路径> 即可启用
+        cache_path = os.getenv("MANYLLM_RESPONSE_CACHE")
+        self.cache = ResponseCache(cache_path) if cache_path else None
+        # 合并同时在途的相同请求 (数据集中重复的提示词只派发一次)，设为 None 即可关闭。
+        # 只合并 temperature=0 的确定性请求，带采样的请求 (如 run_chat 默认的 0.7) 照常各自派发
+        self.single_flight = SingleFlight()
+        # 输出校验默认关闭，设为校验器 (如 output_validator.JD_TEMPLATE_VALIDATOR) 后，
+        # 不合格的输出会立即换一个质量更高的项重试，各模型的拒绝率见 self.metrics.snapshot()["validation"]
+        self.validator = None
+        self._orchestrator = None
+        # 按模型名缓存的子池编排器: 模型名 -> (构建时的模型池, 编排器)
+        self._model_orchestrators = {}
+
+    def _orchestrator_components(self) -> dict:
+        return {
+            "pool": self.pool,
+            "strategy": self.strategy,
+            "factory": self.factory,
+            "health": self.health,
+            "rate_limiter": self.rate_limiter,
+            "quota": self.quota,
+            "concurrency": self.concurrency,
+            "hedging": self.hedging,
+            "cache": self.cache,
+            "metrics": self.metrics,
+            "single_flight": self.single_flight,
+            "validator": self.validator,
+        }
+
+    def get_orchestrator(self, model_name=None) -> LLMOrchestrator:
+        """
+        返回会话复用的编排器；任一组件 (策略、模型池、缓存等) 被替换后自动重建。
+        :param model_name: 指定时返回只在该模型的各个密钥之间故障切换的编排器，
+                           与整池编排器共享健康状态、限流、额度与提供者连接；池中没有该模型时抛出 ValueError。
+        """
+        components = self._orchestrator_components()
+        if model_name is not None:
+            items = self.pool.items_of(self.pool.mask(model=model_name))
+            if not items:
+                raise ValueError(f"模型池中没有模型 {model_name}")
+            cached = self._model_orchestrators.get(model_name)
+            if cached is not None and cached[0] is self.pool and all(
+                getattr(cached[1], name) is value for name, value in components.items() if name != "pool"
+            ):
+                return cached[1]
+            orchestrator = LLMOrchestrator(**dict(components, pool=items))
+            self._model_orchestrators[model_name] = (self.pool, orchestrator)
+            return orchestrator
+        orchestrator = self._orchestrator
+        if orchestrator is None or any(
+            getattr(orchestrator, name) is not value for name, value in components.items()
+        ):
+            orchestrator = LLMOrchestrator(**components)
+            self._orchestrator = orchestrator
+        return orchestrator
+
+    def close(self):
+        """关闭会话持有的所有提供者连接与缓存。"""
+        self.factory.close()
+        if self.cache is not None:
+            self.cache.close()
+        if self.quota is not None:
+            self.quota.close()
+        self.metrics.close()
+        self._orchestrator = None
+        self._model_orchestrators.clear()
 
     def load_model_key_pool_from_env(self):
         """从环境变量加载并构建 (模型, 密钥) 池"""
@@ -22,29 +118,37 @@ class ChatSession:
         for i in range(1, 10): # 最多检查9个key
             key = os.getenv(f"GEMINI_API_KEY_{i}")
             if key:
-                # 为池中的每个项添加元数据，例如优先级
-                self.pool.append(("gemma-3-27b-it", key, {"priority": 1, "provider": "google"}))
-                self.pool.append(("gemini-2.0-flash-lite", key, {"priority": 2, "provider": "google"}))
-                self.pool.append(("gemini-2.0-flash", key, {"priority": 3, "provider": "google"}))
+                # 为池中的每个项添加元数据，例如优先级、输出质量 (quality 越大越好，输出校验失败时转向更高者)、免费层的 RPM/TPM/RPD 限额，以及上下文窗口与最大输出 token 数
+                self.pool.append(("gemma-3-27b-it", key, {"priority": 1, "quality": 1, "provider": "google", "rpm": 30, "tpm": 15000, "rpd": 14400,
+                                                            "context_window": 131072, "max_output_tokens": 8192}))
+                self.pool.append(("gemini-2.0-flash-lite", key, {"priority": 2, "quality": 2, "provider": "google", "rpm": 30, "tpm": 1000000, "rpd": 1500,
+                                                                  "context_window": 1048576, "max_output_tokens": 8192}))
+                self.pool.append(("gemini-2.0-flash", key, {"priority": 3, "quality": 3, "provider": "google", "rpm": 15, "tpm": 1000000, "rpd": 1500,
+                                                             "context_window": 1048576, "max_output_tokens": 8192}))
         
         # 加载 OpenAI 密钥
         for i in range(1, 10):
             key = os.getenv(f"OPENAI_API_KEY_{i}")
             if key:
-                self.pool.append(("gpt-4o", key, {"priority": 3, "provider": "openai"}))
+                self.pool.append(("gpt-4o", key, {"priority": 3, "quality": 4, "provider": "openai",
+                                                   "context_window": 128000, "max_output_tokens": 16384}))
 
         # 加载 ZhipuAI 密钥
         for i in range(1, 10):
             key = os.getenv(f"ZHIPUAI_API_KEY_{i}")
             if key:
-                self.pool.append(("glm-4.5-flash", key, {"priority": 4, "provider": "zhipuai"}))
-                self.pool.append(("glm-4.5", key, {"priority": 5, "provider": "zhipuai"}))
+                self.pool.append(("glm-4.5-flash", key, {"priority": 4, "quality": 2, "provider": "zhipuai",
+                                                          "context_window": 131072, "max_output_tokens": 98304}))
+                self.pool.append(("glm-4.5", key, {"priority": 5, "quality": 3, "provider": "zhipuai",
+                                                    "context_window": 131072, "max_output_tokens": 98304}))
 
         if not self.pool:
             raise ValueError("未能从环境变量加载任何 (模型,密钥) 对，请检查 .env 文件。")
             
         # 根据元数据中的优先级对池进行排序
         self.pool.sort(key=lambda item: item[2].get("priority", 99))
+        # 建立按模型、提供者、优先级的索引，策略据此选择而不必逐项扫描
+        self.pool = ModelPool(self.pool)
         
         print("--- 模型密钥池加载完成 ---")
         for model, key, meta in self.pool:
@@ -52,12 +156,20 @@ class ChatSession:
         print("--------------------------")
 
 
+    def start_conversation(self, system_prompt="", budget_tokens=4000, **options) -> Conversation:
+        """
+        开始一段多轮对话。会话保存历史，每轮只发送 budget_tokens 以内的窗口，更早的轮次被增量压缩为摘要。
+        用法: conv = session.start_conversation("你是..."); conv.send("你好")["content"]
+        :param options: 传给 Conversation 的其他参数 (compact_ratio, keep_turns, summary_max_tokens)。
+        """
+        return Conversation(self.get_orchestrator, system_prompt=system_prompt, budget_tokens=budget_tokens, **options)
+
     def run_chat(self, user_msg, system_prompt="", temperature=0.7, max_tokens=1000, model_name=None):
         
-        print(f"当前使用的选择策略: {self.strategy.__class__.__name__}")
+        logger.debug("当前使用的选择策略: %s", self.strategy.__class__.__name__)
 
-        # 3. 初始化编排器
-        orchestrator = LLMOrchestrator(pool=self.pool, strategy=self.strategy)
+        # 3. 获取 (复用) 编排器
+        orchestrator = self.get_orchestrator()
 
         messages = [
             {"role": "user", "content": user_msg}
@@ -85,6 +197,7 @@ class ChatSession:
             return result["message"]
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     chat = ChatSession()
     print("--- 测试 Gemini 模型 ---")
     print(chat.run_chat("什么是量子力学"))
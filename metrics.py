@@ -0,0 +1,288 @@
+# llm_framework/metrics.py
+import bisect
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+# 延迟类直方图的桶上界 (秒)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 选择耗时的桶上界 (秒)
+SELECT_BUCKETS = (1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 1e-2)
+# 故障切换深度 (一次请求的尝试次数) 的桶上界
+DEPTH_BUCKETS = (1, 2, 3, 5, 8, 13)
+
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """固定桶的累积直方图，与 Prometheus histogram 的语义一致。"""
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """按桶上界估算分位数 (落在 +Inf 桶时返回最大的有限上界)。"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return self.bounds[-1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": dict(zip([*map(str, self.bounds), "+Inf"], self.counts)),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class MetricsSink(ABC):
+    """指标事件的接收端。handle 在请求路径上同步调用，实现应当足够廉价。"""
+    @abstractmethod
+    def handle(self, event: Dict[str, Any]):
+        pass
+
+    def close(self):
+        pass
+
+
+class InMemorySink(MetricsSink):
+    """
+    在内存中聚合事件：按 (模型, 密钥) 统计尝试次数、错误类别与延迟直方图，
+    以及流式首块延迟、输出速率、故障切换深度、选择耗时与提供者构造耗时。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.attempts: Dict[Tuple[str, str, str], int] = defaultdict(int)
+            self.errors: Dict[Tuple[str, str, str], int] = defaultdict(int)
+            self.latency: Dict[Tuple[str, str], Histogram] = {}
+            self.ttft: Dict[Tuple[str, str], Histogram] = {}
+            self.stream_totals: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0, 0, 0.0])
+            self.requests: Dict[str, int] = defaultdict(int)
+            # 请求结果的来源: upstream (实际派发) / cache (缓存命中) / coalesced (合并到在途的相同请求)
+            self.served: Dict[str, int] = defaultdict(int)
+            self.failover_depth = Histogram(DEPTH_BUCKETS)
+            self.select_seconds = Histogram(SELECT_BUCKETS)
+            self.providers_created: Dict[str, int] = defaultdict(int)
+            self.provider_create_seconds = Histogram(SELECT_BUCKETS + LATENCY_BUCKETS[:4])
+            # 输出校验结果: (模型, accepted / rejected) -> 次数
+            self.validations: Dict[Tuple[str, str], int] = defaultdict(int)
+
+    @staticmethod
+    def _histogram(table: Dict, key, bounds) -> Histogram:
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = Histogram(bounds)
+        return histogram
+
+    def handle(self, event: Dict[str, Any]):
+        kind = event["event"]
+        with self._lock:
+            if kind == "attempt":
+                label = (event["model"], event["key"])
+                outcome = "success" if event["error"] is None else "error"
+                self.attempts[label + (outcome,)] += 1
+                self._histogram(self.latency, label, LATENCY_BUCKETS).observe(event["latency"])
+                if event["error"] is not None:
+                    self.errors[label + (event["error"],)] += 1
+                if event.get("ttft") is not None:
+                    self._histogram(self.ttft, label, LATENCY_BUCKETS).observe(event["ttft"])
+                if event.get("stream") and event["error"] is None:
+                    totals = self.stream_totals[label]
+                    totals[0] += event.get("chunks", 0)
+                    totals[1] += event.get("tokens", 0)
+                    totals[2] += event["latency"]
+            elif kind == "request":
+                self.requests[event["status"]] += 1
+                source = "cache" if event.get("cached") else "coalesced" if event.get("coalesced") else "upstream"
+                self.served[source] += 1
+                self.failover_depth.observe(event["attempts"])
+            elif kind == "select":
+                self.select_seconds.observe(event["duration"])
+            elif kind == "provider_created":
+                self.providers_created[event["model"]] += 1
+                self.provider_create_seconds.observe(event["duration"])
+            elif kind == "validation":
+                self.validations[(event["model"], "rejected" if event["reason"] else "accepted")] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回当前聚合结果的可 JSON 序列化副本。"""
+        with self._lock:
+            per_item: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"attempts": {}, "errors": {}})
+            for (model, key, outcome), n in self.attempts.items():
+                per_item[f"{model}|{key}"]["attempts"][outcome] = n
+            for (model, key, error), n in self.errors.items():
+                per_item[f"{model}|{key}"]["errors"][error] = n
+            for (model, key), histogram in self.latency.items():
+                per_item[f"{model}|{key}"]["latency"] = histogram.to_dict()
+            for (model, key), histogram in self.ttft.items():
+                per_item[f"{model}|{key}"]["ttft"] = histogram.to_dict()
+            for (model, key), (chunks, tokens, seconds) in self.stream_totals.items():
+                if seconds > 0:
+                    per_item[f"{model}|{key}"]["chunks_per_second"] = chunks / seconds
+                    per_item[f"{model}|{key}"]["tokens_per_second"] = tokens / seconds
+            validation: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"accepted": 0, "rejected": 0})
+            for (model, outcome), n in self.validations.items():
+                validation[model][outcome] = n
+            for counts in validation.values():
+                counts["reject_rate"] = counts["rejected"] / (counts["accepted"] + counts["rejected"])
+            return {
+                "requests": dict(self.requests),
+                "served": dict(self.served),
+                "failover_depth": self.failover_depth.to_dict(),
+                "select_seconds": self.select_seconds.to_dict(),
+                "providers_created": dict(self.providers_created),
+                "provider_create_seconds": self.provider_create_seconds.to_dict(),
+                "items": dict(per_item),
+                "validation": dict(validation),
+            }
+
+    def render_prometheus(self, prefix: str = "manyllm") -> str:
+        """以 Prometheus 文本格式导出聚合结果。"""
+        lines: List[str] = []
+
+        def labels(**values) -> str:
+            inner = ",".join(f'{k}="{_escape_label(v)}"' for k, v in values.items())
+            return "{" + inner + "}" if inner else ""
+
+        def histogram(name: str, h: Histogram, **label_values):
+            cumulative = 0
+            for bound, n in zip([*map(str, h.bounds), "+Inf"], h.counts):
+                cumulative += n
+                lines.append(f"{prefix}_{name}_bucket{labels(**label_values, le=bound)} {cumulative}")
+            lines.append(f"{prefix}_{name}_sum{labels(**label_values)} {h.sum}")
+            lines.append(f"{prefix}_{name}_count{labels(**label_values)} {h.count}")
+
+        with self._lock:
+            lines.append(f"# TYPE {prefix}_attempts_total counter")
+            for (model, key, outcome), n in sorted(self.attempts.items()):
+                lines.append(f"{prefix}_attempts_total{labels(model=model, key=key, outcome=outcome)} {n}")
+            lines.append(f"# TYPE {prefix}_errors_total counter")
+            for (model, key, error), n in sorted(self.errors.items()):
+                lines.append(f"{prefix}_errors_total{labels(model=model, key=key, kind=error)} {n}")
+            lines.append(f"# TYPE {prefix}_validations_total counter")
+            for (model, outcome), n in sorted(self.validations.items()):
+                lines.append(f"{prefix}_validations_total{labels(model=model, outcome=outcome)} {n}")
+            lines.append(f"# TYPE {prefix}_requests_total counter")
+            for status, n in sorted(self.requests.items()):
+                lines.append(f"{prefix}_requests_total{labels(status=status)} {n}")
+            lines.append(f"# TYPE {prefix}_requests_served_total counter")
+            for source, n in sorted(self.served.items()):
+                lines.append(f"{prefix}_requests_served_total{labels(source=source)} {n}")
+            lines.append(f"# TYPE {prefix}_attempt_latency_seconds histogram")
+            for (model, key), h in sorted(self.latency.items()):
+                histogram("attempt_latency_seconds", h, model=model, key=key)
+            lines.append(f"# TYPE {prefix}_time_to_first_token_seconds histogram")
+            for (model, key), h in sorted(self.ttft.items()):
+                histogram("time_to_first_token_seconds", h, model=model, key=key)
+            lines.append(f"# TYPE {prefix}_failover_depth histogram")
+            histogram("failover_depth", self.failover_depth)
+            lines.append(f"# TYPE {prefix}_select_seconds histogram")
+            histogram("select_seconds", self.select_seconds)
+            lines.append(f"# TYPE {prefix}_providers_created_total counter")
+            for model, n in sorted(self.providers_created.items()):
+                lines.append(f"{prefix}_providers_created_total{labels(model=model)} {n}")
+        return "\n".join(lines) + "\n"
+
+
+class JsonLinesSink(MetricsSink):
+    """把每个事件作为一行 JSON 追加写入文件，便于离线分析。"""
+    def __init__(self, path: str, flush_every: int = 100):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.flush_every = flush_every
+
+    def handle(self, event: Dict[str, Any]):
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._file.flush()
+                self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class MetricsRecorder:
+    """
+    指标与追踪的入口。编排器与工厂在选择、构造提供者、网络调用前后调用这里的钩子，
+    事件被同步分发给所有 sink。默认只挂一个 InMemorySink。
+    """
+    def __init__(self, sinks: Optional[List[MetricsSink]] = None):
+        self.sinks: List[MetricsSink] = list(sinks) if sinks is not None else [InMemorySink()]
+
+    def emit(self, event: str, **fields):
+        record = {"event": event, "ts": time.time(), **fields}
+        for sink in self.sinks:
+            sink.handle(record)
+
+    def on_select(self, duration: float, item):
+        self.emit("select", duration=duration, model=item[0] if item else None)
+
+    def on_provider_created(self, model_name: str, duration: float):
+        self.emit("provider_created", model=model_name, duration=duration)
+
+    def on_attempt(self, item, latency: float, error: Optional[str] = None, stream: bool = False,
+                   ttft: Optional[float] = None, chunks: int = 0, tokens: int = 0):
+        """
+        记录一次网络调用。
+        :param error: 失败时为错误类别 (ErrorKind 的值)，成功时为 None。
+        """
+        self.emit("attempt", model=item[0], key=f"...{item[1][-4:]}", latency=latency, error=error,
+                  stream=stream, ttft=ttft, chunks=chunks, tokens=tokens)
+
+    def on_validation(self, item, reason: Optional[str] = None):
+        """
+        记录一次输出校验。
+        :param reason: 被拒绝时为拒绝原因，通过时为 None。
+        """
+        self.emit("validation", model=item[0], key=f"...{item[1][-4:]}", reason=reason)
+
+    def on_request(self, status: str, attempts: int, latency: float, cached: bool = False,
+                   coalesced: bool = False):
+        self.emit("request", status=status, attempts=attempts, latency=latency, cached=cached, coalesced=coalesced)
+
+    @property
+    def memory(self) -> Optional[InMemorySink]:
+        return next((sink for sink in self.sinks if isinstance(sink, InMemorySink)), None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        memory = self.memory
+        return memory.snapshot() if memory is not None else {}
+
+    def render_prometheus(self) -> str:
+        memory = self.memory
+        return memory.render_prometheus() if memory is not None else ""
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
@@ -0,0 +1,247 @@
+# llm_framework/model_pool.py
+import heapq
+import random
+import threading
+import time
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+# 定义池中元素的类型别名，方便维护
+# 格式: (model_name, api_key, metadata_dict)
+PoolItem = Tuple[str, str, Dict]
+ItemIdentifier = Tuple[str, str]
+
+
+def iter_bits(mask: int) -> Iterator[int]:
+    """按从小到大的顺序产出位集中每个置位的下标。"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class SkipSet:
+    """
+    一轮选择中要跳过的 (模型, 密钥)：若干个集合的并集视图，组合时不复制。
+    ModelPool.mask_of 对其中的每个集合分别查询，不可变集合 (如上下文窗口的排除集) 的位集会被缓存。
+    """
+    __slots__ = ("sets", "extra")
+
+    def __init__(self, *sets):
+        self.sets = sets
+        self.extra = set()
+
+    def __contains__(self, identifier) -> bool:
+        return identifier in self.extra or any(identifier in s for s in self.sets)
+
+    def __iter__(self) -> Iterator[ItemIdentifier]:
+        for s in self.sets:
+            yield from s
+        yield from self.extra
+
+    def add(self, identifier):
+        self.extra.add(identifier)
+
+
+class ItemSet(set):
+    """
+    (模型, 密钥) 的集合，同时维护它在所属池中的位集。
+    编排器用它记录本次请求已失败的项，策略扣除这些项时无需逐个查询索引。
+    """
+    def __init__(self, pool: "ModelPool", identifiers: Iterable[ItemIdentifier] = ()):
+        super().__init__()
+        self.pool = pool
+        self.mask = 0
+        self.update(identifiers)
+
+    def add(self, identifier: ItemIdentifier):
+        super().add(identifier)
+        self.mask |= self.pool.mask_of((identifier,))
+
+    def update(self, *iterables: Iterable[ItemIdentifier]):
+        for identifiers in iterables:
+            for identifier in identifiers:
+                self.add(identifier)
+
+    def _recompute(self):
+        self.mask = self.pool.mask_of(set(self))
+
+    def discard(self, identifier: ItemIdentifier):
+        super().discard(identifier)
+        self._recompute()
+
+    def remove(self, identifier: ItemIdentifier):
+        super().remove(identifier)
+        self._recompute()
+
+    def clear(self):
+        super().clear()
+        self.mask = 0
+
+
+class ModelPool(Sequence):
+    """
+    带索引的 (模型, 密钥) 池，供选择策略在数千项的规模下快速查询。
+
+    - 每一项按在池中的位置对应一个比特，集合运算都在 Python 整数位集上完成；
+    - 按 (模型, 密钥)、模型名与元数据中的 priority 预先建立位集索引：
+      策略用 (模型, 密钥) 索引一次性扣除本次请求已失败的项，顺序策略按优先级分桶依次选择；
+    - 可用性位集：关卡 (熔断、限流等) 判定某项在一段时间内不可用时，策略调用 block() 清除其比特，
+      到期后自动恢复。被屏蔽的项在选择时不再逐个检查关卡，故障切换 k 次的代价不再随池大小线性增长。
+
+    池创建后内容不可变；仍可像 List[PoolItem] 一样迭代、取下标与求长度。
+    """
+    def __init__(self, items: Iterable[PoolItem], clock=time.monotonic):
+        self.items: List[PoolItem] = list(items)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.all_mask = (1 << len(self.items)) - 1
+        self._identifier_masks: Dict[ItemIdentifier, int] = {}
+        self._model_masks: Dict[str, int] = {}
+        priority_masks: Dict[int, int] = {}
+        for index, (model_name, api_key, metadata) in enumerate(self.items):
+            bit = 1 << index
+            metadata = metadata or {}
+            identifier = (model_name, api_key)
+            self._identifier_masks[identifier] = self._identifier_masks.get(identifier, 0) | bit
+            self._model_masks[model_name] = self._model_masks.get(model_name, 0) | bit
+            priority = metadata.get("priority", 1)
+            priority_masks[priority] = priority_masks.get(priority, 0) | bit
+        # 升序排列的优先级及其分桶位集
+        self.priorities: List[int] = sorted(priority_masks)
+        self._priority_masks = priority_masks
+        # 可用性位集，以及按恢复时间排序的屏蔽记录 (恢复时间, 下标)
+        self._available = self.all_mask
+        self._blocked_until: Dict[int, float] = {}
+        self._blocked_heap: List[Tuple[float, int]] = []
+        # 不可变标识集合 -> 位集
+        self._frozen_masks: Dict[FrozenSet[ItemIdentifier], int] = {}
+
+    @classmethod
+    def of(cls, pool: Union["ModelPool", Iterable[PoolItem]]) -> "ModelPool":
+        """已是 ModelPool 时原样返回，否则为其建立索引。"""
+        return pool if isinstance(pool, ModelPool) else cls(pool)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    def __iter__(self) -> Iterator[PoolItem]:
+        return iter(self.items)
+
+    def __repr__(self):
+        return f"ModelPool({len(self.items)} items, {len(self._model_masks)} models)"
+
+    # --- 索引查询 ---
+
+    def mask_of(self, identifiers: Iterable[ItemIdentifier]) -> int:
+        """一组 (模型, 密钥) 对应的位集，不在池中的标识会被忽略。"""
+        if isinstance(identifiers, ItemSet) and identifiers.pool is self:
+            return identifiers.mask
+        if isinstance(identifiers, SkipSet):
+            mask = self.mask_of(identifiers.extra)
+            for part in identifiers.sets:
+                mask |= self.mask_of(part)
+            return mask
+        if isinstance(identifiers, frozenset):
+            mask = self._frozen_masks.get(identifiers)
+            if mask is None:
+                if len(self._frozen_masks) >= 64:
+                    self._frozen_masks.clear()
+                mask = self._frozen_masks[identifiers] = self.mask_of(set(identifiers))
+            return mask
+        mask = 0
+        masks = self._identifier_masks
+        for identifier in identifiers:
+            mask |= masks.get(identifier, 0)
+        return mask
+
+    def item_set(self, identifiers: Iterable[ItemIdentifier] = ()) -> ItemSet:
+        """创建一个随增删维护自身位集的 (模型, 密钥) 集合。"""
+        return ItemSet(self, identifiers)
+
+    def mask(self, model: Optional[str] = None, priority: Optional[int] = None) -> int:
+        """
+        按条件查询项的位集，多个条件取交集；不传任何条件时返回全部项。
+        :param priority: 只包含该优先级的项。
+        """
+        mask = self.all_mask
+        if model is not None:
+            mask &= self._model_masks.get(model, 0)
+        if priority is not None:
+            mask &= self._priority_masks.get(priority, 0)
+        return mask
+
+    def items_of(self, mask: int) -> List[PoolItem]:
+        return [self.items[index] for index in iter_bits(mask)]
+
+    # --- 可用性位集 ---
+
+    def _refresh(self):
+        """恢复所有屏蔽已到期的项。"""
+        heap = self._blocked_heap
+        if not heap or heap[0][0] > self._clock():
+            return
+        with self._lock:
+            now = self._clock()
+            while heap and heap[0][0] <= now:
+                until, index = heapq.heappop(heap)
+                # 同一项可能被多次屏蔽，只有最新的一条记录有效
+                if self._blocked_until.get(index) == until:
+                    del self._blocked_until[index]
+                    self._available |= 1 << index
+
+    def available_mask(self) -> int:
+        """当前未被屏蔽的项的位集。"""
+        self._refresh()
+        return self._available
+
+    def block(self, index: int, seconds: Optional[float] = None):
+        """
+        在 seconds 秒内屏蔽该项；seconds 为 None 时一直屏蔽，直到调用 unblock()。
+        重复屏蔽时以较晚的恢复时间为准。
+        """
+        until = float("inf") if seconds is None else self._clock() + seconds
+        with self._lock:
+            if self._blocked_until.get(index, -1.0) >= until:
+                return
+            self._blocked_until[index] = until
+            self._available &= ~(1 << index)
+            if until != float("inf"):
+                heapq.heappush(self._blocked_heap, (until, index))
+
+    def unblock(self, index: int):
+        with self._lock:
+            self._blocked_until.pop(index, None)
+            self._available |= 1 << index
+
+    def blocked(self) -> Dict[ItemIdentifier, float]:
+        """被屏蔽的项及其剩余屏蔽秒数，便于日志与调试。"""
+        self._refresh()
+        now = self._clock()
+        with self._lock:
+            return {
+                (self.items[index][0], self.items[index][1]): until - now
+                for index, until in self._blocked_until.items()
+            }
+
+    # --- 从位集中取项 ---
+
+    def random_index(self, mask: int, attempts: int = 8, rng: random.Random = random) -> Optional[int]:
+        """
+        从位集中均匀随机地取一个下标。先在整个池的下标范围内拒绝采样，
+        位集较满时为 O(1)；连续 attempts 次未命中时退化为遍历置位。
+        """
+        if not mask:
+            return None
+        size = len(self.items)
+        for _ in range(attempts):
+            index = rng.randrange(size)
+            if mask >> index & 1:
+                return index
+        target = rng.randrange(mask.bit_count())
+        for position, index in enumerate(iter_bits(mask)):
+            if position == target:
+                return index
+        return None
@@ -0,0 +1,168 @@
+# llm_framework/near_dedup.py
+import random
+import re
+import zlib
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+_MASK64 = (1 << 64) - 1
+# 归一化时去掉空白与标点，只保留文字与数字
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+Signature = Tuple[int, ...]
+
+
+def normalize(text: str) -> str:
+    """小写化并去掉空白与标点，使只在排版上不同的文本得到相同的 shingle。"""
+    return _NON_WORD.sub("", text.lower())
+
+
+def shingle_hashes(text: str, size: int = 5) -> List[int]:
+    """
+    文本归一化后按字符切分为长度为 size 的 shingle，返回去重后的 32 位哈希。
+    按字符而不是按词切分，中文文本无需分词；使用 crc32 而不是内置 hash()，保证跨进程结果一致。
+    """
+    text = normalize(text)
+    if len(text) <= size:
+        return [zlib.crc32(text.encode("utf-8"))] if text else []
+    return list({zlib.crc32(text[i:i + size].encode("utf-8")) for i in range(len(text) - size + 1)})
+
+
+def similarity(a: Signature, b: Signature) -> float:
+    """由两个 MinHash 签名估计 shingle 集合的 Jaccard 相似度。"""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+class MinHasher:
+    """
+    MinHash 签名 (单次置换 + 旋转稠密化)：每个 shingle 哈希经一次随机的乘法哈希映射为 64 位值，
+    按高位落入 num_perm 个桶之一，每个桶保留最小值；空桶借用右侧最近的非空桶的值并加上距离偏移。
+    两个签名中相等分量的比例是两段文本 Jaccard 相似度的估计，与 num_perm 次独立置换的经典 MinHash 相当，
+    但每个 shingle 只需计算一次哈希，而不是 num_perm 次。
+    相同的 seed 在任何进程中都得到相同的签名，断点续传时分组保持不变。
+    """
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._multiplier = rng.getrandbits(64) | 1
+        self._increment = rng.getrandbits(64)
+
+    def signature(self, text: str) -> Optional[Signature]:
+        """返回文本的签名；归一化后为空的文本返回 None (不参与去重)。"""
+        hashes = shingle_hashes(text, self.shingle_size)
+        if not hashes:
+            return None
+        n, multiplier, increment = self.num_perm, self._multiplier, self._increment
+        bins: List[Optional[int]] = [None] * n
+        for x in hashes:
+            h = (x * multiplier + increment) & _MASK64
+            index = (h * n) >> 64
+            current = bins[index]
+            if current is None or h < current:
+                bins[index] = h
+        if None in bins:
+            # 旋转稠密化：偏移量 distance << 64 保证借来的值不会与任何桶中的原始值相等
+            filled = bins
+            bins = list(filled)
+            for index in range(n):
+                if filled[index] is None:
+                    distance = 1
+                    while filled[(index + distance) % n] is None:
+                        distance += 1
+                    bins[index] = filled[(index + distance) % n] + (distance << 64)
+        return tuple(bins)
+
+
+def _choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    选择 LSH 的 (bands, rows)，bands * rows == num_perm。
+    相似度为 s 的两项成为候选的概率是 1 - (1 - s^rows)^bands，在 (1/bands)^(1/rows) 附近陡增；
+    取该拐点不高于 threshold - 0.1 的最严格划分，使达到阈值的近重复几乎都能成为候选，再由签名相似度复核。
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if (1 / bands) ** (1 / rows) <= threshold - 0.1:
+            best = (bands, rows)
+    return best
+
+
+class NearDuplicateIndex:
+    """
+    基于 MinHash + LSH 的近重复分组，总开销与记录数成线性关系，不做两两比较。
+
+    记录按加入顺序处理 (领头者聚类)：每条记录只与已有组的代表 (组内第一条记录) 比较，
+    签名被分为 bands 段，至少有一段完全相同的代表才成为候选，候选中估计相似度不低于 threshold 的
+    最相似者即为所在组；没有时该记录成为新组的代表。只有代表进入 LSH 桶，组不会因为链式相似而无限扩张。
+    """
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128, shingle_size: int = 5,
+                 bands: Optional[int] = None, seed: int = 1):
+        """
+        :param threshold: 视为近重复的最低 Jaccard 相似度 (按字符 shingle 计算)。
+        :param bands: LSH 分段数，必须整除 num_perm；默认按 threshold 自动选择。
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold 必须在 (0, 1] 之间")
+        if bands is None:
+            bands, rows = _choose_bands(num_perm, threshold)
+        elif num_perm % bands:
+            raise ValueError(f"bands={bands} 必须整除 num_perm={num_perm}")
+        else:
+            rows = num_perm // bands
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        self.hasher = MinHasher(num_perm, shingle_size, seed)
+        self._buckets: List[Dict[Signature, List[Hashable]]] = [{} for _ in range(bands)]
+        self._signatures: Dict[Hashable, Signature] = {}
+        self.candidates_checked = 0
+
+    def _bands_of(self, signature: Signature) -> Iterable[Tuple[int, Signature]]:
+        rows = self.rows
+        for band in range(self.bands):
+            yield band, signature[band * rows:(band + 1) * rows]
+
+    def add(self, key: Hashable, text: str) -> Optional[Hashable]:
+        """
+        加入一条记录。
+        :return: 它所属组的代表的 key；它自己成为新组的代表 (或文本为空) 时返回 None。
+        """
+        signature = self.hasher.signature(text)
+        if signature is None:
+            return None
+        best, best_similarity = None, self.threshold
+        seen = set()
+        for band, part in self._bands_of(signature):
+            for candidate in self._buckets[band].get(part, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                score = similarity(signature, self._signatures[candidate])
+                if score >= best_similarity:
+                    best, best_similarity = candidate, score
+        self.candidates_checked += len(seen)
+        if best is not None:
+            return best
+        self._signatures[key] = signature
+        for band, part in self._bands_of(signature):
+            self._buckets[band].setdefault(part, []).append(key)
+        return None
+
+
+def group_near_duplicates(items: Iterable[Tuple[Hashable, str]], threshold: float = 0.9,
+                          **options) -> Dict[Hashable, Hashable]:
+    """
+    对 (key, 文本) 序列做近重复分组。
+    :param options: 传给 NearDuplicateIndex 的其他参数 (num_perm, shingle_size, bands, seed)。
+    :return: 非代表记录的 key -> 所属组代表的 key；代表与不参与去重的记录不在结果中。
+    """
+    index = NearDuplicateIndex(threshold, **options)
+    duplicates: Dict[Hashable, Hashable] = {}
+    for key, text in items:
+        representative = index.add(key, text)
+        if representative is not None:
+            duplicates[key] = representative
+    return duplicates
+
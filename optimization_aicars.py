@@ -1,11 +1,25 @@
 import os
 import sys
 import json
+import logging
+import threading
 from dotenv import load_dotenv
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from llm_orchestrator import LLMOrchestrator
+from manyllm import ChatSession
+from response_cache import ResponseCache
+from batch_jobs import BatchJobRunner, BatchRequest
+from dataset_io import JsonlReader, GroupCommitWriter, recover_output, first_pending
+from work_queue import WorkQueue, LeaseHeartbeat, default_worker_id
+from model_pool import ModelPool
+from near_dedup import group_near_duplicates
+from output_validator import JD_TEMPLATE_VALIDATOR
 from tqdm import tqdm # 引入tqdm来显示进度条，需要 pip install tqdm
 import time # 引入time模块用于演示
 
+logger = logging.getLogger(__name__)
+
 # --- 定义模型优先级列表 ---
 MODEL_PRIORITY_LIST = [
     # 注意：Gemini API中的模型名称通常不含 '2.0-flash-lite'，请确认您拥有访问权限的模型名称
@@ -74,112 +88,561 @@ def create_optimization_prompt(original_user_content, original_assistant_content
 # 你的任务:
 请忽略草稿中所有不合规（如公司介绍、歧视性语言）和格式不正确的内容，重新生成一份完全符合您角色设定中所有指令的、专业的、结构化的职位描述。
 """
-def process_dataset_file(input_path, output_path):
+# 优化请求的生成参数，逐条调用与批处理模式共用
+GENERATION_PARAMS = {"temperature": 0.3, "max_tokens": 2048, "system_prompt": SYSTEM_PROMPT}
+
+
+def _draft_messages(data):
+    """返回记录中的 (用户请求, 助理草稿) 两条消息，缺少任一条时返回 (None, None)。"""
+    messages = data.get("messages", [])
+    user_msg = next((m for m in messages if m['role'] == 'user'), None)
+    assistant_msg = next((m for m in messages if m['role'] == 'assistant'), None)
+    if not user_msg or not assistant_msg:
+        return None, None
+    return user_msg, assistant_msg
+
+
+def prepare_record(line_num, line):
     """
-    读取jsonl文件，调用LLM进行优化，并将结果写入新的jsonl文件。
-    支持实时写入和断点续传。
+    解析输入文件中的一行，返回 (输出记录的骨架, 发给模型的消息)；数据格式不完整时返回 None。
+    """
+    user_msg, assistant_msg = _draft_messages(json.loads(line))
+
+    if not user_msg or not assistant_msg:
+        print(f"警告: 输入文件第 {line_num} 行数据格式不完整，已跳过。")
+        return None
+
+    optimization_prompt = create_optimization_prompt(
+        user_msg['content'],
+        assistant_msg['content']
+    )
+    llm_messages = [{"role": "user", "content": optimization_prompt}]
+
+    output_record = {
+        "line_number": line_num,
+        "original_user_request": user_msg['content'],
+        "original_assistant_response": assistant_msg['content'],
+    }
+    return output_record, llm_messages
+
+
+def finish_record(output_record, result):
+    """把编排器 (或批处理) 的结果填入输出记录。"""
+    if result["status"] == "success":
+        output_record["optimized_response"] = result['content']
+        output_record["processed_by_model"] = result['model']
+    else:
+        output_record["optimized_response"] = f"ERROR: {result['message']}"
+        output_record["processed_by_model"] = "None"
+    return output_record
+
+
+def process_record(orchestrator, line_num, line):
     """
-    load_dotenv()
-    orchestrator = LLMOrchestrator(model_priority=MODEL_PRIORITY_LIST)
+    处理输入文件中的一行，返回要写入输出文件的记录；数据无效时返回 None。
+    """
+    try:
+        prepared = prepare_record(line_num, line)
+        if prepared is None:
+            return None
+        output_record, llm_messages = prepared
+
+        result = orchestrator.chat(messages=llm_messages, **GENERATION_PARAMS)
+        return finish_record(output_record, result)
+
+    except json.JSONDecodeError:
+        print(f"警告: 第 {line_num} 行不是有效的JSON，已跳过。")
+    except Exception as e:
+        print(f"处理第 {line_num} 行时发生未知错误: {e}")
+        # 可以在这里选择是停止还是继续
+        time.sleep(1)
+    return None
 
-    # --- 1. 断点续传：检查已完成的记录数 ---
-    processed_count = 0
+
+def plan_near_duplicates(reader, threshold=0.9, keep=1):
+    """
+    去重预处理：对每条记录的用户请求与助理草稿计算 MinHash 签名，用 LSH 把近重复的记录分组
+    (总开销与记录数成线性关系)。每组只有按输入顺序的前 keep 条调用模型，其余记录复用组代表 (组内第一条) 的结果。
+    分组只取决于输入文件与参数，断点续传时保持不变。
+    :param threshold: 视为近重复的最低相似度 (按字符 shingle 的 Jaccard 相似度估计)。复用的结果会原样写给组内其他记录，
+                      因此阈值应足够严格，只合并仅有公司套话、排版等差异的记录。
+    :return: 复用结果的记录的 line_number -> 组代表的 line_number。
+    """
+    def drafts():
+        for line_num, line in reader.iter_lines():
+            try:
+                user_msg, assistant_msg = _draft_messages(json.loads(line))
+            except (json.JSONDecodeError, AttributeError, KeyError, TypeError):
+                continue
+            if user_msg and assistant_msg:
+                yield line_num, f"{user_msg['content']}\n{assistant_msg['content']}"
+
+    followers = {}
+    dispatched = Counter()
+    for line_num, representative in group_near_duplicates(drafts(), threshold).items():
+        # 组代表本身总是调用模型，组内其余成员中再有 keep - 1 条单独调用
+        if dispatched[representative] < keep - 1:
+            dispatched[representative] += 1
+        else:
+            followers[line_num] = representative
+    return followers
+
+
+def _load_output_records(output_path, line_numbers):
+    """从已有的输出文件中读取指定 line_number 的记录。"""
+    records = {}
+    if not line_numbers or not os.path.exists(output_path):
+        return records
+    with open(output_path, "r", encoding="utf-8") as f:
+        for raw in f:
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                continue
+            if record.get("line_number") in line_numbers:
+                records[record["line_number"]] = record
+    return records
+
+
+def _run_now(fn, *args):
+    """顺序模式下代替 executor.submit：立即执行并返回已完成的 Future。"""
+    future = Future()
+    future.set_result(fn(*args))
+    return future
+
+
+class NearDuplicateRouter:
+    """
+    把复用结果的记录路由到组代表的结果上：代表完成后，其结果复制给同组的其他记录 (带有 duplicate_of 字段)，
+    不再调用模型，也不占用工作线程。代表调用失败、或其结果不可用时，记录照常单独调用模型。
+    """
+    def __init__(self, orchestrator, followers, known=None):
+        """
+        :param followers: 本次需要处理的、复用结果的记录 line_number -> 组代表的 line_number。
+        :param known: 之前的运行中已经完成的组代表的输出记录。
+        """
+        self.orchestrator = orchestrator
+        self.followers = followers
+        self.reused = 0
+        # 每个代表还有多少条记录在等待它的结果，全部取走后释放，内存占用不随数据集增长
+        self._remaining = Counter(followers.values())
+        self._results = {}
+        for line_num, record in (known or {}).items():
+            self._results[line_num] = _run_now(lambda r: r, record)
+        self._lock = threading.Lock()
+
+    def submit(self, submit, line_num, line):
+        """
+        提交一条记录，返回其输出记录的 Future。
+        :param submit: executor.submit 或 _run_now。
+        """
+        representative = self.followers.get(line_num)
+        with self._lock:
+            source = self._results.get(representative) if representative is not None else None
+            if source is not None:
+                self._remaining[representative] -= 1
+                if not self._remaining[representative]:
+                    del self._results[representative]
+        if source is None:
+            future = submit(process_record, self.orchestrator, line_num, line)
+            with self._lock:
+                if self._remaining[line_num]:
+                    self._results[line_num] = future
+            return future
+
+        result = Future()
+
+        # 以下两个函数作为 Future 的回调运行，其中的异常会被吞掉；必须转交给 result，否则写入方会一直等待它
+        def forward(done):
+            try:
+                result.set_result(done.result())
+            except BaseException as e:
+                result.set_exception(e)
+
+        def reuse(done):
+            try:
+                record = done.result()
+            except Exception:
+                # 代表调用本身抛出异常，按结果不可用处理
+                record = None
+            try:
+                if record is None or record["processed_by_model"] == "None":
+                    submit(process_record, self.orchestrator, line_num, line).add_done_callback(forward)
+                    return
+                prepared = prepare_record(line_num, line)
+                output_record = prepared[0] if prepared is not None else None
+                if output_record is not None:
+                    output_record["optimized_response"] = record["optimized_response"]
+                    output_record["processed_by_model"] = record["processed_by_model"]
+                    output_record["duplicate_of"] = representative
+                    with self._lock:
+                        self.reused += 1
+                result.set_result(output_record)
+            except BaseException as e:
+                result.set_exception(e)
+
+        source.add_done_callback(reuse)
+        return result
+
+
+def _load_resume_state(output_path):
+    """
+    恢复输出文件并返回其中已完成记录的 line_number 集合。
+    并发模式下记录可能乱序完成，因此不能用输出文件的行数作为断点；进程中断时末尾残留的半行会被截掉。
+    """
+    processed = set()
     if os.path.exists(output_path):
         try:
-            with open(output_path, 'r', encoding='utf-8') as f:
-                # 高效地计算文件行数
-                processed_count = sum(1 for _ in f)
-            print(f"检测到已存在的输出文件，包含 {processed_count} 条记录。将从断点处继续...")
+            processed = recover_output(output_path)
+            print(f"检测到已存在的输出文件，包含 {len(processed)} 条记录。将从断点处继续...")
         except Exception as e:
-            print(f"警告：无法读取输出文件 '{output_path}' 的行数，将从头开始。错误: {e}")
-    
-    # --- 2. 断点续传：决定文件打开模式 ---
-    # 如果已有记录，则以追加模式('a')打开；否则以写入模式('w')创建新文件
-    file_mode = 'a' if processed_count > 0 else 'w'
-    
+            print(f"警告：无法读取输出文件 '{output_path}' 的记录，将从头开始。错误: {e}")
+    return processed
+
+
+def process_dataset_file(input_path, output_path, workers=1, ordered=True, cache_path=None,
+                         dedup_threshold=None, dedup_keep=1, validator=None):
+    """
+    读取jsonl文件，调用LLM进行优化，并将结果写入新的jsonl文件。
+    支持组提交写入和断点续传。
+    :param workers: 并发处理的记录数。大于 1 时记录会被分散到模型密钥池的多个 (模型, 密钥) 上。
+    :param ordered: 并发模式下是否按输入顺序写出结果；为 False 时按完成顺序写出，
+                    每条结果都带有 line_number，可据此还原顺序。
+    :param cache_path: 可选的响应缓存数据库路径。重跑同一数据集时，已成功的记录直接命中缓存，不再调用 API。
+    :param dedup_threshold: 设置后先对输入做近重复分组 (见 plan_near_duplicates)，每组只调用 dedup_keep 次模型，
+                            其余记录复用组代表的结果，并以 duplicate_of 字段记录组代表的 line_number。
+    :param validator: 可选的输出校验器 (如 JD_TEMPLATE_VALIDATOR)。不合格的输出在编排器中立即换一个质量更高的项重试，
+                      而不是作为成功写入输出文件；缓存中不合格的旧结果也会重新生成。
+    """
+    session = ChatSession()
+    if cache_path:
+        session.cache = ResponseCache(cache_path)
+    session.validator = validator
+    orchestrator = session.get_orchestrator()
+
+    # --- 1. 断点续传：按 line_number 收集已完成的记录 ---
+    processed = _load_resume_state(output_path)
+
+    reader = None
+    router = None
+    try:
+        # 输入文件通过旁路的偏移索引读取：总行数与定位断点都是 O(1)
+        reader = JsonlReader(input_path)
+        total_lines = len(reader)
+        print(f"输入文件 '{input_path}' 加载成功，共 {total_lines} 条记录。")
+
+        if dedup_threshold is not None:
+            followers = plan_near_duplicates(reader, dedup_threshold, dedup_keep)
+            print(f"近重复去重: {len(followers)} 条记录将复用 {len(set(followers.values()))} 个组代表的结果。")
+            pending_followers = {line_num: rep for line_num, rep in followers.items() if line_num not in processed}
+            known = _load_output_records(
+                output_path, {rep for rep in pending_followers.values() if rep in processed}
+            )
+            router = NearDuplicateRouter(orchestrator, pending_followers, known)
+
+        # --- 2. 断点续传：直接定位到第一条未完成的行，再跳过其后零散的已完成行 ---
+        pending_lines = (
+            (line_num, line)
+            for line_num, line in reader.iter_lines(start=first_pending(processed))
+            if line_num not in processed
+        )
+
+        # --- 3. 组提交写入：有已完成的记录时追加，否则新建；检查点随每次提交原子更新 ---
+        with GroupCommitWriter(output_path, append=bool(processed), committed=processed) as writer:
+            pbar = tqdm(total=total_lines, initial=len(processed), desc="处理进度")
+
+            def write_record(output_record):
+                if output_record is not None:
+                    writer.write(output_record)
+                pbar.update(1)
+
+            if workers <= 1:
+                for line_num, line in pending_lines:
+                    if router is None:
+                        write_record(process_record(orchestrator, line_num, line))
+                    else:
+                        write_record(router.submit(_run_now, line_num, line).result())
+            else:
+                _run_concurrently(orchestrator, pending_lines, write_record, workers, ordered, router)
+            pbar.close()
+
+    except FileNotFoundError:
+        print(f"错误: 输入文件未找到于 '{input_path}'")
+        sys.exit(1)
+    finally:
+        if reader is not None:
+            reader.close()
+        if router is not None:
+            print(f"近重复去重: 本次运行复用了 {router.reused} 条结果。")
+        # 汇总本次运行的请求结果与故障切换深度 (指标记录器没有内存汇总时快照为空)
+        snapshot = session.metrics.snapshot()
+        depth = snapshot.get("failover_depth") or {}
+        logger.info("请求统计: %s, 结果来源: %s, 平均尝试次数: %.2f", snapshot.get("requests"), snapshot.get("served"),
+                    depth.get("sum", 0) / max(1, depth.get("count", 0)))
+        _log_reject_rates(snapshot)
+        session.close()
+
+    print(f"\n处理完成！所有结果已保存到 '{output_path}'。")
+
+
+def _log_reject_rates(snapshot):
+    """输出各模型的校验拒绝率。"""
+    for model, counts in sorted(snapshot.get("validation", {}).items()):
+        logger.info("输出校验: 模型=%s, 通过 %d, 拒绝 %d, 拒绝率 %.1f%%", model, counts["accepted"],
+                    counts["rejected"], counts["reject_rate"] * 100)
+
+
+def _run_concurrently(orchestrator, pending_lines, write_record, workers, ordered, router=None):
+    """
+    用线程池并发处理记录。同时在途的记录数限制在 workers 的常数倍以内，
+    避免一次性把整个数据集读入内存。
+    :param router: 可选的 NearDuplicateRouter，复用结果的记录不占用工作线程。
+    """
+    window = workers * 4
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def submit_record(line_num, line):
+            if router is None:
+                return executor.submit(process_record, orchestrator, line_num, line)
+            return router.submit(executor.submit, line_num, line)
+
+        if ordered:
+            # 按提交顺序排队，队首完成后才写出，保证输出与输入顺序一致
+            in_flight = deque()
+            for line_num, line in pending_lines:
+                in_flight.append(submit_record(line_num, line))
+                if len(in_flight) >= window:
+                    write_record(in_flight.popleft().result())
+            while in_flight:
+                write_record(in_flight.popleft().result())
+        else:
+            in_flight = set()
+            for line_num, line in pending_lines:
+                in_flight.add(submit_record(line_num, line))
+                if len(in_flight) >= window:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        write_record(future.result())
+            for future in wait(in_flight).done:
+                write_record(future.result())
+
+
+def process_dataset_file_batch(input_path, output_path, workers=1, cache_path=None, model_name=None,
+                               max_batch_size=500, poll_interval=30.0, base_urls=None, validator=None):
+    """
+    批处理模式：把待处理的记录打包为厂商批处理任务 (Gemini / ZhipuAI Batch API) 提交并轮询，
+    结果按 line_number 合并写入输出文件 (按任务完成的顺序)。批处理中失败的记录回退到逐条调用编排器。
+    未完成任务的 ID 记录在 "<输出文件>.batch_state.json" 中，中断后重新运行会继续等待这些任务而不重复提交。
+    :param workers: 回退到逐条调用时的并发数。
+    :param model_name: 用于批处理的模型，默认取池中优先级最高的、支持批处理的模型。
+    :param base_urls: 适配器名 ("gemini" / "zhipuai") -> 接口地址，用于指向本地的替身批处理服务器。
+    :param validator: 可选的输出校验器。未通过校验的批处理结果与逐条调用的失败记录一样回退到编排器。
+    """
+    session = ChatSession()
+    if cache_path:
+        session.cache = ResponseCache(cache_path)
+    session.validator = validator
+    orchestrator = session.get_orchestrator()
+    cache = session.cache
+    runner = BatchJobRunner(session.pool, model_name=model_name, max_batch_size=max_batch_size,
+                            poll_interval=poll_interval, state_path=output_path + ".batch_state.json",
+                            base_urls=base_urls)
+
+    processed = _load_resume_state(output_path)
+
     try:
-        with open(input_path, 'r', encoding='utf-8') as infile:
-            # 为了准确显示tqdm进度，先获取总行数
-            total_lines = sum(1 for _ in infile)
-            # 重置文件指针以便再次读取
-            infile.seek(0)
-            
-            print(f"输入文件 '{input_path}' 加载成功，共 {total_lines} 条记录。")
-
-            # --- 3. 断点续传：跳过已处理的输入行 ---
-            for _ in range(processed_count):
-                next(infile, None)
-
-            # 使用追加模式打开输出文件
-            with open(output_path, file_mode, encoding='utf-8') as outfile:
-                # 初始化进度条
-                pbar = tqdm(
-                    enumerate(infile, start=processed_count + 1), 
-                    total=total_lines, 
-                    initial=processed_count, 
-                    desc="处理进度"
-                )
-                
-                for line_num, line in pbar:
-                    try:
-                        data = json.loads(line)
-                        messages = data.get("messages", [])
-                        
-                        user_msg = next((m for m in messages if m['role'] == 'user'), None)
-                        assistant_msg = next((m for m in messages if m['role'] == 'assistant'), None)
-
-                        if not user_msg or not assistant_msg:
-                            print(f"警告: 输入文件第 {line_num} 行数据格式不完整，已跳过。")
-                            continue
-
-                        optimization_prompt = create_optimization_prompt(
-                            user_msg['content'], 
-                            assistant_msg['content']
-                        )
-                        llm_messages = [{"role": "user", "content": optimization_prompt}]
-
-                        result = orchestrator.chat(
-                            messages=llm_messages,
-                            temperature=0.3,
-                            max_tokens=2048,
-                            system_prompt=SYSTEM_PROMPT
-                        )
-
-                        output_record = {
-                            "line_number": line_num,
-                            "original_user_request": user_msg['content'],
-                            "original_assistant_response": assistant_msg['content'],
-                        }
-
-                        if result["status"] == "success":
-                            output_record["optimized_response"] = result['content']
-                            output_record["processed_by_model"] = result['model']
-                        else:
-                            output_record["optimized_response"] = f"ERROR: {result['message']}"
-                            output_record["processed_by_model"] = "None"
-                        
-                        outfile.write(json.dumps(output_record, ensure_ascii=False) + '\n')
-                        
-                        # --- 4. 实时写入：强制将缓冲区内容写入磁盘 ---
-                        outfile.flush()
-
-                    except json.JSONDecodeError:
-                        print(f"警告: 第 {line_num} 行不是有效的JSON，已跳过。")
-                    except Exception as e:
-                        print(f"处理第 {line_num} 行时发生未知错误: {e}")
-                        # 可以在这里选择是停止还是继续
-                        time.sleep(1)
+        with JsonlReader(input_path) as reader, \
+                GroupCommitWriter(output_path, append=bool(processed), committed=processed) as writer:
+            print(f"输入文件 '{input_path}' 加载成功，共 {len(reader)} 条记录。")
+            pbar = tqdm(total=len(reader), initial=len(processed), desc="处理进度")
+
+            def write_record(output_record):
+                if output_record is not None:
+                    writer.write(output_record)
+                pbar.update(1)
+
+            # line_number -> (原始行, 输出记录骨架, 发给模型的消息)
+            pending = {}
+            requests = []
+            for line_num, line in reader.iter_lines(start=first_pending(processed)):
+                if line_num in processed:
+                    continue
+                try:
+                    prepared = prepare_record(line_num, line)
+                except json.JSONDecodeError:
+                    print(f"警告: 第 {line_num} 行不是有效的JSON，已跳过。")
+                    prepared = None
+                if prepared is None:
+                    pbar.update(1)
+                    continue
+                output_record, llm_messages = prepared
+                if cache is not None:
+                    cached = cache.get(cache.make_key(llm_messages, GENERATION_PARAMS))
+                    if cached is not None and (validator is None or validator(cached["content"]) is None):
+                        write_record(finish_record(output_record, cached))
+                        continue
+                pending[line_num] = (line, output_record, llm_messages)
+                requests.append(BatchRequest(line_num, llm_messages, GENERATION_PARAMS))
+
+            fallback = []
+            for batch_result in runner.run(requests):
+                entry = pending.pop(int(batch_result.custom_id), None)
+                if entry is None:
+                    # 续跑的任务中已经处理过的记录
+                    continue
+                line, output_record, llm_messages = entry
+                if not batch_result.ok:
+                    fallback.append((int(batch_result.custom_id), line))
+                    continue
+                if validator is not None:
+                    reason = validator(batch_result.content)
+                    session.metrics.emit("validation", model=batch_result.model, key="batch", reason=reason)
+                    if reason is not None:
+                        logger.warning("第 %s 行的批处理输出未通过校验: %s", batch_result.custom_id, reason)
+                        fallback.append((int(batch_result.custom_id), line))
+                        continue
+                result = {"status": "success", "model": batch_result.model, "content": batch_result.content}
+                if cache is not None:
+                    cache.put(cache.make_key(llm_messages, GENERATION_PARAMS), result)
+                write_record(finish_record(output_record, result))
+
+            if fallback:
+                print(f"{len(fallback)} 条记录在批处理中失败，回退到逐条调用。")
+                fallback.sort()
+                if workers <= 1:
+                    for line_num, line in fallback:
+                        write_record(process_record(orchestrator, line_num, line))
+                else:
+                    _run_concurrently(orchestrator, fallback, write_record, workers, ordered=False)
+            pbar.close()
 
     except FileNotFoundError:
         print(f"错误: 输入文件未找到于 '{input_path}'")
         sys.exit(1)
-        
+    finally:
+        runner.close()
+        _log_reject_rates(session.metrics.snapshot())
+        session.close()
+
     print(f"\n处理完成！所有结果已保存到 '{output_path}'。")
 
 
+def shard_pool_by_key(pool, shard_index, shard_count):
+    """
+    按 API Key 把模型池切分为 shard_count 份，返回第 shard_index 份。
+    多台主机各取一份时，同一个密钥只会被一个进程使用，各自的限流与熔断状态互不干扰。
+    """
+    keys = sorted({api_key for _, api_key, _ in pool})
+    mine = {api_key for i, api_key in enumerate(keys) if i % shard_count == shard_index}
+    items = [item for item in pool if item[1] in mine]
+    if not items:
+        raise ValueError(f"密钥分片 {shard_index}/{shard_count} 中没有任何密钥 (共 {len(keys)} 个密钥)")
+    return ModelPool(items)
+
+
+def process_dataset_queue(input_path, queue_path, output_path=None, workers=1, cache_path=None,
+                          worker_id=None, key_shard=None, lease_seconds=120.0, max_attempts=3, poll_interval=5.0,
+                          queue_wal=True, validator=None):
+    """
+    多进程 / 多主机模式：通过共享的 SQLite 工作队列分摊同一个数据集。
+    每个进程领取一批记录的租约，处理期间由后台线程续租；进程崩溃后租约到期，记录会被其他进程重新领取。
+    结果保存在队列数据库中，每个 line_number 恰好一份；全部完成后导出到 output_path (按 line_number 排序)。
+    在多台主机上运行时，队列数据库应放在共享文件系统上，并设置 queue_wal=False (网络文件系统不支持 WAL)。
+    :param worker_id: 本进程的标识，默认由主机名与进程号生成。
+    :param key_shard: 可选的 (分片序号, 分片总数)，本进程只使用模型池中属于该分片的密钥。
+    :param max_attempts: 每条记录最多尝试的次数；所有模型都失败的记录会在之后重试，最后一次的错误结果照常写出。
+    :param validator: 可选的输出校验器，所有项的输出都未通过校验的记录与调用失败的记录一样稍后重试。
+    """
+    worker = worker_id or default_worker_id()
+    session = ChatSession()
+    if cache_path:
+        session.cache = ResponseCache(cache_path)
+    session.validator = validator
+    if key_shard is not None:
+        session.pool = shard_pool_by_key(session.pool, *key_shard)
+    orchestrator = session.get_orchestrator()
+    queue = WorkQueue(queue_path, max_attempts=max_attempts, wal=queue_wal)
+
+    def handle(line_num, attempt, line):
+        output_record = process_record(orchestrator, line_num, line)
+        failed = output_record is not None and output_record["processed_by_model"] == "None"
+        if failed and attempt < max_attempts:
+            queue.fail(worker, line_num, output_record["optimized_response"])
+        elif not queue.complete(worker, line_num, output_record):
+            logger.warning("第 %d 行的租约已被其他进程接管，丢弃本进程的结果", line_num)
+        heartbeat.discard(line_num)
+
+    try:
+        with JsonlReader(input_path) as reader:
+            queue.populate(range(1, len(reader) + 1), source=os.path.abspath(input_path))
+            print(f"[{worker}] 已加入工作队列 '{queue_path}'，队列状态: {queue.stats()}")
+            with LeaseHeartbeat(queue, worker, lease_seconds) as heartbeat, \
+                    ThreadPoolExecutor(max_workers=workers) as executor:
+                while True:
+                    leased = queue.lease(worker, limit=workers * 2, lease_seconds=lease_seconds)
+                    if not leased:
+                        if queue.unfinished() == 0:
+                            break
+                        # 剩余的记录都被其他进程持有，等待它们完成或租约过期
+                        time.sleep(poll_interval)
+                        continue
+                    futures = []
+                    for line_num, attempt in leased:
+                        heartbeat.add(line_num)
+                        futures.append(executor.submit(handle, line_num, attempt, reader.line(line_num)))
+                    for future in futures:
+                        future.result()
+        stats = queue.stats()
+        print(f"[{worker}] 处理完成，队列状态: {stats}")
+        if output_path:
+            count = queue.export(output_path)
+            print(f"已将 {count} 条结果按 line_number 导出到 '{output_path}'。")
+    except FileNotFoundError:
+        print(f"错误: 输入文件未找到于 '{input_path}'")
+        sys.exit(1)
+    finally:
+        queue.release(worker)
+        queue.close()
+        _log_reject_rates(session.metrics.snapshot())
+        session.close()
+
+
 if __name__ == "__main__":
     INPUT_FILE = "dataset/智能网联汽车.jsonl"
     OUTPUT_FILE = "dataset/optimized_jds.jsonl"
-    
+    # 并发处理的记录数，可通过环境变量调整
+    WORKERS = int(os.getenv("OPTIMIZATION_WORKERS", "1"))
+    # 设置 OPTIMIZATION_CACHE=<缓存数据库路径> (如 dataset/.response_cache.sqlite3) 后，重跑时已成功的记录直接命中缓存
+    CACHE_FILE = os.getenv("OPTIMIZATION_CACHE") or None
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    # 设置 OPTIMIZATION_BATCH=1 使用厂商批处理接口；*_BATCH_BASE_URL 可指向本地替身服务器
+    USE_BATCH = os.getenv("OPTIMIZATION_BATCH", "") not in ("", "0")
+    BATCH_BASE_URLS = {
+        name: os.getenv(f"{name.upper()}_BATCH_BASE_URL")
+        for name in ("gemini", "zhipuai")
+        if os.getenv(f"{name.upper()}_BATCH_BASE_URL")
+    }
+
+    # 设置 OPTIMIZATION_QUEUE=<队列数据库路径> 后多个进程 / 主机可以共同处理同一个数据集；
+    # OPTIMIZATION_KEY_SHARD=<序号>/<总数> 让各进程使用互不重叠的密钥；队列位于网络文件系统上时设置 OPTIMIZATION_QUEUE_WAL=0
+    QUEUE_FILE = os.getenv("OPTIMIZATION_QUEUE")
+    QUEUE_WAL = os.getenv("OPTIMIZATION_QUEUE_WAL", "1") != "0"
+    KEY_SHARD = os.getenv("OPTIMIZATION_KEY_SHARD")
+    KEY_SHARD = tuple(int(part) for part in KEY_SHARD.split("/")) if KEY_SHARD else None
+
+    # 设置 OPTIMIZATION_DEDUP=<相似度阈值> (如 0.9) 后，近重复的记录每组只调用一次模型 (OPTIMIZATION_DEDUP_KEEP 可调整)
+    DEDUP_THRESHOLD = float(os.getenv("OPTIMIZATION_DEDUP")) if os.getenv("OPTIMIZATION_DEDUP") else None
+    DEDUP_KEEP = int(os.getenv("OPTIMIZATION_DEDUP_KEEP", "1"))
+    # 默认按 SYSTEM_PROMPT 的模板校验输出，不合格时立即换一个质量更高的模型重试；设置 OPTIMIZATION_VALIDATE=0 可关闭
+    VALIDATOR = JD_TEMPLATE_VALIDATOR if os.getenv("OPTIMIZATION_VALIDATE", "1") != "0" else None
+
     print("--- 开始批量优化职位描述文件 ---")
-    process_dataset_file(input_path=INPUT_FILE, output_path=OUTPUT_FILE)
\ No newline at end of file
+    if QUEUE_FILE:
+        process_dataset_queue(input_path=INPUT_FILE, queue_path=QUEUE_FILE, output_path=OUTPUT_FILE, workers=WORKERS,
+                              cache_path=CACHE_FILE, key_shard=KEY_SHARD, queue_wal=QUEUE_WAL, validator=VALIDATOR)
+    elif USE_BATCH:
+        process_dataset_file_batch(input_path=INPUT_FILE, output_path=OUTPUT_FILE, workers=WORKERS,
+                                   cache_path=CACHE_FILE, base_urls=BATCH_BASE_URLS, validator=VALIDATOR)
+    else:
+        process_dataset_file(input_path=INPUT_FILE, output_path=OUTPUT_FILE, workers=WORKERS, cache_path=CACHE_FILE,
+                             dedup_threshold=DEDUP_THRESHOLD, dedup_keep=DEDUP_KEEP, validator=VALIDATOR)
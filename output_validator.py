@@ -0,0 +1,106 @@
+# llm_framework/output_validator.py
+import re
+from typing import Callable, List, NamedTuple, Optional, Sequence
+
+# 校验器：接收模型输出的文本，通过时返回 None，否则返回拒绝原因
+Validator = Callable[[str], Optional[str]]
+
+# 列表条目：有序 ("1. ", "2、") 或无序 ("* ", "- ", "• ")
+DEFAULT_ITEM_PATTERN = r"^\s*(?:\d+\s*[.、．)]|[*\-•])\s+\S"
+# 代码块的起止标记：开头可带语言标记 (如 ```markdown)，模型也常把正文直接接在 ``` 之后 (```### 标题)
+_FENCE_OPEN = re.compile(r"^```[\w.+-]*[ \t]*\n?")
+_FENCE_CLOSE = re.compile(r"\n?```$")
+
+
+class OutputRejected(Exception):
+    """模型的输出未通过校验。调用本身成功，但结果不可用，编排器会换一项重试。"""
+    def __init__(self, model: str, reason: str):
+        super().__init__(f"模型 {model} 的输出未通过校验: {reason}")
+        self.model = model
+        self.reason = reason
+
+
+class Section(NamedTuple):
+    """
+    结构模板中的一节。
+    :param name: 该节的名称，用于拒绝原因。
+    :param heading: 匹配该节标题行的正则 (配合 ^ 从行首匹配)。
+    :param min_items: 该节 (到下一节标题为止) 至少包含的列表条目数。
+    :param max_items: 该节最多包含的列表条目数，None 表示不限。
+    """
+    name: str
+    heading: str
+    min_items: int = 0
+    max_items: Optional[int] = None
+
+
+class TemplateValidator:
+    """
+    按结构模板校验 Markdown 输出：各节标题必须按顺序出现，每节的列表条目数在要求的范围内，
+    且全文不含任何禁止的表述。只做正则与计数，单次校验的开销远小于一次模型调用。
+    """
+    def __init__(self, sections: Sequence[Section], forbidden: Sequence[str] = (),
+                 item_pattern: str = DEFAULT_ITEM_PATTERN, allow_code_fence: bool = False,
+                 allow_preamble: bool = False, min_length: int = 0):
+        """
+        :param forbidden: 不允许出现在输出中的正则 (如歧视性表述)。
+        :param allow_code_fence: 是否允许输出整体包在 ``` 代码块中；允许时校验代码块内的内容。
+        :param allow_preamble: 是否允许第一节标题之前有其他内容 (如“好的，以下是……”)。
+        :param min_length: 输出去掉首尾空白后的最小字符数。
+        """
+        self.sections = list(sections)
+        self._headings = [re.compile(section.heading, re.MULTILINE) for section in self.sections]
+        self._forbidden = [re.compile(pattern) for pattern in forbidden]
+        self._item = re.compile(item_pattern, re.MULTILINE)
+        self.allow_code_fence = allow_code_fence
+        self.allow_preamble = allow_preamble
+        self.min_length = min_length
+
+    def __call__(self, content: str) -> Optional[str]:
+        text = content.strip()
+        if text.startswith("```"):
+            if not self.allow_code_fence:
+                return "输出被包在代码块中"
+            text = _FENCE_CLOSE.sub("", _FENCE_OPEN.sub("", text, count=1), count=1).strip()
+        if len(text) < self.min_length:
+            return f"输出过短 ({len(text)} 字符)"
+        for pattern in self._forbidden:
+            match = pattern.search(text)
+            if match:
+                return f"包含禁止的表述: {match.group(0)}"
+
+        # 依次定位各节标题，每节的正文到下一节标题为止
+        positions: List[tuple] = []
+        start = 0
+        for section, heading in zip(self.sections, self._headings):
+            match = heading.search(text, start)
+            if match is None:
+                return f"缺少小节或小节顺序错误: {section.name}"
+            if not positions and match.start() and not self.allow_preamble:
+                return f"小节 {section.name} 之前有多余的内容"
+            positions.append((match.start(), match.end()))
+            start = match.end()
+        for index, section in enumerate(self.sections):
+            body_end = positions[index + 1][0] if index + 1 < len(positions) else len(text)
+            items = len(self._item.findall(text, positions[index][1], body_end))
+            if items < section.min_items or (section.max_items is not None and items > section.max_items):
+                expected = f"{section.min_items}-{section.max_items}" if section.max_items is not None \
+                    else f"至少 {section.min_items}"
+                return f"小节 {section.name} 有 {items} 个条目，应为 {expected} 个"
+        return None
+
+
+# main.py 与 optimization_aicars.py 的 SYSTEM_PROMPT 要求的职位描述模板。
+# 模板示例本身写在代码块中，模型常把整个输出包在 ``` 里，因此允许代码块；代码块之前的寒暄等内容仍会被拒绝
+JD_TEMPLATE_VALIDATOR = TemplateValidator(
+    sections=[
+        Section("职位名称", r"^###\s*\S"),
+        Section("岗位职责", r"^\*\*岗位职责[：:]\*\*", 3, 5),
+        Section("任职要求", r"^\*\*任职要求[：:]\*\*"),
+        Section("基本要求", r"^\*\*1\.\s*基本要求[：:]\*\*", 2),
+        Section("专业技能", r"^\*\*2\.\s*专业技能[：:]\*\*", 1),
+        Section("软技能", r"^\*\*3\.\s*软技能[：:]\*\*", 1),
+    ],
+    forbidden=[r"男性优先|女性优先|仅限男性|仅限女性|\d+\s*周?岁以下|年龄不超过|本地户籍|无不良嗜好|已婚|未婚"],
+    allow_code_fence=True,
+)
@@ -1,6 +1,7 @@
 # llm_framework/providers/base_provider.py
+import asyncio
 from abc import ABC, abstractmethod
-from typing import List, Dict, Generator
+from typing import List, Dict, Generator, AsyncGenerator
 
 class LLMProvider(ABC):
     """
@@ -37,5 +38,47 @@ class LLMProvider(ABC):
         yield ""
 
 
+    async def achat(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        """
+        异步对话。默认实现把同步的 chat 放到线程中执行；
+        拥有原生异步客户端的提供者应覆盖此方法。
+        """
+        return await asyncio.to_thread(self.chat, messages, **kwargs)
+
+    async def achat_stream(self, messages: List[Dict[str, str]], **kwargs) -> AsyncGenerator[str, None]:
+        """
+        异步流式对话。默认实现在线程中逐块推进同步的 chat_stream 生成器。
+        """
+        sentinel = object()
+        stream = self.chat_stream(messages, **kwargs)
+        try:
+            while True:
+                chunk = await asyncio.to_thread(next, stream, sentinel)
+                if chunk is sentinel:
+                    break
+                yield chunk
+        finally:
+            try:
+                stream.close()
+            except ValueError:
+                # 读取被取消时工作线程可能仍在推进生成器，此时无法关闭，交由其自然结束
+                pass
+
+    def close(self):
+        """
+        释放底层客户端持有的连接池。提供者被缓存淘汰或工厂关闭时调用。
+        """
+        client = getattr(self, "client", None)
+        close = getattr(client, "close", None)
+        if callable(close):
+            close()
+
+    async def aclose(self):
+        """
+        异步关闭。默认直接调用 close()；持有异步客户端的提供者应覆盖此方法，
+        一并释放异步连接池。
+        """
+        self.close()
+
     def __repr__(self):
         return f"{self.__class__.__name__}(model_name='{self.model_name}')"
\ No newline at end of file
@@ -1,20 +1,31 @@
 import requests
 import os
-from providers.base_provider import BaseProvider
+from typing import List, Dict, Generator
+from providers.base_provider import LLMProvider
 
-class CloudflareProvider(BaseProvider):
-    def __init__(self):
+class CloudflareProvider(LLMProvider):
+    def __init__(self, model_name: str = "@cf/meta/llama-3-8b-instruct", api_key: str = None, **kwargs):
+        super().__init__(model_name, api_key, **kwargs)
         self.api_base_url = os.getenv("CLOUDFLARE_API_BASE_URL", "https://api.cloudflare.com/client/v4/accounts/03157a3894e23338c180e62608b43b2d/ai/run/")
-        self.api_token = os.getenv("CLOUDFLARE_API_TOKEN")
+        self.api_token = os.getenv("CLOUDFLARE_API_TOKEN") or api_key
         if not self.api_token:
             raise ValueError("CLOUDFLARE_API_TOKEN environment variable not set.")
         self.headers = {"Authorization": f"Bearer {self.api_token}"}
+        # 复用同一个会话，保持 keep-alive 连接
+        self.client = requests.Session()
+        self.client.headers.update(self.headers)
 
     def run(self, model_name, messages):
         input_data = {"messages": messages}
-        response = requests.post(f"{self.api_base_url}{model_name}", headers=self.headers, json=input_data)
+        response = self.client.post(f"{self.api_base_url}{model_name}", json=input_data)
         response.raise_for_status()  # Raise an exception for HTTP errors
         return response.json()
 
+    def chat(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        return self.run(self.model_name, messages)["result"]["response"]
+
+    def chat_stream(self, messages: List[Dict[str, str]], **kwargs) -> Generator[str, None, None]:
+        yield self.chat(messages, **kwargs)
+
     def get_supported_models(self):
-        return ["@cf/meta/llama-3-8b-instruct"] # Example model, add more as needed
\ No newline at end of file
+        return ["@cf/meta/llama-3-8b-instruct"] # Example model, add more as needed
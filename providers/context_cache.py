@@ -0,0 +1,139 @@
+# llm_framework/providers/context_cache.py
+import hashlib
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from token_counter import estimate_text_tokens
+
+# create(ttl 秒) -> (缓存名称, 过期时间戳)；renew(缓存名称, ttl 秒) -> 新的过期时间戳
+CreateFn = Callable[[int], Tuple[str, float]]
+RenewFn = Callable[[str, int], float]
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("name", "expires_at", "failed_until")
+
+    def __init__(self):
+        self.name: Optional[str] = None
+        self.expires_at = 0.0
+        # 创建失败 (模型不支持、提示词低于最小 token 数等) 后，在此时间之前不再尝试
+        self.failed_until = 0.0
+
+
+class ContextCacheRegistry:
+    """
+    服务端上下文缓存 (如 Gemini 的 cachedContents) 的句柄登记表。
+
+    按 (API Key 指纹, 模型, 系统提示词哈希) 记录已创建的缓存名称与过期时间：
+    - 首次遇到某个足够长的系统提示词时创建缓存，同一个键的并发请求只会创建一次；
+    - 剩余有效期不足 renew_margin 秒时延长 TTL，延长失败则重新创建；
+    - 创建失败时返回 None，调用方改为直接内联发送提示词，并在 retry_after 秒内不再尝试。
+    登记表只保存缓存名称，不保存密钥与提示词原文；多个提供者实例可以共享同一个登记表。
+
+    注意：Gemini 显式缓存要求缓存内容至少约 1024 tokens (2.0 系列模型要求更高)，低于 min_tokens 的提示词
+    不会创建缓存。optimization_aicars.py 当前的 SYSTEM_PROMPT 约 1127 字符、估算约 848 tokens，
+    低于该下限，因此对它而言本登记表不起作用，提示词照常内联发送；只有更长的系统提示词才会被缓存。
+    """
+    def __init__(self, ttl: int = 3600, renew_margin: int = 300, retry_after: float = 600.0,
+                 min_tokens: int = 1024, clock=time.time):
+        """
+        :param ttl: 创建或延长缓存时申请的存活秒数。
+        :param renew_margin: 剩余有效期低于该秒数时延长 TTL。
+        :param retry_after: 创建失败后多久再尝试创建。
+        :param min_tokens: 估算 token 数低于该值的提示词不缓存，对应服务端对缓存内容的最小 token 数要求。
+        """
+        self.ttl = ttl
+        self.renew_margin = renew_margin
+        self.retry_after = retry_after
+        self.min_tokens = min_tokens
+        self._clock = clock
+        self._entries: Dict[str, _Entry] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.creates = 0
+        self.renewals = 0
+        self.failures = 0
+
+    @staticmethod
+    def make_key(api_key: str, model_name: str, prompt: str) -> str:
+        key_digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        prompt_digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return f"{key_digest}:{model_name}:{prompt_digest}"
+
+    def cacheable(self, prompt: Optional[str]) -> bool:
+        # 估算的 token 数不会超过字符数，字符数不足下限时不必逐字统计
+        if not prompt or len(prompt) < self.min_tokens:
+            return False
+        return estimate_text_tokens(prompt) >= self.min_tokens
+
+    def peek(self, key: str) -> Optional[str]:
+        """不加锁地返回仍然新鲜 (无需延长) 的缓存名称，否则返回 None。"""
+        entry = self._entries.get(key)
+        if entry is not None and entry.name and entry.expires_at - self._clock() > self.renew_margin:
+            self.hits += 1
+            return entry.name
+        return None
+
+    def get(self, key: str, create: CreateFn, renew: RenewFn) -> Optional[str]:
+        """
+        返回可用的缓存名称，必要时创建或延长；无法使用缓存时返回 None。
+        create/renew 在该键的锁内调用，抛出的异常会被记录为失败而不会向上传播。
+        """
+        name = self.peek(key)
+        if name is not None:
+            return name
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+            entry = self._entries.setdefault(key, _Entry())
+        with key_lock:
+            now = self._clock()
+            # 等锁期间可能已由其他线程创建或延长
+            if entry.name and entry.expires_at - now > self.renew_margin:
+                self.hits += 1
+                return entry.name
+            if now < entry.failed_until:
+                return None
+            if entry.name and entry.expires_at > now:
+                try:
+                    entry.expires_at = renew(entry.name, self.ttl)
+                    self.renewals += 1
+                    return entry.name
+                except Exception as e:
+                    # 延长失败 (例如缓存已被删除)，改为重新创建
+                    logger.debug("延长上下文缓存 %s 失败: %s", entry.name, e)
+                    entry.name = None
+            try:
+                entry.name, entry.expires_at = create(self.ttl)
+                self.creates += 1
+                return entry.name
+            except Exception as e:
+                logger.info("创建上下文缓存失败，%.0f 秒内改为内联发送提示词: %s", self.retry_after, e)
+                entry.name = None
+                entry.failed_until = now + self.retry_after
+                self.failures += 1
+                return None
+
+    def invalidate(self, key: str):
+        """服务端报告缓存不存在或已过期时调用，下次使用时重新创建。"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.name = None
+            entry.expires_at = 0.0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": sum(1 for entry in self._entries.values() if entry.name),
+            "hits": self.hits,
+            "creates": self.creates,
+            "renewals": self.renewals,
+            "failures": self.failures,
+        }
+
+
+# 默认在所有提供者实例之间共享，提供者被工厂淘汰后重建时仍能复用已创建的缓存
+shared_registry = ContextCacheRegistry()
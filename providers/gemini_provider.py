@@ -1,27 +1,38 @@
 # llm_framework/providers/gemini_provider.py
+import asyncio
+import logging
+import time
 from google import genai
-from typing import List, Dict, Generator
+from typing import List, Dict, Generator, AsyncGenerator, Any, Optional
 from .base_provider import LLMProvider
-from google.genai import types
+from .context_cache import ContextCacheRegistry, shared_registry
+from google.genai import errors, types
+
+logger = logging.getLogger(__name__)
 
 class GeminiProvider(LLMProvider):
     """
     Google Gemini 模型的具体实现，使用 genai.Client。
+
+    足够长的系统提示词会被创建为服务端缓存 (cachedContents)，之后的请求只引用缓存名称，
+    不再重复发送提示词；缓存句柄由 ContextCacheRegistry 按 (密钥, 模型, 提示词哈希) 管理。
     """
     def __init__(self, model_name: str, api_key: str, **kwargs):
+        """
+        :param kwargs: 可选的 system_prompt (调用时传入的 system_prompt 优先)、thinking (思考预算)，
+                       以及 context_cache (ContextCacheRegistry，默认为进程内共享的登记表，传 None 关闭上下文缓存)。
+        """
         super().__init__(model_name, api_key, **kwargs)
-        # 配置 API 密钥
-        extra_args = {}
-        if "system_prompt" in kwargs.keys():
-            extra_args["system_instruction"] = kwargs["system_prompt"]
-        if "thinking" in kwargs.keys():
-            extra_args["thinking_config"] = types.ThinkingConfig(thinking_budget=kwargs["thinking"])
-        
-        self.generation_config = types.GenerateContentConfig(**extra_args)
-        
+        self.system_prompt: Optional[str] = kwargs.get("system_prompt")
+        self.thinking: Optional[int] = kwargs.get("thinking")
+        self.context_cache: Optional[ContextCacheRegistry] = kwargs.get("context_cache", shared_registry)
+        # Gemma 系列不支持 system_instruction 与上下文缓存，系统提示词并入第一条用户消息
+        self.is_gemma = "gemma" in model_name.lower()
+
         self.client = genai.Client(api_key=self.api_key)
-        
-    def _prepare_contents(self, messages: List[Dict[str, str]]) -> List[Dict]:
+
+    @staticmethod
+    def _prepare_contents(messages: List[Dict[str, str]]) -> List[Dict]:
         """
         私有辅助函数，将我们的标准消息格式转换为 Gemini 的内容格式。
         """
@@ -31,21 +42,111 @@ class GeminiProvider(LLMProvider):
             contents.append({'role': role, 'parts': [{'text': msg['content']}]})
         return contents
 
+    # --- 系统提示词与上下文缓存 ---
+
+    def _system_prompt(self, kwargs: Dict[str, Any]) -> Optional[str]:
+        return kwargs.get("system_prompt") or self.system_prompt
+
+    def _cache_key(self, system_prompt: Optional[str]) -> Optional[str]:
+        registry = self.context_cache
+        if registry is None or self.is_gemma or not registry.cacheable(system_prompt):
+            return None
+        return registry.make_key(self.api_key, self.model_name, system_prompt)
+
+    @staticmethod
+    def _expires_at(cached: types.CachedContent, ttl: int) -> float:
+        if cached.expire_time is not None:
+            return cached.expire_time.timestamp()
+        return time.time() + ttl
+
+    def _create_cache(self, system_prompt: str, ttl: int):
+        cached = self.client.caches.create(
+            model=self.model_name,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_prompt, ttl=f"{ttl}s", display_name="manyllm-system-prompt"
+            ),
+        )
+        logger.debug("已为模型 %s 创建上下文缓存 %s", self.model_name, cached.name)
+        return cached.name, self._expires_at(cached, ttl)
+
+    def _renew_cache(self, name: str, ttl: int) -> float:
+        cached = self.client.caches.update(name=name, config=types.UpdateCachedContentConfig(ttl=f"{ttl}s"))
+        return self._expires_at(cached, ttl)
+
+    def _cached_content(self, cache_key: Optional[str], system_prompt: Optional[str]) -> Optional[str]:
+        """返回可用的缓存名称；不适用或创建失败时返回 None，此时提示词随请求内联发送。"""
+        if cache_key is None:
+            return None
+        return self.context_cache.get(
+            cache_key, lambda ttl: self._create_cache(system_prompt, ttl), self._renew_cache
+        )
+
+    async def _acached_content(self, cache_key: Optional[str], system_prompt: Optional[str]) -> Optional[str]:
+        if cache_key is None:
+            return None
+        # 缓存仍然新鲜时不必切换线程；需要创建或延长时在线程中执行，并与同步调用共用同一把锁
+        return self.context_cache.peek(cache_key) or await asyncio.to_thread(
+            self._cached_content, cache_key, system_prompt
+        )
+
+    def _drop_stale_cache(self, error: Exception, cache_key: Optional[str], cached_name: Optional[str]) -> bool:
+        """
+        服务端报告引用的缓存不存在或已过期时，作废该句柄并返回 True，调用方改为内联提示词重试一次。
+        """
+        if cached_name is None or not isinstance(error, errors.APIError):
+            return False
+        if error.code not in (400, 403, 404) or "cache" not in str(error).lower():
+            return False
+        logger.debug("上下文缓存 %s 已失效，改为内联提示词重试: %s", cached_name, error)
+        self.context_cache.invalidate(cache_key)
+        return True
+
+    def _request(self, messages: List[Dict[str, str]], kwargs: Dict[str, Any],
+                 system_prompt: Optional[str], cached_name: Optional[str]) -> Dict[str, Any]:
+        """构造 generate_content 的参数。"""
+        extra_args = {}
+        if kwargs.get("temperature") is not None:
+            extra_args["temperature"] = kwargs["temperature"]
+        if kwargs.get("max_tokens") is not None:
+            extra_args["max_output_tokens"] = kwargs["max_tokens"]
+        if self.thinking is not None:
+            extra_args["thinking_config"] = types.ThinkingConfig(thinking_budget=self.thinking)
+        contents = self._prepare_contents(messages)
+        if cached_name is not None:
+            extra_args["cached_content"] = cached_name
+        elif system_prompt and not self.is_gemma:
+            extra_args["system_instruction"] = system_prompt
+        elif system_prompt and contents:
+            first = contents[0]
+            first["parts"] = [{"text": f"{system_prompt}\n\n{first['parts'][0]['text']}"}]
+        return {
+            "model": self.model_name,
+            "contents": contents,
+            "config": types.GenerateContentConfig(**extra_args),
+        }
+
+    # --- 对话 ---
+
     def chat(self, messages: List[Dict[str, str]], **kwargs) -> str:
         """
         非流式聊天实现。
         """
         try:
-            contents = self._prepare_contents(messages)
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=contents,
-                config = self.generation_config
-            )
-
-            return response.text
+            system_prompt = self._system_prompt(kwargs)
+            cache_key = self._cache_key(system_prompt)
+            cached_name = self._cached_content(cache_key, system_prompt)
+            while True:
+                try:
+                    response = self.client.models.generate_content(
+                        **self._request(messages, kwargs, system_prompt, cached_name)
+                    )
+                    return response.text
+                except Exception as e:
+                    if not self._drop_stale_cache(e, cache_key, cached_name):
+                        raise
+                    cached_name = None
         except Exception as e:
-            print(f"调用 Gemini API (非流式) 时出错: {e}")
+            logger.debug("调用 Gemini API (非流式) 时出错: %s", e)
             raise e
 
     def chat_stream(self, messages: List[Dict[str, str]], **kwargs) -> Generator[str, None, None]:
@@ -53,22 +154,80 @@ class GeminiProvider(LLMProvider):
         流式聊天实现。
         """
         try:
-            contents = self._prepare_contents(messages)
-            generation_config = {
-                'temperature': kwargs.get('temperature', 0.7),
-                'max_output_tokens': kwargs.get('max_tokens', 1024)
-            }
-            # contents = [_["content"] for _ in messages]
-            # 调用流式接口
-            stream = self.client.models.generate_content_stream(
-                model=self.model_name,
-                contents=contents
-            )
-
-            for chunk in stream:
-                if chunk.text:
-                    yield chunk.text
+            system_prompt = self._system_prompt(kwargs)
+            cache_key = self._cache_key(system_prompt)
+            cached_name = self._cached_content(cache_key, system_prompt)
+            yielded = False
+            while True:
+                try:
+                    stream = self.client.models.generate_content_stream(
+                        **self._request(messages, kwargs, system_prompt, cached_name)
+                    )
+                    for chunk in stream:
+                        if chunk.text:
+                            yielded = True
+                            yield chunk.text
+                    return
+                except Exception as e:
+                    if yielded or not self._drop_stale_cache(e, cache_key, cached_name):
+                        raise
+                    cached_name = None
+        except Exception as e:
+            logger.debug("调用 Gemini API (流式) 时出错: %s", e)
+            raise e
+
+    async def achat(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        """
+        非流式聊天的原生异步实现，使用 client.aio。
+        """
+        try:
+            system_prompt = self._system_prompt(kwargs)
+            cache_key = self._cache_key(system_prompt)
+            cached_name = await self._acached_content(cache_key, system_prompt)
+            while True:
+                try:
+                    response = await self.client.aio.models.generate_content(
+                        **self._request(messages, kwargs, system_prompt, cached_name)
+                    )
+                    return response.text
+                except Exception as e:
+                    if not self._drop_stale_cache(e, cache_key, cached_name):
+                        raise
+                    cached_name = None
         except Exception as e:
-            print(f"调用 Gemini API (流式) 时出错: {e}")
+            logger.debug("调用 Gemini API (异步非流式) 时出错: %s", e)
             raise e
 
+    async def achat_stream(self, messages: List[Dict[str, str]], **kwargs) -> AsyncGenerator[str, None]:
+        """
+        流式聊天的原生异步实现，使用 client.aio。
+        """
+        try:
+            system_prompt = self._system_prompt(kwargs)
+            cache_key = self._cache_key(system_prompt)
+            cached_name = await self._acached_content(cache_key, system_prompt)
+            yielded = False
+            while True:
+                try:
+                    stream = await self.client.aio.models.generate_content_stream(
+                        **self._request(messages, kwargs, system_prompt, cached_name)
+                    )
+                    async for chunk in stream:
+                        if chunk.text:
+                            yielded = True
+                            yield chunk.text
+                    return
+                except Exception as e:
+                    if yielded or not self._drop_stale_cache(e, cache_key, cached_name):
+                        raise
+                    cached_name = None
+        except Exception as e:
+            logger.debug("调用 Gemini API (异步流式) 时出错: %s", e)
+            raise e
+
+    async def aclose(self):
+        """
+        先关闭异步客户端的连接池，再关闭同步客户端。
+        """
+        await self.client.aio.aclose()
+        self.close()
@@ -1,8 +1,11 @@
 # llm_framework/providers/zhipuai_provider.py
+import logging
 from zai import ZhipuAiClient
 from typing import List, Dict, Generator
 from .base_provider import LLMProvider
 
+logger = logging.getLogger(__name__)
+
 class ZhipuAIProvider(LLMProvider):
     """
     ZhipuAI GLM 模型的具体实现，使用 ZhipuAiClient。
@@ -11,6 +14,17 @@ class ZhipuAIProvider(LLMProvider):
         super().__init__(model_name, api_key, **kwargs)
         self.client = ZhipuAiClient(api_key=self.api_key)
 
+    @staticmethod
+    def _with_system_prompt(messages: List[Dict[str, str]], kwargs: Dict) -> List[Dict[str, str]]:
+        """
+        把 system_prompt 作为第一条 system 消息发送。固定的前缀能命中智谱服务端的隐式上下文缓存，
+        重复部分按缓存 token 计费。
+        """
+        system_prompt = kwargs.get("system_prompt")
+        if not system_prompt or (messages and messages[0].get("role") == "system"):
+            return messages
+        return [{"role": "system", "content": system_prompt}] + messages
+
     def chat(self, messages: List[Dict[str, str]], **kwargs) -> str:
         """
         非流式聊天实现。
@@ -18,7 +32,7 @@ class ZhipuAIProvider(LLMProvider):
         try:
             response = self.client.chat.completions.create(
                 model=self.model_name,
-                messages=messages,
+                messages=self._with_system_prompt(messages, kwargs),
                 thinking={
                     "type": "disabled",
                 },
@@ -27,7 +41,7 @@ class ZhipuAIProvider(LLMProvider):
             )
             return response.choices[0].message.content
         except Exception as e:
-            print(f"调用 ZhipuAI API (非流式) 时出错: {e}")
+            logger.debug("调用 ZhipuAI API (非流式) 时出错: %s", e)
             raise e
 
     def chat_stream(self, messages: List[Dict[str, str]], **kwargs) -> Generator[str, None, None]:
@@ -37,7 +51,7 @@ class ZhipuAIProvider(LLMProvider):
         try:
             response = self.client.chat.completions.create(
                 model=self.model_name,
-                messages=messages,
+                messages=self._with_system_prompt(messages, kwargs),
                 thinking={
                     "type": "disabled",
                 },
@@ -52,5 +66,5 @@ class ZhipuAIProvider(LLMProvider):
                 if chunk.choices[0].delta.content:
                     yield chunk.choices[0].delta.content
         except Exception as e:
-            print(f"调用 ZhipuAI API (流式) 时出错: {e}")
+            logger.debug("调用 ZhipuAI API (流式) 时出错: %s", e)
             raise e
\ No newline at end of file
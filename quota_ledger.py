@@ -0,0 +1,253 @@
+# llm_framework/quota_ledger.py
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Any, Dict, Optional, Set, Tuple
+from selection_strategy import ItemGate, PoolItem
+
+logger = logging.getLogger(__name__)
+
+# 429 中表明是“每日额度”耗尽 (而不是每分钟限流) 的特征，例如 Gemini 的
+# quotaId: GenerateRequestsPerDayPerProjectPerModel-FreeTier
+_DAILY_QUOTA_PATTERN = re.compile(r"per[ _-]?day|daily|每日|当日|今日", re.IGNORECASE)
+
+# 账本中的键: (模型, 密钥指纹)。磁盘上只保存密钥的哈希，不保存密钥本身
+LedgerKey = Tuple[str, str]
+
+
+def is_daily_quota_error(exc: BaseException) -> bool:
+    """错误信息是否表明该 (模型, 密钥) 的每日额度已经用完。"""
+    return bool(_DAILY_QUOTA_PATTERN.search(str(exc)))
+
+
+def key_fingerprint(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+class _Usage:
+    __slots__ = ("day", "resets_at", "requests", "pending", "exhausted", "reason")
+
+    def __init__(self, day: str, resets_at: float, requests: int = 0, exhausted: bool = False,
+                 reason: Optional[str] = None):
+        self.day = day                  # 额度周期 (重置时区中的日期)
+        self.resets_at = resets_at      # 额度重置的时间戳，之后本条记录作废
+        self.requests = requests        # 本周期内所有进程的请求数 (含尚未写入账本的部分)
+        self.pending = 0                # 本进程尚未写入账本的请求数
+        self.exhausted = exhausted
+        self.reason = reason
+
+
+class QuotaLedger(ItemGate):
+    """
+    持久化的每日额度账本，按 (模型, 密钥) 记录当日请求数与“额度已耗尽”状态，保存在 SQLite 中。
+
+    - 提供者返回每日额度耗尽的 429 时，该项被标记为耗尽，直到额度重置时间 (默认太平洋时间午夜，
+      与 Gemini 免费层一致；元数据中的 quota_timezone 可覆盖) 之前都不可用；
+    - 元数据配置了 rpd (每日请求数) 时，本地计数达到上限即视为耗尽，不必先撞上一次 429；
+    - 账本在启动时加载，进程重启后不再让每个已耗尽的密钥先失败一次；
+      多个进程共用同一个账本文件时，请求数按增量合并，耗尽状态每隔 sync_interval 秒互相可见。
+    请求计数先累积在内存中，每隔 sync_interval 秒批量写入；耗尽状态立即写入。
+    """
+    def __init__(self, path: str, timezone_name: str = "America/Los_Angeles", sync_interval: float = 10.0,
+                 clock=time.time):
+        """
+        :param path: SQLite 数据库文件路径，不存在时自动创建。
+        :param timezone_name: 默认的额度重置时区 (IANA 名称)，每日额度在该时区的午夜重置。
+        :param sync_interval: 与账本文件同步 (写入计数、读取其他进程的状态) 的最短间隔秒数。
+        :param clock: 返回 Unix 时间戳的时钟。账本跨进程保存，因此使用墙上时钟而不是单调时钟。
+        """
+        self.path = path
+        self.timezone_name = timezone_name
+        self.sync_interval = sync_interval
+        self._clock = clock
+        self._usage: Dict[LedgerKey, _Usage] = {}
+        self._fingerprints: Dict[str, str] = {}
+        self._timezones: Dict[str, tzinfo] = {}
+        self._dirty: Set[LedgerKey] = set()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS quota ("
+            " model TEXT NOT NULL, key_id TEXT NOT NULL, day TEXT NOT NULL, resets_at REAL NOT NULL,"
+            " requests INTEGER NOT NULL DEFAULT 0, exhausted INTEGER NOT NULL DEFAULT 0, reason TEXT,"
+            " updated_at REAL NOT NULL, PRIMARY KEY (model, key_id))"
+        )
+        self._conn.commit()
+        self._last_sync = 0.0
+        with self._lock:
+            self._sync()
+
+    # --- 额度周期 ---
+
+    def _timezone(self, name: str) -> tzinfo:
+        tz = self._timezones.get(name)
+        if tz is None:
+            try:
+                from zoneinfo import ZoneInfo
+                tz = ZoneInfo(name)
+            except Exception as e:
+                # 缺少时区数据 (如 Windows 未安装 tzdata) 时退回 UTC，重置时间最多偏差一天内的几个小时
+                logger.warning("无法加载时区 %s，按 UTC 计算额度重置时间: %s", name, e)
+                tz = timezone.utc
+            self._timezones[name] = tz
+        return tz
+
+    def _window(self, item: PoolItem, now: float) -> Tuple[str, float]:
+        """返回 now 所在的额度周期 (日期, 重置时间戳)。"""
+        tz = self._timezone((item[2] or {}).get("quota_timezone") or self.timezone_name)
+        today = datetime.fromtimestamp(now, tz).date()
+        # 按日期构造次日午夜，夏令时切换当天 (23 或 25 小时) 也能得到正确的重置时间
+        tomorrow = today + timedelta(days=1)
+        return today.isoformat(), datetime(tomorrow.year, tomorrow.month, tomorrow.day, tzinfo=tz).timestamp()
+
+    def _key(self, item: PoolItem) -> LedgerKey:
+        fingerprint = self._fingerprints.get(item[1])
+        if fingerprint is None:
+            fingerprint = self._fingerprints[item[1]] = key_fingerprint(item[1])
+        return item[0], fingerprint
+
+    def _current(self, item: PoolItem, now: float) -> Tuple[LedgerKey, _Usage]:
+        """返回该项本周期的用量记录，上一周期的记录在重置后被替换。调用方需持有锁。"""
+        key = self._key(item)
+        usage = self._usage.get(key)
+        if usage is None or now >= usage.resets_at:
+            usage = self._usage[key] = _Usage(*self._window(item, now))
+        return key, usage
+
+    # --- ItemGate ---
+
+    def is_available(self, item: PoolItem) -> bool:
+        usage = self._usage.get(self._key(item))
+        if usage is None or self._clock() >= usage.resets_at:
+            return True
+        if usage.exhausted:
+            return False
+        rpd = (item[2] or {}).get("rpd")
+        return not rpd or usage.requests < rpd
+
+    def retry_after(self, item: PoolItem) -> Optional[float]:
+        """额度耗尽的项距离重置的秒数。"""
+        if self.is_available(item):
+            return None
+        remaining = self._usage[self._key(item)].resets_at - self._clock()
+        return remaining if remaining > 0 else None
+
+    # --- 记录 ---
+
+    def record_success(self, item: PoolItem):
+        """记录一次成功的请求。"""
+        with self._lock:
+            now = self._clock()
+            key, usage = self._current(item, now)
+            usage.requests += 1
+            usage.pending += 1
+            self._dirty.add(key)
+            rpd = (item[2] or {}).get("rpd")
+            if rpd and usage.requests >= rpd and not usage.exhausted:
+                usage.exhausted = True
+                usage.reason = f"达到每日请求上限 rpd={rpd}"
+                self._sync()
+            elif now - self._last_sync >= self.sync_interval:
+                self._sync()
+
+    def record_failure(self, item: PoolItem, exc: BaseException) -> bool:
+        """
+        检查一次 429 是否是每日额度耗尽，是则标记该项耗尽直到重置并立即写入账本。
+        :return: 是否被判定为每日额度耗尽。
+        """
+        if not is_daily_quota_error(exc):
+            return False
+        with self._lock:
+            now = self._clock()
+            key, usage = self._current(item, now)
+            if not usage.exhausted:
+                usage.exhausted = True
+                usage.reason = str(exc)[:500]
+                self._dirty.add(key)
+                self._sync()
+                logger.info("模型=%s, Key=...%s 的每日额度已耗尽，%s 后重置",
+                            item[0], item[1][-4:], timedelta(seconds=int(usage.resets_at - now)))
+        return True
+
+    # --- 持久化 ---
+
+    def _sync(self):
+        """
+        把本进程累积的计数与耗尽状态写入账本，再读回所有进程的最新状态。调用方需持有锁。
+        """
+        now = self._clock()
+        self._last_sync = now
+        rows = [
+            (key[0], key[1], usage.day, usage.resets_at, usage.pending, int(usage.exhausted), usage.reason, now)
+            for key, usage in ((key, self._usage[key]) for key in self._dirty if key in self._usage)
+        ]
+        try:
+            with self._conn:
+                if rows:
+                    self._conn.executemany(
+                        "INSERT INTO quota (model, key_id, day, resets_at, requests, exhausted, reason, updated_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                        " ON CONFLICT (model, key_id) DO UPDATE SET"
+                        "  requests = CASE WHEN quota.day = excluded.day"
+                        "   THEN quota.requests + excluded.requests ELSE excluded.requests END,"
+                        "  exhausted = CASE WHEN quota.day = excluded.day"
+                        "   THEN MAX(quota.exhausted, excluded.exhausted) ELSE excluded.exhausted END,"
+                        "  reason = CASE WHEN excluded.exhausted THEN excluded.reason"
+                        "   WHEN quota.day = excluded.day THEN quota.reason END,"
+                        "  day = excluded.day, resets_at = excluded.resets_at, updated_at = excluded.updated_at",
+                        rows,
+                    )
+                stored = self._conn.execute(
+                    "SELECT model, key_id, day, resets_at, requests, exhausted, reason FROM quota WHERE resets_at > ?",
+                    (now,),
+                ).fetchall()
+        except sqlite3.Error as e:
+            # 账本只是优化手段，写入失败时保留内存中的计数，下次同步再试
+            logger.warning("同步额度账本失败: %s", e)
+            return
+        for key in self._dirty:
+            usage = self._usage.get(key)
+            if usage is not None:
+                usage.pending = 0
+        self._dirty.clear()
+        for model, key_id, day, resets_at, requests, exhausted, reason in stored:
+            usage = self._usage.get((model, key_id))
+            if usage is not None and usage.day != day and usage.resets_at > resets_at:
+                # 本进程已进入新周期，账本中还是其他进程写入的上一周期记录
+                continue
+            self._usage[(model, key_id)] = _Usage(day, resets_at, requests, bool(exhausted), reason)
+
+    def sync(self):
+        """立即与账本文件同步。"""
+        with self._lock:
+            self._sync()
+
+    def snapshot(self) -> Dict[LedgerKey, Dict[str, Any]]:
+        """本周期内有用量或已耗尽的 (模型, 密钥指纹) 及其状态，便于日志与调试。"""
+        now = self._clock()
+        with self._lock:
+            return {
+                key: {
+                    "day": usage.day,
+                    "requests": usage.requests,
+                    "exhausted": usage.exhausted,
+                    "resets_in": max(0.0, usage.resets_at - now),
+                    "reason": usage.reason,
+                }
+                for key, usage in self._usage.items()
+                if usage.resets_at > now
+            }
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            self._conn.close()
@@ -0,0 +1,153 @@
+# llm_framework/rate_limiter.py
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from selection_strategy import ItemGate, PoolItem, ItemIdentifier
+# 估算函数移到了 token_counter，这里保留导出以兼容旧的导入路径
+from token_counter import estimate_text_tokens, estimate_tokens
+
+class TokenBucket:
+    """
+    令牌桶：容量为 capacity，每秒补充 rate 个令牌。
+    允许 charge() 把余额扣成负数 (事后才知道的输出 token)，之后的预留需要等余额回正。
+    """
+    def __init__(self, capacity: float, rate: float, clock=time.monotonic):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self._clock = clock
+        self.tokens = float(capacity)
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
+
+    def wait_time(self, amount: float) -> float:
+        """距离余额足以支付 amount 还需等待的秒数。"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def try_consume(self, amount: float) -> bool:
+        # 超过桶容量的请求按满桶计，否则它永远无法被派发
+        amount = min(amount, self.capacity)
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def charge(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+    def refund(self, amount: float):
+        """退还 try_consume 预留的 amount 个令牌，余额不超过容量。"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+    def drain(self):
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+class RateLimiter(ItemGate):
+    """
+    按 (模型, 密钥) 维护 RPM/TPM 令牌桶，在派发前预留额度，避免主动撞上 429。
+
+    限额写在模型池的元数据中，例如 {"rpm": 15, "tpm": 1000000}；未配置的维度不限制。
+    令牌桶在首次遇到某项时按其元数据惰性创建。
+    """
+    def __init__(self, max_wait: float = 60.0, clock=time.monotonic):
+        """
+        :param max_wait: 所有项都被限流时，编排器愿意等待令牌补充的最长秒数；超过则视为无可用项。
+        """
+        self.max_wait = max_wait
+        self._clock = clock
+        self._buckets: Dict[ItemIdentifier, Tuple[Optional[TokenBucket], Optional[TokenBucket]]] = {}
+        self._lock = threading.Lock()
+
+    def _get_buckets(self, item: PoolItem) -> Tuple[Optional[TokenBucket], Optional[TokenBucket]]:
+        identifier = (item[0], item[1])
+        buckets = self._buckets.get(identifier)
+        if buckets is None:
+            metadata = item[2] or {}
+            rpm, tpm = metadata.get("rpm"), metadata.get("tpm")
+            buckets = (
+                TokenBucket(rpm, rpm / 60.0, self._clock) if rpm else None,
+                TokenBucket(tpm, tpm / 60.0, self._clock) if tpm else None,
+            )
+            self._buckets[identifier] = buckets
+        return buckets
+
+    def is_available(self, item: PoolItem) -> bool:
+        """该项是否还有至少一个请求的额度 (TPM 余额为正即可)。"""
+        with self._lock:
+            rpm_bucket, tpm_bucket = self._get_buckets(item)
+            if rpm_bucket is not None and rpm_bucket.available() < 1:
+                return False
+            return tpm_bucket is None or tpm_bucket.available() > 0
+
+    def retry_after(self, item: PoolItem) -> Optional[float]:
+        """距离该项恢复至少一个请求的额度还需等待的秒数。"""
+        with self._lock:
+            rpm_bucket, tpm_bucket = self._get_buckets(item)
+            wait = 0.0
+            if rpm_bucket is not None:
+                wait = rpm_bucket.wait_time(1)
+            if tpm_bucket is not None and tpm_bucket.available() <= 0:
+                wait = max(wait, tpm_bucket.wait_time(1))
+            return wait or None
+
+    def try_acquire(self, item: PoolItem, tokens: int = 0) -> bool:
+        """原子地预留一个请求和 tokens 个输入 token；任一维度不足则不预留并返回 False。"""
+        with self._lock:
+            rpm_bucket, tpm_bucket = self._get_buckets(item)
+            if tpm_bucket is not None and tpm_bucket.wait_time(tokens) > 0:
+                return False
+            if rpm_bucket is not None and not rpm_bucket.try_consume(1):
+                return False
+            if tpm_bucket is not None:
+                tpm_bucket.try_consume(tokens)
+            return True
+
+    def wait_time(self, item: PoolItem, tokens: int = 0) -> float:
+        """距离该项可以容纳这次请求还需等待的秒数。"""
+        with self._lock:
+            rpm_bucket, tpm_bucket = self._get_buckets(item)
+            wait = 0.0
+            if rpm_bucket is not None:
+                wait = max(wait, rpm_bucket.wait_time(1))
+            if tpm_bucket is not None:
+                wait = max(wait, tpm_bucket.wait_time(tokens))
+            return wait
+
+    def refund(self, item: PoolItem, tokens: int = 0):
+        """退还 try_acquire 预留的一个请求和 tokens 个输入 token (请求在发出前被取消)。"""
+        with self._lock:
+            rpm_bucket, tpm_bucket = self._get_buckets(item)
+            if rpm_bucket is not None:
+                rpm_bucket.refund(1)
+            if tpm_bucket is not None:
+                tpm_bucket.refund(tokens)
+
+    def commit(self, item: PoolItem, tokens: int):
+        """请求完成后补记事先无法预留的 token (如输出 token)。"""
+        with self._lock:
+            _, tpm_bucket = self._get_buckets(item)
+            if tpm_bucket is not None and tokens > 0:
+                tpm_bucket.charge(tokens)
+
+    def penalize(self, item: PoolItem):
+        """收到 429 说明本地估算偏乐观，清空该项的余额，等令牌自然补充。"""
+        with self._lock:
+            for bucket in self._get_buckets(item):
+                if bucket is not None:
+                    bucket.drain()
@@ -0,0 +1,134 @@
+# llm_framework/response_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class ResponseCache:
+    """
+    基于 SQLite 的持久化响应缓存，按内容寻址。
+
+    缓存键是规范化后的消息、系统提示词与生成参数的 SHA-256；默认不区分实际调用的模型，
+    key_by_model=True 时调用方指定的 model_name 也参与计算。
+    支持 TTL 过期、按最近访问时间的容量上限淘汰 (LRU)，以及命中/未命中计数。
+    """
+    def __init__(self, path: str, ttl: Optional[float] = None, max_entries: int = 100_000,
+                 key_by_model: bool = False, clock=time.time):
+        """
+        :param path: SQLite 数据库文件路径，不存在时自动创建。
+        :param ttl: 条目的存活秒数，None 表示永不过期。
+        :param max_entries: 最多保留的条目数，超出时淘汰最久未访问的条目。
+        :param clock: 返回 Unix 时间戳的时钟。缓存跨进程保存，因此使用墙上时钟。
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.key_by_model = key_by_model
+        self._clock = clock
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, result TEXT NOT NULL,"
+            " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def make_key(self, messages: List[Dict[str, str]], params: Dict[str, Any]) -> str:
+        """
+        计算请求的缓存键。消息只保留 role/content 并去除首尾空白，参数按键排序，
+        值为 None 的参数视为未传。
+        """
+        normalized_messages = [
+            [msg.get("role", ""), (msg.get("content") or "").strip()] for msg in messages
+        ]
+        normalized_params = {
+            k: (v.strip() if isinstance(v, str) else v)
+            for k, v in params.items()
+            if v is not None and (self.key_by_model or k != "model_name")
+        }
+        payload = json.dumps([normalized_messages, normalized_params], ensure_ascii=False,
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """命中时返回缓存的结果字典 (附带 "cached": True)，否则返回 None。"""
+        now = self._clock()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._count -= 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        result = json.loads(row[0])
+        result["cached"] = True
+        return result
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """写入一条成功的结果，必要时淘汰最久未访问的条目。"""
+        now = self._clock()
+        stored = {k: v for k, v in result.items() if k != "cached"}
+        with self._lock:
+            existed = self._conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, result, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, stored.get("model"), json.dumps(stored, ensure_ascii=False), now, now),
+            )
+            if not existed:
+                self._count += 1
+            if self._count > self.max_entries:
+                overflow = self._count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN"
+                    " (SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                    (overflow,),
+                )
+                self._count -= overflow
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        """删除所有已过期的条目，返回删除的条数。"""
+        if self.ttl is None:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (self._clock() - self.ttl,)
+            )
+            self._conn.commit()
+            self._count -= cursor.rowcount
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self._count,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,47 +1,195 @@
 #selection_strategy.py
 from abc import ABC, abstractmethod
-from typing import List, Tuple, Dict, Optional, Set
-import random
+from typing import List, Tuple, Dict, Optional, Set, Union
+import threading
+from model_pool import ModelPool, PoolItem, ItemIdentifier, iter_bits
 
-# 定义池中元素的类型别名，方便维护
-# 格式: (model_name, api_key, metadata_dict)
-PoolItem = Tuple[str, str, Dict]
-ItemIdentifier = Tuple[str, str]
+Pool = Union[ModelPool, List[PoolItem]]
+
+class ItemGate(ABC):
+    """
+    跨请求共享的可用性检查 (例如熔断器)。策略在选择时会跳过任一关卡判定为不可用的项。
+    """
+    @abstractmethod
+    def is_available(self, item: PoolItem) -> bool:
+        """
+        :return: 该项当前是否可以被派发。此方法应只读且足够廉价，策略可能对每一项调用它。
+        """
+        pass
+
+    def retry_after(self, item: PoolItem) -> Optional[float]:
+        """
+        该项被判定为不可用时，至少还需等待多少秒才可能恢复。
+        返回正数时策略会在 ModelPool 中屏蔽该项这么久，期间不再逐次检查；默认返回 None (不屏蔽)。
+        """
+        return None
 
 class SelectionStrategy(ABC):
     """
     选择策略的抽象基类。
     """
+    # 已注册的关卡。类属性默认为空，add_gate 时才在实例上创建，
+    # 未调用 super().__init__() 的子类同样可用；替换整个元组，选择时的并发遍历不受注册影响
+    gates: Tuple[ItemGate, ...] = ()
+
+    def add_gate(self, gate: ItemGate):
+        """注册一个可用性关卡；同一个关卡只会注册一次。"""
+        if gate not in self.gates:
+            self.gates = self.gates + (gate,)
+
+    def is_available(self, item: PoolItem, failed_items: Set[ItemIdentifier]) -> bool:
+        """该项既未在本次请求中失败，也通过了所有关卡。"""
+        if (item[0], item[1]) in failed_items:
+            return False
+        return all(gate.is_available(item) for gate in self.gates)
+
+    def admit(self, pool: ModelPool, index: int, failed_items: Set[ItemIdentifier]) -> bool:
+        """
+        与 is_available 相同，但作用于池中的下标：
+        被关卡拒绝且关卡给出了恢复时间时，在池的可用性位集中暂时屏蔽该项。
+        """
+        item = pool[index]
+        if (item[0], item[1]) in failed_items:
+            return False
+        return self._pass_gates(pool, index)
+
+    def _pass_gates(self, pool: ModelPool, index: int) -> bool:
+        item = pool[index]
+        for gate in self.gates:
+            if not gate.is_available(item):
+                retry_after = gate.retry_after(item)
+                if retry_after:
+                    pool.block(index, retry_after)
+                return False
+        return True
+
+    @staticmethod
+    def candidates(pool: ModelPool, failed_items: Set[ItemIdentifier]) -> int:
+        """
+        候选项的位集：未被屏蔽、且不在 failed_items 中。
+        failed_items 通过池的 (模型, 密钥) 索引一次性扣除，之后只需对抽中的项检查关卡。
+        """
+        return pool.available_mask() & ~pool.mask_of(failed_items)
+
     @abstractmethod
-    def select(self, pool: List[PoolItem], failed_items: Set[ItemIdentifier]) -> Optional[PoolItem]:
+    def select(self, pool: Pool, failed_items: Set[ItemIdentifier]) -> Optional[PoolItem]:
         """
         从池中选择下一个要尝试的 (模型, 密钥) 对。
-        :param pool: 完整的 (模型, 密钥, 元数据) 池。
+        :param pool: 完整的 (模型, 密钥, 元数据) 池。传入普通列表时每次调用都会重新建立索引，
+                     高频调用方 (如编排器) 应当预先包装为 ModelPool。
         :param failed_items: 一个包含本次请求中已失败的项的集合。
         :return: 下一个要尝试的 PoolItem，如果无可用项则返回 None。
         """
         pass
 
+    def record_outcome(self, item: PoolItem, success: bool, latency: float):
+        """
+        编排器在每次尝试结束后回调，供需要反馈的策略更新统计。默认忽略。
+        :param latency: 本次尝试的耗时 (秒)。
+        """
+        pass
+
 class SequentialStrategy(SelectionStrategy):
     """
-    顺序策略：按照池中定义的顺序依次选择。
+    顺序策略：按元数据 priority 从高到低 (数值从小到大) 逐个优先级桶选择，同一优先级内按池中定义的顺序。
     """
-    def select(self, pool: List[PoolItem], failed_items: Set[ItemIdentifier]) -> Optional[PoolItem]:
-        for item in pool:
-            if (item[0], item[1]) not in failed_items:
-                return item
+    def select(self, pool: Pool, failed_items: Set[ItemIdentifier]) -> Optional[PoolItem]:
+        pool = ModelPool.of(pool)
+        candidates = self.candidates(pool, failed_items)
+        for priority in pool.priorities:
+            for index in iter_bits(candidates & pool.mask(priority=priority)):
+                if self._pass_gates(pool, index):
+                    return pool[index]
         return None
 
 class RandomStrategy(SelectionStrategy):
     """
     随机策略：从可用的选项中随机选择一个。
     """
-    def select(self, pool: List[PoolItem], failed_items: Set[ItemIdentifier]) -> Optional[PoolItem]:
-        # 筛选出尚未失败的可用项
-        available_items = [
-            item for item in pool 
-            if (item[0], item[1]) not in failed_items
-        ]
-        if not available_items:
+    def select(self, pool: Pool, failed_items: Set[ItemIdentifier]) -> Optional[PoolItem]:
+        pool = ModelPool.of(pool)
+        # 在候选项中随机抽取，抽中的项未通过关卡时去掉后重抽
+        mask = self.candidates(pool, failed_items)
+        while mask:
+            index = pool.random_index(mask)
+            if self._pass_gates(pool, index):
+                return pool[index]
+            mask &= ~(1 << index)
+        return None
+
+class LatencyAwareStrategy(SelectionStrategy):
+    """
+    延迟感知策略：为每一项维护延迟与成功率的 EWMA，
+    用 power-of-two-choices 随机抽取两个可用项，选择得分更优的一个。
+
+    得分 = 延迟EWMA / 成功率EWMA × 优先级惩罚，越小越好。
+    尚无统计的项按已知项的平均延迟乐观估计，保证新项能被探索到。
+    """
+    def __init__(self, alpha: float = 0.3, priority_weight: float = 0.25,
+                 initial_latency: float = 1.0, sample_attempts: int = 8):
+        """
+        :param alpha: EWMA 平滑系数，越大越看重最近的结果。
+        :param priority_weight: 元数据 priority 每增加 1，得分增加的比例。
+        :param initial_latency: 还没有任何统计时假设的延迟 (秒)。
+        :param sample_attempts: 随机抽样时的最大拒绝采样次数，超过后退化为遍历可用项。
+        """
+        super().__init__()
+        self.alpha = alpha
+        self.priority_weight = priority_weight
+        self.initial_latency = initial_latency
+        self.sample_attempts = sample_attempts
+        # identifier -> [延迟EWMA, 成功率EWMA]
+        self.stats: Dict[ItemIdentifier, List[float]] = {}
+        self._latency_sum = 0.0
+        self._lock = threading.Lock()
+
+    def _default_latency(self) -> float:
+        if not self.stats:
+            return self.initial_latency
+        return self._latency_sum / len(self.stats)
+
+    def score(self, item: PoolItem) -> float:
+        stats = self.stats.get((item[0], item[1]))
+        if stats is None:
+            latency, success = self._default_latency(), 1.0
+        else:
+            latency, success = stats
+        priority = item[2].get("priority", 1) if item[2] else 1
+        penalty = 1.0 + self.priority_weight * max(0, priority - 1)
+        return latency / max(success, 0.05) * penalty
+
+    def _sample(self, pool: ModelPool, failed_items: Set[ItemIdentifier]) -> List[PoolItem]:
+        """随机抽取至多两个不同的、通过所有关卡的项。池中大部分项可用时为 O(1)。"""
+        picked: List[PoolItem] = []
+        mask = self.candidates(pool, failed_items)
+        while mask and len(picked) < 2:
+            index = pool.random_index(mask, self.sample_attempts)
+            mask &= ~(1 << index)
+            if self._pass_gates(pool, index):
+                picked.append(pool[index])
+        return picked
+
+    def select(self, pool: Pool, failed_items: Set[ItemIdentifier]) -> Optional[PoolItem]:
+        pool = ModelPool.of(pool)
+        candidates = self._sample(pool, failed_items)
+        if not candidates:
             return None
-        return random.choice(available_items)
\ No newline at end of file
+        return min(candidates, key=self.score)
+
+    def record_outcome(self, item: PoolItem, success: bool, latency: float):
+        identifier = (item[0], item[1])
+        with self._lock:
+            stats = self.stats.get(identifier)
+            if stats is None:
+                stats = [latency if success else self._default_latency(), 1.0 if success else 0.0]
+                self.stats[identifier] = stats
+                self._latency_sum += stats[0]
+                return
+            old_latency = stats[0]
+            if success:
+                stats[0] += self.alpha * (latency - stats[0])
+            else:
+                # 失败的耗时不代表正常响应速度，但不应让该项显得比实际更快
+                stats[0] = max(stats[0], stats[0] + self.alpha * (latency - stats[0]))
+            stats[1] += self.alpha * ((1.0 if success else 0.0) - stats[1])
+            self._latency_sum += stats[0] - old_latency
@@ -0,0 +1,310 @@
+# llm_framework/single_flight.py
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, Generator, Iterator, List, \
+    Optional, Tuple
+
+
+def request_key(messages: List[Dict[str, str]], params: Dict[str, Any]) -> str:
+    """请求的精确指纹：消息与全部生成参数 (含 system_prompt、model_name) 的 SHA-256。"""
+    payload = json.dumps([messages, params], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Fanout:
+    """
+    把一个流式生成器的输出复制给多个订阅者。
+
+    不额外创建线程：哪个订阅者需要的文本块尚未到达，就由它 (持有 driving 标记) 推进底层生成器一步，
+    其他订阅者在条件变量上等待。因此领头的消费者中途放弃时，其余订阅者会接着推进；
+    所有订阅者都离开而流尚未结束时，关闭底层生成器。后加入的订阅者从第一个文本块开始重放。
+    """
+    def __init__(self, source: Iterator[Any], on_close: Callable[[], None]):
+        self.source = source
+        self.on_close = on_close
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.driving = False
+        self.cond = threading.Condition()
+
+    def join(self) -> bool:
+        """登记一个订阅者；流已结束或已被放弃时返回 False。"""
+        with self.cond:
+            if self.done:
+                return False
+            self.subscribers += 1
+            return True
+
+    def read(self) -> Generator[Any, None, None]:
+        index = 0
+        while True:
+            with self.cond:
+                while index >= len(self.chunks) and not self.done and self.driving:
+                    self.cond.wait()
+                if index < len(self.chunks):
+                    chunk = self.chunks[index]
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    self.driving = True
+                    chunk = _DRIVE
+            if chunk is _DRIVE:
+                self._advance()
+                continue
+            index += 1
+            yield chunk
+
+    def _advance(self):
+        finished = False
+        try:
+            chunk = next(self.source)
+        except StopIteration:
+            finished = True
+            with self.cond:
+                self.done = True
+        except BaseException as e:
+            finished = True
+            with self.cond:
+                self.done = True
+                self.error = e
+        else:
+            with self.cond:
+                self.chunks.append(chunk)
+        finally:
+            with self.cond:
+                self.driving = False
+                self.cond.notify_all()
+        if finished:
+            self.on_close()
+
+    def leave(self):
+        with self.cond:
+            self.subscribers -= 1
+            abandoned = self.subscribers == 0 and not self.done
+            if abandoned:
+                self.done = True
+                self.error = GeneratorExit()
+        if abandoned:
+            self.on_close()
+            close = getattr(self.source, "close", None)
+            if callable(close):
+                close()
+
+
+class _AsyncFanout:
+    """_Fanout 的异步版本，所有订阅者属于同一个事件循环。"""
+    def __init__(self, source: AsyncIterator[Any], on_close: Callable[[], None]):
+        self.source = source
+        self.on_close = on_close
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.driving = False
+        self.cond = asyncio.Condition()
+
+    def join(self) -> bool:
+        if self.done:
+            return False
+        self.subscribers += 1
+        return True
+
+    async def read(self) -> AsyncGenerator[Any, None]:
+        index = 0
+        while True:
+            async with self.cond:
+                await self.cond.wait_for(lambda: index < len(self.chunks) or self.done or not self.driving)
+                if index < len(self.chunks):
+                    chunk = self.chunks[index]
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    self.driving = True
+                    chunk = _DRIVE
+            if chunk is _DRIVE:
+                await self._advance()
+                continue
+            index += 1
+            yield chunk
+
+    async def _advance(self):
+        finished = False
+        try:
+            chunk = await self.source.__anext__()
+        except StopAsyncIteration:
+            finished = self.done = True
+        except BaseException as e:
+            finished = self.done = True
+            self.error = e
+        else:
+            self.chunks.append(chunk)
+        finally:
+            self.driving = False
+            async with self.cond:
+                self.cond.notify_all()
+        if finished:
+            self.on_close()
+
+    async def leave(self):
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.done:
+            self.done = True
+            self.error = GeneratorExit()
+            self.on_close()
+            aclose = getattr(self.source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+
+_DRIVE = object()
+
+
+class SingleFlight:
+    """
+    合并同时在途的相同请求 (single-flight)。
+
+    第一个到达的调用者成为领头者并真正发起调用；结束前到达的相同请求不再派发，
+    而是等待领头者的结果 (非流式)，或订阅领头者流式输出的副本 (流式)。
+    领头者结束后键即被移除，之后的相同请求会重新发起 (通常由响应缓存接住)。
+
+    默认只合并确定性的请求 (temperature 为 0)：带采样的请求各自应得到独立的输出，
+    合并会让本应不同的结果变成同一份。
+    """
+    def __init__(self, sampled: bool = False):
+        """
+        :param sampled: 为 True 时 temperature 非 0 (或未指定，沿用提供者默认值) 的请求也参与合并。
+        """
+        self.sampled = sampled
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self._streams: Dict[str, _Fanout] = {}
+        self._acalls: Dict[Tuple[int, str], asyncio.Future] = {}
+        self._astreams: Dict[Tuple[int, str], _AsyncFanout] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def applies(self, params: Dict[str, Any]) -> bool:
+        """该请求是否参与合并。"""
+        return self.sampled or params.get("temperature") == 0
+
+    def _count(self, leader: bool):
+        if leader:
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        执行 fn，或等待正在执行的相同请求的结果。
+        :return: (结果, 是否为领头者)。领头者抛出的异常会同样抛给所有跟随者。
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            self._count(leader)
+        if not leader:
+            return future.result(), False
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, True
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stream(self, key: str, factory: Callable[[], Iterator[Any]]) -> Generator[Any, None, None]:
+        """
+        订阅相同请求的流式输出；没有在途的相同请求时用 factory 创建新的流。
+        每个订阅者都会收到完整的输出 (中途加入的订阅者先重放已产生的文本块)。
+        """
+        with self._lock:
+            fanout = self._streams.get(key)
+            leader = fanout is None or not fanout.join()
+            if leader:
+                fanout = _Fanout(factory(), lambda: self._forget(self._streams, key, fanout))
+                fanout.join()
+                self._streams[key] = fanout
+            self._count(leader)
+        try:
+            yield from fanout.read()
+        finally:
+            fanout.leave()
+
+    def _forget(self, table: Dict, key, value):
+        with self._lock:
+            if table.get(key) is value:
+                del table[key]
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """do 的异步版本，只合并同一个事件循环内的请求。领头者被取消时，跟随者之一接替发起调用。"""
+        slot = (id(asyncio.get_running_loop()), key)
+        while True:
+            future = self._acalls.get(slot)
+            if future is None:
+                break
+            self._count(False)
+            try:
+                return await asyncio.shield(future), False
+            except asyncio.CancelledError:
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                # 领头者被取消而本任务没有：改由本任务发起调用
+        future = asyncio.get_running_loop().create_future()
+        self._acalls[slot] = future
+        self._count(True)
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有跟随者时避免 "Future exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, True
+        finally:
+            if self._acalls.get(slot) is future:
+                del self._acalls[slot]
+
+    async def astream(self, key: str, factory: Callable[[], AsyncIterator[Any]]) -> AsyncGenerator[Any, None]:
+        """stream 的异步版本，只合并同一个事件循环内的请求。"""
+        slot = (id(asyncio.get_running_loop()), key)
+        fanout = self._astreams.get(slot)
+        leader = fanout is None or not fanout.join()
+        if leader:
+            fanout = _AsyncFanout(factory(), lambda: self._forget(self._astreams, slot, fanout))
+            fanout.join()
+            self._astreams[slot] = fanout
+        self._count(leader)
+        try:
+            async for chunk in fanout.read():
+                yield chunk
+        finally:
+            await fanout.leave()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.leaders + self.followers
+        return {
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "coalesced_rate": self.followers / total if total else 0.0,
+            "in_flight": len(self._calls) + len(self._streams) + len(self._acalls) + len(self._astreams),
+        }
@@ -0,0 +1,102 @@
+# llm_framework/streaming.py
+import asyncio
+import queue
+import threading
+from typing import AsyncIterator, Generator, AsyncGenerator, Iterator, Optional
+
+
+class StreamTimeout(TimeoutError):
+    """流式调用在首个文本块或两个文本块之间等待过久。"""
+    pass
+
+
+class StreamRestart:
+    """
+    流式故障切换的重启信号 (stream_failover="restart" 时使用)。
+
+    编排器在某个提供者中途失败后产出此对象，表示此前收到的文本块应当丢弃，
+    后续的文本块是另一个提供者从头生成的完整回答。消费者需用 isinstance 区分它与普通文本块。
+    """
+    def __init__(self, reason: str, discarded_chars: int):
+        self.reason = reason
+        self.discarded_chars = discarded_chars
+
+    def __repr__(self):
+        return f"StreamRestart(reason={self.reason!r}, discarded_chars={self.discarded_chars})"
+
+
+_CHUNK, _END, _ERROR = 0, 1, 2
+
+
+def iter_with_timeouts(stream: Iterator[str], first_token_timeout: Optional[float] = None,
+                       stall_timeout: Optional[float] = None) -> Generator[str, None, None]:
+    """
+    为同步流式生成器加上首块超时与块间停顿超时。
+    生成器在后台线程中推进，超时后抛出 StreamTimeout，后台线程会在下一个文本块到达时停止。
+    两个超时都未设置时直接透传，不额外创建线程。
+    """
+    if first_token_timeout is None and stall_timeout is None:
+        yield from stream
+        return
+
+    chunks: "queue.Queue" = queue.Queue()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for chunk in stream:
+                if stop.is_set():
+                    break
+                chunks.put((_CHUNK, chunk))
+            chunks.put((_END, None))
+        except BaseException as e:
+            chunks.put((_ERROR, e))
+        finally:
+            close = getattr(stream, "close", None)
+            if callable(close):
+                close()
+
+    threading.Thread(target=produce, name="llm-stream", daemon=True).start()
+    received_any = False
+    try:
+        while True:
+            timeout = stall_timeout if received_any else first_token_timeout
+            try:
+                kind, value = chunks.get(timeout=timeout)
+            except queue.Empty:
+                stage = "文本块间停顿" if received_any else "首个文本块"
+                raise StreamTimeout(f"等待{stage}超过 {timeout}s")
+            if kind == _END:
+                return
+            if kind == _ERROR:
+                raise value
+            received_any = True
+            yield value
+    finally:
+        stop.set()
+
+
+async def aiter_with_timeouts(stream: AsyncIterator[str], first_token_timeout: Optional[float] = None,
+                              stall_timeout: Optional[float] = None) -> AsyncGenerator[str, None]:
+    """iter_with_timeouts 的异步版本，超时后取消挂起的读取并关闭底层流。"""
+    received_any = False
+    try:
+        while True:
+            timeout = stall_timeout if received_any else first_token_timeout
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                stage = "文本块间停顿" if received_any else "首个文本块"
+                raise StreamTimeout(f"等待{stage}超过 {timeout}s")
+            received_any = True
+            yield chunk
+    finally:
+        aclose = getattr(stream, "aclose", None)
+        if aclose is not None:
+            try:
+                await aclose()
+            except Exception:
+                # 读取被取消后底层生成器可能仍在运行，关闭失败不应掩盖原始的超时错误
+                pass
@@ -0,0 +1,6 @@
+# llm_framework/tests/conftest.py
+import os
+import sys
+
+# 与 benchmarks 相同：模块都位于项目根目录，直接以顶层模块导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,29 @@
+# llm_framework/tests/test_batch_jobs.py
+from batch_jobs import GeminiBatchBackend, ZhipuAIBatchBackend, create_batch_backend
+from llm_factory import LLMFactory
+from providers.gemini_provider import GeminiProvider
+
+BASE_URLS = {"gemini": "http://127.0.0.1:9", "zhipuai": "http://127.0.0.1:9"}
+
+
+class _CustomGeminiProvider(GeminiProvider):
+    pass
+
+
+def test_builtin_routing():
+    assert isinstance(create_batch_backend("gemini-2.5-flash", "k", BASE_URLS), GeminiBatchBackend)
+    assert isinstance(create_batch_backend("glm-4.5-flash", "k", BASE_URLS), ZhipuAIBatchBackend)
+    # Gemma 由 GeminiProvider 逐条调用，但 Batch API 不支持
+    assert create_batch_backend("gemma-3-27b-it", "k", BASE_URLS) is None
+    assert create_batch_backend("@cf/meta/llama-3.1-8b-instruct", "k", BASE_URLS) is None
+    assert create_batch_backend("unknown-model", "k", BASE_URLS) is None
+
+
+def test_registered_provider_routes_through_factory_lookup():
+    LLMFactory.register_provider("custom-*", _CustomGeminiProvider)
+    try:
+        backend = create_batch_backend("custom-model", "k", BASE_URLS)
+    finally:
+        LLMFactory._registered.pop()
+    assert isinstance(backend, GeminiBatchBackend)
+    assert backend.base_url == BASE_URLS["gemini"]
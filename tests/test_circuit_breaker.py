@@ -0,0 +1,75 @@
+# llm_framework/tests/test_circuit_breaker.py
+from circuit_breaker import CircuitState, ErrorKind, HealthTracker, classify_error
+
+ITEM = ("model", "key", {})
+IDENTIFIER = (ITEM[0], ITEM[1])
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class _HttpError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def _tracker(clock):
+    return HealthTracker(failure_threshold=2, cooldowns={ErrorKind.SERVER: 10.0}, clock=clock)
+
+
+def test_classify_error_by_status_and_message():
+    assert classify_error(_HttpError(429)) is ErrorKind.RATE_LIMIT
+    assert classify_error(_HttpError(401)) is ErrorKind.AUTH
+    assert classify_error(_HttpError(503)) is ErrorKind.SERVER
+    assert classify_error(_HttpError(400)) is ErrorKind.CLIENT
+    assert classify_error(RuntimeError("RESOURCE_EXHAUSTED")) is ErrorKind.RATE_LIMIT
+
+
+def test_trip_cooldown_and_single_half_open_probe():
+    clock = _Clock()
+    tracker = _tracker(clock)
+    tracker.record_failure(ITEM, _HttpError(500))
+    assert tracker.state(IDENTIFIER) is CircuitState.CLOSED
+    tracker.record_failure(ITEM, _HttpError(500))
+    assert tracker.state(IDENTIFIER) is CircuitState.OPEN
+    assert not tracker.is_available(ITEM)
+    assert tracker.retry_after(ITEM) == 10.0
+
+    clock.now = 10.0
+    assert tracker.state(IDENTIFIER) is CircuitState.HALF_OPEN
+    assert tracker.is_available(ITEM)
+    tracker.on_dispatch(ITEM)
+    # 探测在途时不放行其他请求
+    assert not tracker.is_available(ITEM)
+    tracker.record_success(ITEM)
+    assert tracker.state(IDENTIFIER) is CircuitState.CLOSED
+    assert tracker.is_available(ITEM)
+
+
+def test_failed_probe_retrips_with_doubled_cooldown():
+    clock = _Clock()
+    tracker = _tracker(clock)
+    tracker.record_failure(ITEM, _HttpError(429))
+    clock.now = 30.0
+    tracker.on_dispatch(ITEM)
+    tracker.record_failure(ITEM, _HttpError(500))
+    assert tracker.state(IDENTIFIER) is CircuitState.OPEN
+    assert tracker.retry_after(ITEM) == 20.0
+
+
+def test_client_error_during_probe_keeps_half_open():
+    clock = _Clock()
+    tracker = _tracker(clock)
+    tracker.record_failure(ITEM, _HttpError(429))
+    clock.now = 30.0
+    tracker.on_dispatch(ITEM)
+    tracker.record_failure(ITEM, _HttpError(400))
+    assert tracker.state(IDENTIFIER) is CircuitState.HALF_OPEN
+    assert tracker.is_available(ITEM)
+    assert tracker.retry_after(ITEM) is None
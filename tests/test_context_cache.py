@@ -0,0 +1,55 @@
+# llm_framework/tests/test_context_cache.py
+from optimization_aicars import SYSTEM_PROMPT
+from providers.context_cache import ContextCacheRegistry
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_pipeline_prompt_is_below_minimum_cacheable_size():
+    registry = ContextCacheRegistry()
+    assert not registry.cacheable(SYSTEM_PROMPT)
+    assert registry.cacheable("x" * 4 * 1024)
+
+
+def test_create_once_then_renew_near_expiry():
+    clock = _Clock()
+    registry = ContextCacheRegistry(ttl=600, renew_margin=60, clock=clock)
+    calls = []
+
+    def create(ttl):
+        calls.append("create")
+        return "cachedContents/1", clock.now + ttl
+
+    def renew(name, ttl):
+        calls.append("renew")
+        return clock.now + ttl
+
+    key = registry.make_key("key", "gemini-2.5-flash", "prompt")
+    assert registry.get(key, create, renew) == "cachedContents/1"
+    assert registry.get(key, create, renew) == "cachedContents/1"
+    clock.now += 550
+    assert registry.get(key, create, renew) == "cachedContents/1"
+    assert calls == ["create", "renew"]
+
+
+def test_failed_create_backs_off():
+    clock = _Clock()
+    registry = ContextCacheRegistry(retry_after=100, clock=clock)
+    attempts = []
+
+    def create(ttl):
+        attempts.append(ttl)
+        raise RuntimeError("content too small")
+
+    key = registry.make_key("key", "gemini-2.5-flash", "prompt")
+    assert registry.get(key, create, lambda name, ttl: 0.0) is None
+    assert registry.get(key, create, lambda name, ttl: 0.0) is None
+    clock.now += 101
+    assert registry.get(key, create, lambda name, ttl: 0.0) is None
+    assert len(attempts) == 2
@@ -0,0 +1,78 @@
+# llm_framework/tests/test_conversation.py
+from conversation import SUMMARY_SYSTEM_PROMPT, Conversation
+
+
+class _FakeOrchestrator:
+    """按 system_prompt 区分摘要请求与普通对话请求，记录每次发送的消息。"""
+    def __init__(self, summary_ok=True):
+        self.summary_ok = summary_ok
+        self.turns = []
+        self.summaries = []
+        self.fail_next = False
+
+    def chat(self, messages, **kwargs):
+        if kwargs.get("system_prompt") == SUMMARY_SYSTEM_PROMPT:
+            self.summaries.append(messages[0]["content"])
+            if not self.summary_ok:
+                return {"status": "error", "message": "摘要失败"}
+            return {"status": "success", "content": f"摘要{len(self.summaries)}"}
+        self.turns.append(messages)
+        if self.fail_next:
+            self.fail_next = False
+            return {"status": "error", "message": "失败"}
+        return {"status": "success", "content": "回答" + "好" * 40}
+
+
+def _conversation(orchestrator, **kwargs):
+    kwargs.setdefault("budget_tokens", 200)
+    return Conversation(lambda: orchestrator, system_prompt="你是助手", **kwargs)
+
+
+def test_short_conversation_sends_full_history():
+    orchestrator = _FakeOrchestrator()
+    conversation = _conversation(orchestrator, budget_tokens=10_000)
+    for n in range(3):
+        conversation.send(f"问题 {n}")
+    assert len(orchestrator.turns[-1]) == 5
+    assert conversation.compactions == 0
+    assert orchestrator.summaries == []
+
+
+def test_compaction_keeps_window_within_budget():
+    orchestrator = _FakeOrchestrator()
+    conversation = _conversation(orchestrator, budget_tokens=600, keep_turns=1)
+    for n in range(20):
+        conversation.send(f"第 {n} 个问题" + "啊" * 20)
+        assert conversation.last_turn["input_tokens"] <= conversation.budget_tokens
+
+    # 每次压缩到预算的一半以下，之后的几轮都不需要再压缩
+    assert 2 <= conversation.compactions <= 5
+    assert len(orchestrator.summaries) == conversation.compactions
+    window = orchestrator.turns[-1]
+    assert window[0]["content"].endswith(conversation.summary)
+    assert window[-1]["content"].startswith("第 19 个问题")
+    # 完整历史仍然保留
+    assert len(conversation.history) == 40
+    # 后一次摘要在前一次摘要的基础上增量合并
+    assert "摘要1" in orchestrator.summaries[1]
+
+
+def test_summary_failure_falls_back_to_sliding_window():
+    orchestrator = _FakeOrchestrator(summary_ok=False)
+    conversation = _conversation(orchestrator, keep_turns=1)
+    for n in range(12):
+        result = conversation.send(f"第 {n} 个问题" + "啊" * 20)
+        assert result["status"] == "success"
+        assert conversation.last_turn["input_tokens"] <= conversation.budget_tokens
+    assert conversation.summary is None
+    assert conversation.window_start > 0
+
+
+def test_failed_turn_is_not_kept():
+    orchestrator = _FakeOrchestrator()
+    conversation = _conversation(orchestrator, budget_tokens=10_000)
+    conversation.send("你好")
+    orchestrator.fail_next = True
+    assert conversation.send("再见")["status"] == "error"
+    assert [message["content"] for message in conversation.history][0] == "你好"
+    assert len(conversation.history) == 2
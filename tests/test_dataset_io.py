@@ -0,0 +1,95 @@
+# llm_framework/tests/test_dataset_io.py
+import json
+import os
+
+import dataset_io
+from dataset_io import GroupCommitWriter, JsonlIndex, JsonlReader, first_pending, index_path, recover_output
+
+
+def _write(path, lines, mode="w"):
+    with open(path, mode, encoding="utf-8") as f:
+        f.writelines(line + "\n" for line in lines)
+
+
+def _bump_mtime(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def _read_all(path):
+    with JsonlReader(str(path)) as reader:
+        return len(reader), [line for _, line in reader.iter_lines()]
+
+
+def test_random_access_and_resume_position(tmp_path):
+    path = tmp_path / "data.jsonl"
+    _write(path, ['{"n": 1}', '{"n": 2}', '{"n": 3}'])
+    with JsonlReader(str(path)) as reader:
+        assert len(reader) == 3
+        assert json.loads(reader.line(2)) == {"n": 2}
+        assert [n for n, _ in reader.iter_lines(start=3)] == [3]
+    assert os.path.exists(index_path(str(path)))
+
+
+def test_index_is_extended_after_append(tmp_path, monkeypatch):
+    path = tmp_path / "data.jsonl"
+    _write(path, ['{"n": 1}', '{"n": 2}'])
+    _read_all(path)
+    _write(path, ['{"n": 3}'], mode="a")
+    _bump_mtime(path)
+
+    scans = []
+    scan = dataset_io._scan_offsets
+    monkeypatch.setattr(dataset_io, "_scan_offsets", lambda data, start, end, offsets: (
+        scans.append(start), scan(data, start, end, offsets)))
+    count, lines = _read_all(path)
+    assert count == 3
+    assert lines[-1] == '{"n": 3}\n'
+    # 只扫描了新增的部分
+    assert scans == [len('{"n": 1}\n{"n": 2}\n')]
+
+
+def test_index_is_rebuilt_after_truncate_or_rewrite(tmp_path):
+    path = tmp_path / "data.jsonl"
+    _write(path, ['{"n": 1}', '{"n": 2}', '{"n": 3}'])
+    _read_all(path)
+
+    _write(path, ['{"n": 9}'])
+    _bump_mtime(path)
+    assert _read_all(path) == (1, ['{"n": 9}\n'])
+
+    # 同样长度但内容不同：末尾校验和不一致，不会被当作追加
+    _write(path, ['{"n": 8}', '{"n": 7}'])
+    _bump_mtime(path)
+    assert _read_all(path) == (2, ['{"n": 8}\n', '{"n": 7}\n'])
+
+
+def test_corrupt_index_is_ignored(tmp_path):
+    path = tmp_path / "data.jsonl"
+    _write(path, ['{"n": 1}', '{"n": 2}'])
+    with open(index_path(str(path)), "wb") as f:
+        f.write(b"garbage")
+    assert _read_all(path)[0] == 2
+
+
+def test_last_line_without_newline(tmp_path):
+    path = tmp_path / "data.jsonl"
+    path.write_bytes(b'{"n": 1}\n{"n": 2}')
+    with open(path, "rb") as f:
+        assert len(JsonlIndex.load_or_build(str(path), f.read())) == 2
+
+
+def test_group_commit_checkpoint_and_recovery(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    with GroupCommitWriter(path, flush_records=2) as writer:
+        for n in (1, 2, 3):
+            writer.write({"line_number": n})
+    # 模拟进程中断时残留的半行
+    with open(path, "ab") as f:
+        f.write(b'{"line_number": 4')
+
+    processed = recover_output(path)
+    assert processed == {1, 2, 3}
+    assert first_pending(processed) == 4
+    with open(path, "rb") as f:
+        assert f.read().endswith(b'{"line_number": 3}\n')
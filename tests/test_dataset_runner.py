@@ -0,0 +1,99 @@
+# llm_framework/tests/test_dataset_runner.py
+import json
+import threading
+import time
+
+import optimization_aicars
+from optimization_aicars import _run_concurrently, process_dataset_file
+
+
+def _line(n):
+    return json.dumps({"messages": [{"role": "user", "content": f"职位 {n}"},
+                                    {"role": "assistant", "content": f"草稿 {n}"}]}, ensure_ascii=False)
+
+
+class _SlowOrchestrator:
+    """越早的记录返回得越慢，并发执行时完成顺序与输入顺序相反。"""
+    def __init__(self, total):
+        self.total = total
+        self.active = 0
+        self.max_active = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def chat(self, messages, **kwargs):
+        n = int(messages[0]["content"].split("草稿 ")[1].split()[0])
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.002 * (self.total - n))
+        with self._lock:
+            self.active -= 1
+        return {"status": "success", "model": "fake-model", "content": f"结果 {n}"}
+
+
+def _run(ordered, total=20, workers=4):
+    orchestrator = _SlowOrchestrator(total)
+    written = []
+
+    def pending():
+        for n in range(1, total + 1):
+            # 同时在途的记录数受窗口限制，读取进度不会远超写出进度
+            assert n - len(written) <= workers * 4 + 1
+            yield n, _line(n)
+
+    _run_concurrently(orchestrator, pending(), written.append, workers, ordered)
+    return orchestrator, [record["line_number"] for record in written]
+
+
+def test_ordered_mode_preserves_input_order():
+    orchestrator, line_numbers = _run(ordered=True)
+    assert line_numbers == list(range(1, 21))
+    assert orchestrator.max_active > 1
+
+
+def test_unordered_mode_writes_every_record_once():
+    _, line_numbers = _run(ordered=False)
+    assert sorted(line_numbers) == list(range(1, 21))
+
+
+class _FakeSession:
+    orchestrator = None
+
+    def __init__(self):
+        self.cache = None
+        self.validator = None
+        self.metrics = self
+
+    def get_orchestrator(self):
+        return self.orchestrator
+
+    def snapshot(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+def test_resume_skips_completed_records(tmp_path, monkeypatch):
+    input_path = tmp_path / "input.jsonl"
+    output_path = tmp_path / "output.jsonl"
+    input_path.write_text("".join(_line(n) + "\n" for n in range(1, 11)), encoding="utf-8")
+    monkeypatch.setattr(optimization_aicars, "ChatSession", _FakeSession)
+
+    _FakeSession.orchestrator = _SlowOrchestrator(10)
+    process_dataset_file(str(input_path), str(output_path), workers=3)
+    first = [json.loads(line) for line in output_path.read_text(encoding="utf-8").splitlines()]
+    assert [record["line_number"] for record in first] == list(range(1, 11))
+
+    # 模拟中断：只保留前 4 条与一行写了一半的记录
+    lines = output_path.read_text(encoding="utf-8").splitlines(keepends=True)
+    output_path.write_text("".join(lines[:4]) + lines[4][:10], encoding="utf-8")
+    (tmp_path / "output.jsonl.ckpt.json").unlink()
+
+    _FakeSession.orchestrator = _SlowOrchestrator(10)
+    process_dataset_file(str(input_path), str(output_path), workers=3)
+    records = [json.loads(line) for line in output_path.read_text(encoding="utf-8").splitlines()]
+    assert [record["line_number"] for record in records] == list(range(1, 11))
+    assert _FakeSession.orchestrator.calls == 6
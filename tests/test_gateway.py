@@ -0,0 +1,127 @@
+# llm_framework/tests/test_gateway.py
+import asyncio
+import json
+
+import pytest
+
+from gateway import GatewayError, GatewayServer, parse_chat_request
+
+
+class _FakeOrchestrator:
+    async def achat(self, messages, **params):
+        return {"status": "success", "model": "fake-model", "content": "你好！"}
+
+    async def achat_stream(self, messages, **params):
+        for chunk in ("你", "好"):
+            yield chunk
+
+
+def _orchestrator_for(model):
+    if model not in (None, "fake-model"):
+        raise ValueError("池中没有该模型")
+    return _FakeOrchestrator()
+
+
+async def _read_response(reader):
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    status = int(head[0].split(" ")[1])
+    headers = {line.split(":", 1)[0].lower(): line.split(":", 1)[1].strip() for line in head[1:] if ":" in line}
+    if headers.get("transfer-encoding") == "chunked":
+        body = b""
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).strip(), 16)
+            chunk = await reader.readexactly(size + 2)
+            if not size:
+                break
+            body += chunk[:-2]
+    else:
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return status, headers, body
+
+
+def _request(path, payload=None, method="POST", headers=""):
+    body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+    return (f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n{headers}"
+            f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1") + body
+
+
+def _exchange(raw_requests, token=None):
+    async def main():
+        server = await GatewayServer(_orchestrator_for, ["fake-model"], port=0, token=token).start()
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            responses = []
+            for raw in raw_requests:
+                writer.write(raw)
+                await writer.drain()
+                responses.append(await _read_response(reader))
+            writer.close()
+            return responses
+        finally:
+            await server.close()
+
+    return asyncio.run(main())
+
+
+CHAT = {"model": "fake-model", "messages": [{"role": "user", "content": "你好"}]}
+
+
+def test_parse_chat_request_merges_system_messages():
+    messages, params = parse_chat_request({
+        "messages": [{"role": "system", "content": "规则"},
+                     {"role": "user", "content": [{"type": "text", "text": "问题"}]}],
+        "max_completion_tokens": 10, "temperature": 0,
+    })
+    assert messages == [{"role": "user", "content": "问题"}]
+    assert params == {"system_prompt": "规则", "max_tokens": 10, "temperature": 0}
+    with pytest.raises(GatewayError):
+        parse_chat_request({"messages": [{"role": "tool", "content": "x"}]})
+
+
+def test_chat_completion_and_keep_alive():
+    (status, headers, body), (status2, _, _) = _exchange([_request("/v1/chat/completions", CHAT)] * 2)
+    assert status == status2 == 200
+    assert headers["connection"] == "keep-alive"
+    payload = json.loads(body)
+    assert payload["choices"][0]["message"]["content"] == "你好！"
+    assert payload["model"] == "fake-model"
+
+
+def test_error_statuses():
+    responses = _exchange([
+        _request("/v1/chat/completions", {"messages": []}),
+        _request("/v1/chat/completions", dict(CHAT, model="missing")),
+        _request("/v1/unknown", method="GET"),
+    ])
+    assert [status for status, _, _ in responses] == [400, 404, 404]
+    assert json.loads(responses[1][2])["error"]["type"] == "model_not_found"
+
+
+def test_bearer_token_required():
+    (status, _, body), = _exchange([_request("/v1/models", method="GET")], token="secret")
+    assert status == 401
+    (status, _, body), = _exchange(
+        [_request("/v1/models", method="GET", headers="Authorization: Bearer secret\r\n")], token="secret")
+    assert status == 200
+    assert json.loads(body)["data"][0]["id"] == "fake-model"
+
+
+def test_invalid_content_length_closes_connection():
+    raw = b"POST /v1/chat/completions HTTP/1.1\r\nContent-Length: abc\r\n\r\n"
+    (status, headers, _), = _exchange([raw])
+    assert status == 400
+    assert headers["connection"] == "close"
+
+
+def test_sse_stream_framing():
+    (status, headers, body), = _exchange([_request("/v1/chat/completions", dict(CHAT, stream=True),
+                                                   headers="Connection: close\r\n")])
+    assert status == 200
+    assert headers["content-type"].startswith("text/event-stream")
+    assert headers["connection"] == "close"
+    events = [line[len("data: "):] for line in body.decode("utf-8").split("\n\n") if line]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(event) for event in events[:-1]]
+    assert chunks[0]["choices"][0]["delta"]["role"] == "assistant"
+    assert "".join(chunk["choices"][0]["delta"].get("content", "") for chunk in chunks) == "你好"
+    assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
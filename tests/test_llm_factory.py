@@ -0,0 +1,87 @@
+# llm_framework/tests/test_llm_factory.py
+import threading
+import time
+
+import pytest
+
+from llm_factory import ProviderCache
+
+
+class _Provider:
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_lru_eviction_closes_idle_provider():
+    cache = ProviderCache(max_size=2)
+    with cache.lease("a", lambda: _Provider("a")) as a:
+        pass
+    with cache.lease("b", lambda: _Provider("b")):
+        pass
+    with cache.lease("c", lambda: _Provider("c")):
+        pass
+    assert len(cache) == 2
+    assert a.closed
+
+
+def test_provider_evicted_while_leased_is_closed_on_last_release():
+    cache = ProviderCache(max_size=1)
+    with cache.lease("a", lambda: _Provider("a")) as a:
+        with cache.lease("a", lambda: _Provider("a2")) as same:
+            assert same is a
+            with cache.lease("b", lambda: _Provider("b")):
+                pass
+            assert not a.closed
+        assert not a.closed
+    assert a.closed
+    # 被淘汰的键再次使用时重新构造
+    with cache.lease("a", lambda: _Provider("a3")) as rebuilt:
+        assert rebuilt.name == "a3"
+
+
+def test_concurrent_misses_build_once_outside_the_lock():
+    cache = ProviderCache()
+    release = threading.Event()
+    built = []
+
+    def slow_builder():
+        built.append(1)
+        release.wait(5)
+        return _Provider("slow")
+
+    threads = [threading.Thread(target=lambda: cache.get_or_create("slow", slow_builder)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while not built:
+        time.sleep(0.001)
+    # 构造仍在进行时，其他键的查找不被阻塞
+    assert cache.get_or_create("fast", lambda: _Provider("fast")).name == "fast"
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(built) == 1
+
+
+def test_failed_build_is_not_cached():
+    cache = ProviderCache()
+
+    def failing():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_create("a", failing)
+    assert cache.get_or_create("a", lambda: _Provider("a")).name == "a"
+
+
+def test_close_closes_cached_and_evicted_providers():
+    cache = ProviderCache(max_size=1)
+    pinned = cache.get_or_create("a", lambda: _Provider("a"))
+    other = cache.get_or_create("b", lambda: _Provider("b"))
+    assert not pinned.closed
+    cache.close()
+    assert pinned.closed and other.closed
+    assert len(cache) == 0
@@ -0,0 +1,100 @@
+# llm_framework/tests/test_llm_orchestrator.py
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from circuit_breaker import CircuitState, ErrorKind, HealthTracker
+from concurrency_limiter import AdaptiveConcurrencyLimiter
+from hedging import HedgingPolicy
+from llm_factory import LLMFactory
+from llm_orchestrator import LLMOrchestrator
+from rate_limiter import RateLimiter
+from selection_strategy import SequentialStrategy
+
+PRIMARY = ("primary-model", "key-primary", {"priority": 1, "provider": "a", "rpm": 10})
+BACKUP = ("backup-model", "key-backup", {"priority": 2, "provider": "b", "rpm": 1})
+
+
+class _StubProvider:
+    def __init__(self, delay: float, text: str):
+        self.delay = delay
+        self.text = text
+        self.calls = 0
+
+    def chat(self, messages, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        return self.text
+
+
+class _StubFactory(LLMFactory):
+    def __init__(self, providers):
+        super().__init__()
+        self.providers = providers
+
+    def _build(self, model_name, api_key, **config):
+        return self.providers[model_name]
+
+
+class _OneWorkerExecutor(ThreadPoolExecutor):
+    """只执行第一个提交的任务，之后的任务一直排队，模拟线程池已被占满。"""
+    def __init__(self):
+        super().__init__(max_workers=1)
+        self.busy = False
+
+    def submit(self, fn, *args, **kwargs):
+        if self.busy:
+            return Future()
+        self.busy = True
+        return super().submit(fn, *args, **kwargs)
+
+
+class _RateLimited(Exception):
+    code = 429
+
+
+def test_cancelled_queued_hedge_returns_slot_probe_and_reservation():
+    providers = {PRIMARY[0]: _StubProvider(0.2, "主请求"), BACKUP[0]: _StubProvider(0.0, "对冲请求")}
+    concurrency = AdaptiveConcurrencyLimiter()
+    health = HealthTracker(cooldowns={ErrorKind.RATE_LIMIT: 0.0})
+    rate_limiter = RateLimiter()
+    orchestrator = LLMOrchestrator(
+        [PRIMARY, BACKUP], SequentialStrategy(), factory=_StubFactory(providers),
+        health=health, rate_limiter=rate_limiter, concurrency=concurrency,
+        hedging=HedgingPolicy(delay=0.02, budget=1.0),
+    )
+    # 主请求占住唯一的执行线程，对冲请求只能排队，主请求胜出后被取消
+    orchestrator._hedge_executor = _OneWorkerExecutor()
+    # 备用项刚熔断且冷却已结束，对冲派发时会占用其半开状态的探测名额
+    health.record_failure(BACKUP, _RateLimited("429"))
+
+    result = orchestrator.chat([{"role": "user", "content": "你好"}])
+    orchestrator._hedge_executor.shutdown(wait=True)
+
+    assert result["content"] == "主请求"
+    assert providers[BACKUP[0]].calls == 0
+    snapshot = concurrency.snapshot()
+    assert all(limit["in_flight"] == 0 for limit in snapshot["keys"].values())
+    assert all(limit["in_flight"] == 0 for limit in snapshot["providers"].values())
+    assert (BACKUP[0], BACKUP[1]) in snapshot["keys"]
+    assert health.state((BACKUP[0], BACKUP[1])) is CircuitState.HALF_OPEN
+    assert health.is_available(BACKUP)
+    # 备用项每分钟只有一个请求的额度，未退还时需要等待近一分钟
+    assert rate_limiter.wait_time(BACKUP) == 0
+
+
+def test_hedge_delay_starts_when_primary_begins_executing():
+    providers = {PRIMARY[0]: _StubProvider(0.05, "主请求"), BACKUP[0]: _StubProvider(0.0, "对冲请求")}
+    policy = HedgingPolicy(delay=0.1, budget=1.0)
+    orchestrator = LLMOrchestrator(
+        [PRIMARY, BACKUP], SequentialStrategy(), factory=_StubFactory(providers), hedging=policy,
+    )
+    orchestrator._hedge_executor = ThreadPoolExecutor(max_workers=1)
+    # 唯一的执行线程先被其他任务占用，主请求排队的时间长于对冲截止时间
+    orchestrator._hedge_executor.submit(time.sleep, 0.2)
+
+    result = orchestrator.chat([{"role": "user", "content": "你好"}])
+    orchestrator.close()
+
+    assert result["content"] == "主请求"
+    assert policy.hedges == 0
+    assert providers[BACKUP[0]].calls == 0
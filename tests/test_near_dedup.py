@@ -0,0 +1,95 @@
+# llm_framework/tests/test_near_dedup.py
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from near_dedup import MinHasher, NearDuplicateIndex, group_near_duplicates, shingle_hashes, similarity
+from optimization_aicars import NearDuplicateRouter, _run_now, plan_near_duplicates
+
+BASE = "负责后端服务的设计与开发，熟悉 Python 与分布式系统，具备三年以上相关工作经验，良好的沟通能力与团队合作精神。"
+NEAR = "负责后端服务的设计与开发，熟悉Python与分布式系统，具备三年以上相关工作经验，良好的沟通能力与团队合作精神！！"
+OTHER = "负责门店的日常运营管理，制定销售计划并带领团队完成业绩目标，有零售行业店长经验者优先考虑。"
+
+
+def test_signatures_are_deterministic_across_instances():
+    assert MinHasher(seed=7).signature(BASE) == MinHasher(seed=7).signature(BASE)
+    assert MinHasher(seed=7).signature(BASE) != MinHasher(seed=8).signature(BASE)
+    assert MinHasher().signature("，。！") is None
+
+
+def test_similarity_estimates_jaccard():
+    hasher = MinHasher(num_perm=256)
+    a, b = set(shingle_hashes(BASE)), set(shingle_hashes(BASE[:40]))
+    jaccard = len(a & b) / len(a | b)
+    estimate = similarity(hasher.signature(BASE), hasher.signature(BASE[:40]))
+    assert abs(estimate - jaccard) < 0.15
+    # 只有空白与标点不同的文本归一化后完全相同
+    assert similarity(hasher.signature(BASE), hasher.signature(NEAR)) == 1.0
+
+
+def test_grouping_is_order_based_and_repeatable():
+    items = [(1, BASE), (2, OTHER), (3, NEAR), (4, BASE + "有云原生经验者优先"), (5, "")]
+    first = group_near_duplicates(items, threshold=0.8)
+    assert first == group_near_duplicates(items, threshold=0.8)
+    assert first[3] == 1
+    assert 2 not in first and 5 not in first
+    index = NearDuplicateIndex(threshold=0.8)
+    assert index.add("a", BASE) is None and index.add("b", NEAR) == "a"
+
+
+def _line(user, assistant):
+    return json.dumps({"messages": [{"role": "user", "content": user}, {"role": "assistant", "content": assistant}]},
+                      ensure_ascii=False)
+
+
+class _Reader:
+    def __init__(self, lines):
+        self.lines = lines
+
+    def iter_lines(self):
+        return enumerate(self.lines, start=1)
+
+
+class _CountingOrchestrator:
+    def __init__(self):
+        self.calls = 0
+
+    def chat(self, messages, **kwargs):
+        self.calls += 1
+        return {"status": "success", "model": "fake-model", "content": f"优化结果 {self.calls}"}
+
+
+def test_plan_and_router_reuse_representative_result():
+    lines = [_line("招聘后端工程师", BASE), _line("招聘后端工程师", NEAR), _line("招聘店长", OTHER)]
+    followers = plan_near_duplicates(_Reader(lines), threshold=0.8)
+    assert followers == {2: 1}
+
+    orchestrator = _CountingOrchestrator()
+    router = NearDuplicateRouter(orchestrator, followers)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [router.submit(executor.submit, n, line) for n, line in enumerate(lines, start=1)]
+        records = [future.result(timeout=5) for future in futures]
+
+    assert orchestrator.calls == 2
+    assert records[1]["duplicate_of"] == 1
+    assert records[1]["optimized_response"] == records[0]["optimized_response"]
+    assert records[1]["original_assistant_response"] == NEAR
+    assert router.reused == 1
+
+
+def test_router_falls_back_when_representative_fails():
+    class _Failing(_CountingOrchestrator):
+        def chat(self, messages, **kwargs):
+            self.calls += 1
+            if self.calls == 1:
+                return {"status": "error", "message": "全部失败"}
+            return super().chat(messages, **kwargs)
+
+    lines = [_line("招聘后端工程师", BASE), _line("招聘后端工程师", NEAR)]
+    orchestrator = _Failing()
+    router = NearDuplicateRouter(orchestrator, {2: 1})
+    records = [router.submit(_run_now, n, line).result(timeout=5) for n, line in enumerate(lines, start=1)]
+
+    assert records[0]["processed_by_model"] == "None"
+    assert records[1]["processed_by_model"] == "fake-model"
+    assert "duplicate_of" not in records[1]
+    assert router.reused == 0
@@ -0,0 +1,47 @@
+# llm_framework/tests/test_output_validator.py
+from output_validator import JD_TEMPLATE_VALIDATOR
+
+JD = """### 智能驾驶算法工程师
+
+**岗位职责：**
+1. 负责感知与决策算法的研发与优化
+2. 参与自动驾驶系统的集成测试
+3. 跟踪行业前沿技术并推动落地
+
+**任职要求：**
+
+**1. 基本要求：**
+* 计算机、自动化等相关专业本科及以上学历
+* 3 年以上相关工作经验
+
+**2. 专业技能：**
+* 熟悉 C++ 与 Python
+
+**3. 软技能：**
+* 良好的沟通与团队协作能力
+"""
+
+
+def test_plain_output_is_accepted():
+    assert JD_TEMPLATE_VALIDATOR(JD) is None
+
+
+def test_fenced_output_is_accepted():
+    assert JD_TEMPLATE_VALIDATOR(f"```\n{JD}```") is None
+    assert JD_TEMPLATE_VALIDATOR(f"```{JD}```") is None
+
+
+def test_fenced_output_with_language_tag_is_accepted():
+    assert JD_TEMPLATE_VALIDATOR(f"```markdown\n{JD}```") is None
+    assert JD_TEMPLATE_VALIDATOR(f"```md\n{JD}\n```\n") is None
+
+
+def test_preamble_is_rejected():
+    assert "之前有多余的内容" in JD_TEMPLATE_VALIDATOR(f"好的，以下是优化后的职位描述：\n\n{JD}")
+    assert "之前有多余的内容" in JD_TEMPLATE_VALIDATOR(f"好的：\n```markdown\n{JD}```")
+
+
+def test_too_many_responsibilities_are_rejected():
+    extra = "".join(f"{i}. 负责第 {i} 项工作\n" for i in range(4, 8))
+    text = JD.replace("3. 跟踪行业前沿技术并推动落地\n", "3. 跟踪行业前沿技术并推动落地\n" + extra)
+    assert JD_TEMPLATE_VALIDATOR(text) == "小节 岗位职责 有 7 个条目，应为 3-5 个"
@@ -0,0 +1,58 @@
+# llm_framework/tests/test_quota_ledger.py
+from datetime import datetime, timezone
+
+from quota_ledger import QuotaLedger
+
+ITEM = ("gemini-2.5-flash", "key-1", {"quota_timezone": "UTC"})
+LIMITED = ("gemini-2.5-flash", "key-2", {"quota_timezone": "UTC", "rpd": 2})
+
+
+class _Clock:
+    def __init__(self):
+        self.now = datetime(2025, 3, 1, 12, tzinfo=timezone.utc).timestamp()
+
+    def __call__(self):
+        return self.now
+
+
+class _DailyQuotaError(Exception):
+    code = 429
+
+
+def test_exhausted_key_survives_restart_until_reset(tmp_path):
+    path = str(tmp_path / "quota.sqlite3")
+    clock = _Clock()
+    ledger = QuotaLedger(path, clock=clock)
+    assert ledger.record_failure(ITEM, _DailyQuotaError("GenerateRequestsPerDayPerProjectPerModel"))
+    assert not ledger.is_available(ITEM)
+    ledger.close()
+
+    restarted = QuotaLedger(path, clock=clock)
+    assert not restarted.is_available(ITEM)
+    assert restarted.retry_after(ITEM) == 12 * 3600
+
+    # 重置时区的午夜之后恢复
+    clock.now += 12 * 3600
+    assert restarted.is_available(ITEM)
+    restarted.close()
+
+
+def test_per_minute_rate_limit_is_not_daily_exhaustion(tmp_path):
+    ledger = QuotaLedger(str(tmp_path / "quota.sqlite3"), clock=_Clock())
+    assert not ledger.record_failure(ITEM, _DailyQuotaError("429 rate limit exceeded"))
+    assert ledger.is_available(ITEM)
+    ledger.close()
+
+
+def test_rpd_counts_are_shared_across_restarts(tmp_path):
+    path = str(tmp_path / "quota.sqlite3")
+    clock = _Clock()
+    ledger = QuotaLedger(path, clock=clock)
+    ledger.record_success(LIMITED)
+    ledger.close()
+
+    restarted = QuotaLedger(path, clock=clock)
+    assert restarted.is_available(LIMITED)
+    restarted.record_success(LIMITED)
+    assert not restarted.is_available(LIMITED)
+    restarted.close()
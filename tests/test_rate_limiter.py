@@ -0,0 +1,76 @@
+# llm_framework/tests/test_rate_limiter.py
+import pytest
+
+from rate_limiter import RateLimiter, TokenBucket
+
+ITEM = ("model", "key", {"rpm": 6, "tpm": 600})
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_refills_at_rate_up_to_capacity():
+    clock = _Clock()
+    bucket = TokenBucket(capacity=2, rate=0.5, clock=clock)
+    assert bucket.try_consume(1) and bucket.try_consume(1)
+    assert not bucket.try_consume(1)
+    assert bucket.wait_time(1) == pytest.approx(2.0)
+    clock.now = 2.0
+    assert bucket.try_consume(1)
+    clock.now = 100.0
+    assert bucket.available() == 2
+
+
+def test_charge_can_go_negative_and_delays_next_reservation():
+    clock = _Clock()
+    bucket = TokenBucket(capacity=10, rate=1, clock=clock)
+    bucket.charge(15)
+    assert bucket.available() == -5
+    assert bucket.wait_time(1) == pytest.approx(6.0)
+
+
+def test_limiter_reserves_requests_and_tokens_atomically():
+    clock = _Clock()
+    limiter = RateLimiter(clock=clock)
+    assert limiter.try_acquire(ITEM, tokens=500)
+    # TPM 不足时不预留，也不占用 RPM 额度
+    for _ in range(10):
+        assert not limiter.try_acquire(ITEM, tokens=200)
+    assert limiter.wait_time(ITEM, tokens=200) == pytest.approx(10.0)
+    # 退还的预留同时归还其占用的一个请求
+    limiter.refund(ITEM, tokens=500)
+    assert limiter.try_acquire(ITEM, tokens=600)
+    for _ in range(5):
+        assert limiter.try_acquire(ITEM)
+    assert not limiter.try_acquire(ITEM)
+
+
+def test_request_larger_than_bucket_counts_as_full_bucket():
+    limiter = RateLimiter(clock=_Clock())
+    assert limiter.try_acquire(ITEM, tokens=5000)
+    assert not limiter.try_acquire(ITEM, tokens=1)
+
+
+def test_rpm_exhaustion_blocks_until_refill():
+    clock = _Clock()
+    limiter = RateLimiter(clock=clock)
+    for _ in range(6):
+        assert limiter.try_acquire(ITEM)
+    assert not limiter.is_available(ITEM)
+    assert limiter.retry_after(ITEM) == pytest.approx(10.0)
+    clock.now = 10.0
+    assert limiter.is_available(ITEM)
+
+
+def test_penalize_drains_buckets_after_429():
+    clock = _Clock()
+    limiter = RateLimiter(clock=clock)
+    limiter.penalize(ITEM)
+    assert not limiter.is_available(ITEM)
+    assert limiter.wait_time(ITEM) == pytest.approx(10.0)
+    assert limiter.is_available(("model", "other-key", {}))
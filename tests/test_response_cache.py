@@ -0,0 +1,94 @@
+# llm_framework/tests/test_response_cache.py
+from llm_factory import LLMFactory
+from llm_orchestrator import LLMOrchestrator
+from response_cache import ResponseCache
+from selection_strategy import SequentialStrategy
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+ITEM = ("model", "key", {})
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+class _CountingProvider:
+    def __init__(self):
+        self.calls = 0
+
+    def chat(self, messages, **kwargs):
+        self.calls += 1
+        return f"回复 {self.calls}"
+
+
+class _StubFactory(LLMFactory):
+    def __init__(self, provider):
+        super().__init__()
+        self.provider = provider
+
+    def _build(self, model_name, api_key, **config):
+        return self.provider
+
+
+def test_key_is_stable_under_normalization(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    key = cache.make_key(MESSAGES, {"temperature": 0, "max_tokens": 10})
+    assert key == cache.make_key([{"role": "user", "content": "  你好\n", "name": "x"}],
+                                 {"max_tokens": 10, "temperature": 0, "system_prompt": None})
+    assert key == cache.make_key(MESSAGES, {"temperature": 0, "max_tokens": 10, "model_name": "other"})
+    assert key != cache.make_key(MESSAGES, {"temperature": 0.5, "max_tokens": 10})
+    keyed = ResponseCache(str(tmp_path / "keyed.sqlite3"), key_by_model=True)
+    assert keyed.make_key(MESSAGES, {"model_name": "a"}) != keyed.make_key(MESSAGES, {"model_name": "b"})
+
+
+def test_hit_miss_and_persistence_across_reopen(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResponseCache(path)
+    key = cache.make_key(MESSAGES, {})
+    assert cache.get(key) is None
+    cache.put(key, {"status": "success", "model": "m", "content": "答案"})
+    assert cache.get(key)["content"] == "答案"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    cache.close()
+
+    reopened = ResponseCache(path)
+    result = reopened.get(key)
+    assert result["cached"] is True and result["content"] == "答案"
+    assert reopened.stats()["entries"] == 1
+
+
+def test_ttl_expiry_and_lru_capacity(tmp_path):
+    clock = _Clock()
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), ttl=60, max_entries=2, clock=clock)
+    cache.put("a", {"content": "a"})
+    clock.now += 1
+    cache.put("b", {"content": "b"})
+    clock.now += 1
+    assert cache.get("a") is not None
+    # b 最久未访问，写入 c 时被淘汰
+    cache.put("c", {"content": "c"})
+    assert cache.get("b") is None
+    assert cache.stats()["entries"] == 2
+    clock.now += 61
+    assert cache.get("a") is None
+    assert cache.purge_expired() == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_orchestrator_serves_repeat_requests_from_cache(tmp_path):
+    provider = _CountingProvider()
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    orchestrator = LLMOrchestrator([ITEM], SequentialStrategy(), factory=_StubFactory(provider), cache=cache)
+
+    first = orchestrator.chat(MESSAGES, temperature=0)
+    second = orchestrator.chat(MESSAGES, temperature=0)
+    third = orchestrator.chat(MESSAGES, temperature=0.5)
+
+    assert first["content"] == second["content"] == "回复 1"
+    assert second.get("cached") is True and not first.get("cached")
+    assert third["content"] == "回复 2"
+    assert provider.calls == 2
@@ -0,0 +1,70 @@
+# llm_framework/tests/test_selection_strategy.py
+from model_pool import ModelPool
+from selection_strategy import ItemGate, LatencyAwareStrategy, RandomStrategy, SequentialStrategy
+
+POOL = [
+    ("flash", "key-1", {"priority": 3}),
+    ("gemma", "key-1", {"priority": 1}),
+    ("lite", "key-1", {"priority": 2}),
+    ("gemma", "key-2", {"priority": 1}),
+]
+
+
+class _Deny(ItemGate):
+    def __init__(self, denied, retry_after=None):
+        self.denied = denied
+        self.seconds = retry_after
+
+    def is_available(self, item):
+        return (item[0], item[1]) not in self.denied
+
+    def retry_after(self, item):
+        return self.seconds
+
+
+def test_sequential_walks_priority_buckets_in_pool_order():
+    pool = ModelPool(POOL)
+    strategy = SequentialStrategy()
+    failed = pool.item_set()
+    order = []
+    while (item := strategy.select(pool, failed)) is not None:
+        order.append((item[0], item[1]))
+        failed.add((item[0], item[1]))
+    assert order == [("gemma", "key-1"), ("gemma", "key-2"), ("lite", "key-1"), ("flash", "key-1")]
+
+
+def test_item_set_mask_tracks_failed_items():
+    pool = ModelPool(POOL)
+    failed = pool.item_set([("gemma", "key-2")])
+    assert pool.mask_of(failed) == 1 << 3
+    failed.add(("flash", "key-1"))
+    assert pool.mask_of(failed) == 1 << 3 | 1
+    failed.discard(("gemma", "key-2"))
+    assert pool.mask_of(failed) == 1
+    # 普通集合与不在池中的标识同样可用
+    assert pool.mask_of({("gemma", "key-2"), ("unknown", "key")}) == 1 << 3
+
+
+def test_strategies_never_return_failed_or_gated_items():
+    pool = ModelPool(POOL)
+    failed = pool.item_set([("gemma", "key-1"), ("lite", "key-1")])
+    for strategy in (SequentialStrategy(), RandomStrategy(), LatencyAwareStrategy()):
+        strategy.add_gate(_Deny({("gemma", "key-2")}))
+        for _ in range(20):
+            assert strategy.select(pool, failed)[:2] == ("flash", "key-1")
+
+
+def test_gate_with_retry_after_blocks_item_in_pool():
+    pool = ModelPool(POOL)
+    strategy = SequentialStrategy()
+    strategy.add_gate(_Deny({("gemma", "key-1")}, retry_after=60))
+    assert strategy.select(pool, set())[:2] == ("gemma", "key-2")
+    assert ("gemma", "key-1") in pool.blocked()
+    assert not pool.available_mask() >> 1 & 1
+
+
+def test_all_failed_returns_none():
+    pool = ModelPool(POOL)
+    failed = pool.item_set((item[0], item[1]) for item in POOL)
+    for strategy in (SequentialStrategy(), RandomStrategy(), LatencyAwareStrategy()):
+        assert strategy.select(pool, failed) is None
@@ -0,0 +1,120 @@
+# llm_framework/tests/test_single_flight.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight, request_key
+
+
+def test_request_key_is_stable_and_parameter_sensitive():
+    messages = [{"role": "user", "content": "你好"}]
+    assert request_key(messages, {"temperature": 0, "max_tokens": 10}) == \
+        request_key(messages, {"max_tokens": 10, "temperature": 0})
+    assert request_key(messages, {"temperature": 0}) != request_key(messages, {"temperature": 0.7})
+
+
+def test_only_deterministic_requests_are_coalesced_by_default():
+    assert SingleFlight().applies({"temperature": 0})
+    assert not SingleFlight().applies({"temperature": 0.7})
+    assert not SingleFlight().applies({})
+    assert SingleFlight(sampled=True).applies({"temperature": 0.7})
+
+
+def test_concurrent_identical_calls_run_once():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return "结果"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", fn))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while flight.leaders + flight.followers < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(leader for _, leader in results) == [False, False, False, True]
+    assert all(result == "结果" for result, _ in results)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_leader_error_is_raised_to_followers():
+    flight = SingleFlight()
+    entered = threading.Event()
+    release = threading.Event()
+
+    def fn():
+        entered.set()
+        release.wait(5)
+        raise RuntimeError("上游失败")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("k", fn)
+        except RuntimeError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    entered.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    while flight.followers < 1:
+        time.sleep(0.001)
+    release.set()
+    leader.join()
+    follower.join()
+    assert len(errors) == 2
+
+
+def test_stream_subscribers_each_get_full_copy_after_leader_leaves():
+    flight = SingleFlight()
+    produced = []
+
+    def source():
+        for chunk in ("a", "b", "c"):
+            produced.append(chunk)
+            yield chunk
+
+    leader = flight.stream("k", source)
+    assert next(leader) == "a"
+    follower = flight.stream("k", source)
+    assert next(follower) == "a"
+    leader.close()
+    assert list(follower) == ["b", "c"]
+    assert produced == ["a", "b", "c"]
+
+
+def test_async_follower_takes_over_when_leader_is_cancelled():
+    async def main():
+        flight = SingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "结果"
+
+        leader = asyncio.ensure_future(flight.ado("k", fn))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.ado("k", fn))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert await follower == ("结果", True)
+        assert len(calls) == 2
+
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+# llm_framework/tests/test_streaming.py
+import time
+
+from llm_factory import LLMFactory
+from llm_orchestrator import LLMOrchestrator
+from selection_strategy import SequentialStrategy
+from streaming import StreamRestart
+
+FIRST = ("first-model", "key-1", {"priority": 1})
+SECOND = ("second-model", "key-2", {"priority": 2})
+MESSAGES = [{"role": "user", "content": "写一首诗"}]
+
+
+class _StreamProvider:
+    """按脚本产出文本块；fail_after 不为 None 时在产出这么多块后抛出异常。"""
+    def __init__(self, chunks, fail_after=None, delay=0.0):
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.delay = delay
+        self.calls = []
+
+    def chat_stream(self, messages, **kwargs):
+        self.calls.append(messages)
+        for index, chunk in enumerate(self.chunks):
+            if index == self.fail_after:
+                raise ConnectionError("连接中断")
+            time.sleep(self.delay)
+            yield chunk
+
+
+class _StubFactory(LLMFactory):
+    def __init__(self, providers):
+        super().__init__()
+        self.providers = providers
+
+    def _build(self, model_name, api_key, **config):
+        return self.providers[model_name]
+
+
+def _orchestrator(providers, **kwargs):
+    return LLMOrchestrator([FIRST, SECOND], SequentialStrategy(), factory=_StubFactory(providers), **kwargs)
+
+
+def test_continue_mode_resumes_without_duplicating_output():
+    providers = {
+        FIRST[0]: _StreamProvider(["床前", "明月", "光"], fail_after=2),
+        SECOND[0]: _StreamProvider(["光，", "疑是地上霜"]),
+    }
+    output = list(_orchestrator(providers).chat_stream(MESSAGES))
+
+    assert output == ["床前", "明月", "光，", "疑是地上霜"]
+    # 续写请求把已输出的部分作为 assistant 前缀
+    assert providers[SECOND[0]].calls[0][-1] == {"role": "assistant", "content": "床前明月"}
+
+
+def test_restart_mode_signals_before_regenerating():
+    providers = {
+        FIRST[0]: _StreamProvider(["床前", "明月"], fail_after=1),
+        SECOND[0]: _StreamProvider(["床前明月光"]),
+    }
+    output = list(_orchestrator(providers, stream_failover="restart").chat_stream(MESSAGES))
+
+    assert output[0] == "床前"
+    assert isinstance(output[1], StreamRestart)
+    assert output[1].discarded_chars == 2
+    assert output[2:] == ["床前明月光"]
+    assert providers[SECOND[0]].calls[0] == MESSAGES
+
+
+def test_first_token_timeout_fails_over():
+    providers = {
+        FIRST[0]: _StreamProvider(["太慢"], delay=1.0),
+        SECOND[0]: _StreamProvider(["及时"]),
+    }
+    started = time.monotonic()
+    output = list(_orchestrator(providers, first_token_timeout=0.05).chat_stream(MESSAGES))
+
+    assert output == ["及时"]
+    assert time.monotonic() - started < 0.9
@@ -0,0 +1,81 @@
+# llm_framework/tests/test_work_queue.py
+import json
+
+import pytest
+
+from work_queue import WorkQueue
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return _Clock()
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite3"), max_attempts=2, retry_delay=10, clock=clock)
+    queue.populate([1, 2, 3], source="data.jsonl")
+    yield queue
+    queue.close()
+
+
+def test_workers_lease_disjoint_tasks(queue):
+    assert queue.lease("a", limit=2) == [(1, 1), (2, 1)]
+    assert queue.lease("b", limit=2) == [(3, 1)]
+    assert queue.lease("c") == []
+
+
+def test_expired_lease_is_taken_over_and_stale_worker_cannot_complete(queue, clock):
+    queue.lease("a", limit=1, lease_seconds=60)
+    clock.now += 61
+    assert queue.lease("b", limit=1) == [(1, 2)]
+    assert not queue.complete("a", 1, {"line_number": 1, "by": "a"})
+    assert queue.complete("b", 1, {"line_number": 1, "by": "b"})
+    assert not queue.complete("b", 1, {"line_number": 1, "by": "b again"})
+    assert queue.stats()["done"] == 1
+
+
+def test_heartbeat_keeps_lease(queue, clock):
+    queue.lease("a", limit=1, lease_seconds=60)
+    clock.now += 50
+    assert queue.heartbeat("a", [1], lease_seconds=60) == 1
+    clock.now += 50
+    assert queue.lease("b", limit=1) == [(2, 1)]
+    assert queue.heartbeat("b", [1]) == 0
+
+
+def test_failed_task_retries_after_delay_then_gives_up(queue, clock):
+    queue.lease("a", limit=1)
+    assert queue.fail("a", 1, "boom")
+    assert queue.lease("a", limit=1) == [(2, 1)]
+    clock.now += 10
+    assert queue.lease("a", limit=1) == [(1, 2)]
+    assert not queue.fail("a", 1, "boom again")
+    assert queue.stats()["failed"] == 1
+
+
+def test_release_does_not_count_as_attempt(queue):
+    queue.lease("a", limit=3)
+    assert queue.release("a") == 3
+    assert queue.lease("b", limit=1) == [(1, 1)]
+
+
+def test_export_in_line_order_and_source_binding(queue, tmp_path):
+    queue.lease("a", limit=3)
+    queue.complete("a", 3, {"line_number": 3})
+    queue.complete("a", 1, {"line_number": 1})
+    queue.complete("a", 2, None)
+    output = tmp_path / "out.jsonl"
+    assert queue.export(str(output)) == 2
+    assert [json.loads(line)["line_number"] for line in output.read_text().splitlines()] == [1, 3]
+    assert queue.unfinished() == 0
+    with pytest.raises(ValueError):
+        queue.populate([4], source="other.jsonl")
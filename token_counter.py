@@ -0,0 +1,119 @@
+# llm_framework/token_counter.py
+import bisect
+import re
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+from model_pool import PoolItem, ItemIdentifier
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+# 常用模型的 (上下文窗口, 最大输出 token 数)，按模型名前缀匹配，取最长的匹配。
+# 池元数据中的 context_window / max_output_tokens 优先于此表。
+MODEL_LIMITS: Dict[str, Tuple[int, int]] = {
+    "gemma-3": (131_072, 8_192),
+    "gemini-1.5": (1_048_576, 8_192),
+    "gemini-2.0-flash": (1_048_576, 8_192),
+    "gemini-2.5": (1_048_576, 65_536),
+    "glm-4.5": (131_072, 98_304),
+    "gpt-4o": (128_000, 16_384),
+}
+
+
+def estimate_text_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数：中日韩字符约 1 字符 1 token，其余约 4 字符 1 token。
+    用于限流预留与上下文窗口检查，宁可略微高估。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def estimate_tokens(messages: List[Dict[str, str]], system_prompt: Optional[str] = None) -> int:
+    """估算一次请求的输入 token 数 (消息内容 + 系统提示词 + 每条消息的少量格式开销)。"""
+    total = estimate_text_tokens(system_prompt or "")
+    for msg in messages:
+        total += estimate_text_tokens(msg.get("content", "")) + 4
+    return total
+
+
+def model_limits(item: PoolItem) -> Tuple[Optional[int], Optional[int]]:
+    """
+    返回该项的 (上下文窗口, 最大输出 token 数)，未知的维度为 None。
+    """
+    model_name, _, metadata = item
+    metadata = metadata or {}
+    context_window = metadata.get("context_window")
+    max_output = metadata.get("max_output_tokens")
+    if context_window is None or max_output is None:
+        prefix = max((p for p in MODEL_LIMITS if model_name.lower().startswith(p)), key=len, default=None)
+        if prefix is not None:
+            default_window, default_output = MODEL_LIMITS[prefix]
+            context_window = context_window if context_window is not None else default_window
+            max_output = max_output if max_output is not None else default_output
+    return context_window, max_output
+
+
+class ContextOverflowError(ValueError):
+    """请求的估算长度超过了池中所有可用模型的上下文窗口。"""
+    def __init__(self, request_tokens: int, largest_window: Optional[int]):
+        super().__init__(f"请求约 {request_tokens} tokens，超过了所有可用模型的上下文窗口 (最大 {largest_window})")
+        self.request_tokens = request_tokens
+        self.largest_window = largest_window
+
+
+class ContextWindowIndex:
+    """
+    按上下文窗口把池中的项分组，用于派发前的长度检查。
+
+    - excluded(request_tokens): 放不下该请求的项的标识集合。窗口的取值种类很少，
+      结果按 "放不下的窗口分组数" 缓存，短请求 (所有项都放得下) 时返回同一个空集合，没有额外开销；
+    - fit_max_tokens(item, ...): 把 max_tokens 限制在该项的输出上限与剩余上下文之内。
+    未配置也无法从 MODEL_LIMITS 推断上下文窗口的项永远不会被排除。
+    """
+    def __init__(self, pool: Iterable[PoolItem], min_output_tokens: int = 256):
+        """
+        :param min_output_tokens: 扣除输入后至少还要留给输出的 token 数，不足时视为放不下。
+        """
+        self.min_output_tokens = min_output_tokens
+        self.limits: Dict[ItemIdentifier, Tuple[Optional[int], Optional[int]]] = {}
+        groups: Dict[int, List[ItemIdentifier]] = {}
+        for item in pool:
+            identifier = (item[0], item[1])
+            limits = model_limits(item)
+            self.limits[identifier] = limits
+            if limits[0] is not None:
+                groups.setdefault(limits[0], []).append(identifier)
+        self.windows: List[int] = sorted(groups)
+        self._groups = [groups[window] for window in self.windows]
+        self._excluded_cache: Dict[int, FrozenSet[ItemIdentifier]] = {0: frozenset()}
+        self.unbounded = any(limits[0] is None for limits in self.limits.values())
+
+    @property
+    def largest_window(self) -> Optional[int]:
+        return None if self.unbounded or not self.windows else self.windows[-1]
+
+    def excluded(self, request_tokens: int) -> FrozenSet[ItemIdentifier]:
+        # 上下文窗口小于 (输入 + 最小输出) 的分组都放不下
+        cut = bisect.bisect_right(self.windows, request_tokens + self.min_output_tokens - 1)
+        cached = self._excluded_cache.get(cut)
+        if cached is None:
+            cached = frozenset(identifier for group in self._groups[:cut] for identifier in group)
+            self._excluded_cache[cut] = cached
+        return cached
+
+    def fits_nowhere(self, request_tokens: int) -> bool:
+        largest = self.largest_window
+        return largest is not None and request_tokens + self.min_output_tokens > largest
+
+    def fit_max_tokens(self, item: PoolItem, request_tokens: int, max_tokens: Optional[int]) -> Optional[int]:
+        """
+        :return: 该项可用的 max_tokens，不超过调用方给定的值、该项的输出上限与剩余的上下文。
+                 调用方未给定 max_tokens 时，只有剩余上下文小于输出上限才返回剩余上下文，否则仍返回 None
+                 (沿用提供者的默认值)。
+        """
+        context_window, max_output = self.limits.get((item[0], item[1])) or model_limits(item)
+        room = None if context_window is None else max(self.min_output_tokens, context_window - request_tokens)
+        if max_tokens is None:
+            return room if room is not None and (max_output is None or room < max_output) else None
+        return min(bound for bound in (max_tokens, max_output, room) if bound is not None)
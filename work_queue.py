@@ -0,0 +1,261 @@
+# llm_framework/work_queue.py
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def default_worker_id() -> str:
+    """主机名 + 进程号 + 随机后缀，同一台机器上的多个进程也不会重复。"""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class WorkQueue:
+    """
+    基于 SQLite 的租约式工作队列，供多个进程 (或共享文件系统上的多台主机) 分摊同一个数据集。
+
+    每条记录 (以 line_number 标识) 是一个任务：
+    - lease(): 原子地领取一批待处理或租约已过期的任务，并记录租约持有者与到期时间；
+    - heartbeat(): 处理期间定期延长租约，持有者崩溃后租约到期，任务自动被其他进程重新领取；
+    - complete(): 仅当调用者仍持有租约时才写入结果，结果表以 line_number 为主键，保证每条记录恰好一份结果；
+    - fail(): 失败的任务在 retry_delay 秒后重新可领取，超过 max_attempts 次后标记为 failed。
+    所有结果都保存在队列数据库中，export() 按 line_number 顺序原子地导出为 JSONL。
+    """
+    def __init__(self, path: str, max_attempts: int = 3, retry_delay: float = 30.0, wal: bool = True,
+                 busy_timeout: float = 60.0, clock=time.time):
+        """
+        :param path: SQLite 数据库路径，多个进程指向同一个文件即可协作。
+        :param max_attempts: 每条任务最多被领取的次数 (含租约过期后的重新领取)。
+        :param retry_delay: 任务失败后再次可被领取前的等待秒数。
+        :param wal: 是否使用 WAL 日志模式。本机多进程时更快；数据库位于 NFS 等网络文件系统上时必须设为 False。
+        :param busy_timeout: 其他进程持有写锁时的最长等待秒数。
+        :param clock: 返回 Unix 时间戳的时钟。租约在进程间比较，因此使用墙上时钟。
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._clock = clock
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # isolation_level=None: 由下面的 _transaction 显式控制事务边界
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute(f"PRAGMA journal_mode={'WAL' if wal else 'DELETE'}")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                " line_number INTEGER PRIMARY KEY, status TEXT NOT NULL DEFAULT 'pending',"
+                " attempts INTEGER NOT NULL DEFAULT 0, lease_owner TEXT, lease_expires REAL NOT NULL DEFAULT 0,"
+                " available_at REAL NOT NULL DEFAULT 0, last_error TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status, line_number)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " line_number INTEGER PRIMARY KEY, record TEXT, worker TEXT NOT NULL, finished_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    @contextmanager
+    def _transaction(self):
+        """BEGIN IMMEDIATE 立即取得写锁，领取任务时不会与其他进程发生读后写的竞争。"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def populate(self, line_numbers: Iterable[int], source: Optional[str] = None):
+        """
+        登记任务，已存在的 line_number 会被忽略，因此每个进程启动时都可以调用。
+        :param source: 数据集标识 (如输入文件路径)。队列已绑定到其他数据集时抛出 ValueError。
+        """
+        with self._transaction() as conn:
+            if source is not None:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+                if row is None:
+                    conn.execute("INSERT INTO meta (key, value) VALUES ('source', ?)", (source,))
+                elif row[0] != source:
+                    raise ValueError(f"工作队列 '{self.path}' 属于数据集 '{row[0]}'，不能用于 '{source}'")
+            conn.executemany("INSERT OR IGNORE INTO tasks (line_number) VALUES (?)",
+                             ((line_number,) for line_number in line_numbers))
+
+    def lease(self, worker: str, limit: int = 16, lease_seconds: float = 300.0) -> List[Tuple[int, int]]:
+        """
+        领取至多 limit 条任务：待处理且已到重试时间的任务，或租约已过期的任务 (持有者可能已崩溃)。
+        :return: [(line_number, 这是第几次领取)]。
+        """
+        now = self._clock()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT line_number, attempts FROM tasks"
+                " WHERE (status = 'pending' AND available_at <= ?) OR (status = 'leased' AND lease_expires < ?)"
+                " ORDER BY line_number LIMIT ?",
+                (now, now, limit),
+            ).fetchall()
+            leased = []
+            for line_number, attempts in rows:
+                if attempts >= self.max_attempts:
+                    # 租约反复过期 (例如该记录每次都导致进程崩溃)，不再重试
+                    conn.execute("UPDATE tasks SET status = 'failed', lease_owner = NULL,"
+                                 " last_error = 'lease expired too many times' WHERE line_number = ?",
+                                 (line_number,))
+                    continue
+                conn.execute(
+                    "UPDATE tasks SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1"
+                    " WHERE line_number = ?",
+                    (worker, now + lease_seconds, line_number),
+                )
+                leased.append((line_number, attempts + 1))
+        return leased
+
+    def heartbeat(self, worker: str, line_numbers: Iterable[int], lease_seconds: float = 300.0) -> int:
+        """延长 worker 仍持有的租约，返回成功延长的条数。"""
+        expires = self._clock() + lease_seconds
+        with self._transaction() as conn:
+            return sum(
+                conn.execute(
+                    "UPDATE tasks SET lease_expires = ?"
+                    " WHERE line_number = ? AND lease_owner = ? AND status = 'leased'",
+                    (expires, line_number, worker),
+                ).rowcount
+                for line_number in line_numbers
+            )
+
+    def complete(self, worker: str, line_number: int, record: Optional[Dict[str, Any]]) -> bool:
+        """
+        提交一条任务的结果。record 为 None 表示该记录无需输出 (如数据格式无效)。
+        :return: 是否被接受。租约已被其他进程接管时返回 False，结果被丢弃，保证每条记录只有一份结果。
+        """
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE tasks SET status = 'done', lease_owner = NULL, last_error = NULL"
+                " WHERE line_number = ? AND lease_owner = ? AND status = 'leased'",
+                (line_number, worker),
+            ).rowcount
+            if not updated:
+                return False
+            conn.execute(
+                "INSERT OR IGNORE INTO results (line_number, record, worker, finished_at) VALUES (?, ?, ?, ?)",
+                (line_number, None if record is None else json.dumps(record, ensure_ascii=False), worker,
+                 self._clock()),
+            )
+        return True
+
+    def fail(self, worker: str, line_number: int, error: str) -> bool:
+        """
+        归还一条失败的任务。还有重试次数时 retry_delay 秒后可被重新领取，否则标记为 failed。
+        :return: 任务是否还会被重试。
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT attempts FROM tasks WHERE line_number = ? AND lease_owner = ? AND status = 'leased'",
+                (line_number, worker),
+            ).fetchone()
+            if row is None:
+                return False
+            retry = row[0] < self.max_attempts
+            conn.execute(
+                "UPDATE tasks SET status = ?, lease_owner = NULL, available_at = ?, last_error = ?"
+                " WHERE line_number = ?",
+                ("pending" if retry else "failed", self._clock() + self.retry_delay, error, line_number),
+            )
+        return retry
+
+    def release(self, worker: str) -> int:
+        """进程正常退出前归还仍持有的租约 (不计为一次失败)，返回归还的条数。"""
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE tasks SET status = 'pending', lease_owner = NULL, attempts = MAX(attempts - 1, 0)"
+                " WHERE lease_owner = ? AND status = 'leased'",
+                (worker,),
+            ).rowcount
+
+    def unfinished(self) -> int:
+        """尚未完成也未最终失败的任务数。"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE status IN ('pending', 'leased')"
+            ).fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in ("pending", "leased", "done", "failed")}
+
+    def export(self, output_path: str) -> int:
+        """
+        按 line_number 顺序把所有结果导出为 JSONL (写临时文件后 os.replace)，返回导出的记录数。
+        任何进程都可以在任意时刻调用，导出的是调用时已提交的结果。
+        """
+        temp_path = output_path + ".tmp"
+        count = 0
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT record FROM results WHERE record IS NOT NULL ORDER BY line_number"
+            )
+            with open(temp_path, "w", encoding="utf-8") as f:
+                for (record,) in rows:
+                    f.write(record + "\n")
+                    count += 1
+        os.replace(temp_path, output_path)
+        return count
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class LeaseHeartbeat:
+    """
+    后台线程，定期为正在处理的任务延长租约。
+    用法: 领取任务后 add()，处理完成 (complete/fail) 后 discard()。
+    """
+    def __init__(self, queue: WorkQueue, worker: str, lease_seconds: float):
+        self.queue = queue
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+
+    def add(self, line_number: int):
+        with self._lock:
+            self._in_flight.add(line_number)
+
+    def discard(self, line_number: int):
+        with self._lock:
+            self._in_flight.discard(line_number)
+
+    def _run(self):
+        # 在租约过期前留出充足的余量：每 1/3 个租约周期续租一次
+        while not self._stop.wait(self.lease_seconds / 3):
+            with self._lock:
+                line_numbers = list(self._in_flight)
+            if not line_numbers:
+                continue
+            try:
+                self.queue.heartbeat(self.worker, line_numbers, self.lease_seconds)
+            except sqlite3.Error as e:
+                # 一次续租失败不致命，租约还有 2/3 的余量，下一轮再试
+                logger.warning("续租失败: %s", e)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()